@@ -1,8 +1,8 @@
 import streamlit as st
-import time
-import threading
-import queue
-from src.agents.harry_potter_crew import HarryPotterRAGCrew
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from src.config import CHARACTERS, PERSONA_PROFILES
+from src.utils.retriever import warm_up
+from src.utils.job_manager import JobManager, JobQueueFull
 import traceback
 
 # Page configuration
@@ -39,68 +39,118 @@ def load_css():
     </style>
     """, unsafe_allow_html=True)
 
-# Characters
-characters = [
-    "Harry Potter",
-    "Hermione Granger",
-    "Ron Weasley",
-    "Albus Dumbledore",
-    "Severus Snape",
-    "Draco Malfoy",
-    "Luna Lovegood",
-    "Rubeus Hagrid",
-    "Minerva McGonagall",
-    "Sirius Black"
-]
+# Characters (and the names the books use for them) live in src/config.py
+characters = list(CHARACTERS)
+
+# Load the embedding model + FAISS index once per process, shared by all sessions
+@st.cache_resource(show_spinner="Opening the Hogwarts library...")
+def load_retriever():
+    retriever = warm_up()
+    if PERSONA_PROFILES:
+        # mined once per index (python -m src.utils.persona_profiles), reused by every crew
+        from src.utils.persona_profiles import get_persona_profiles
+        get_persona_profiles()
+    return retriever
+
+load_retriever()
+
+# One bounded worker pool for every session's answers
+@st.cache_resource
+def get_job_manager():
+    return JobManager()
+
+# How long the pending-answer fragment blocks waiting for the job to change.
+# Short enough that clicks elsewhere on the page are picked up promptly.
+JOB_WAIT_SECONDS = 1.0
 
 # Initialize session state
 def initialize_session_state():
     if 'initialized' not in st.session_state:
         st.session_state.messages = []
-        st.session_state.answer_stream = ""
         st.session_state.is_answering = False
-        st.session_state.process_status = ""
+        st.session_state.current_job_id = None
         st.session_state.debug_info = []
-        st.session_state.crew_instance = HarryPotterRAGCrew()  # ✅ initialize here
         st.session_state.selected_character = "Albus Dumbledore"
         st.session_state.initialized = True
 
 initialize_session_state()  # ✅ run immediately after imports
 
-# Updated generate_response function
-def generate_response(question, character, result_queue):
-    try:
-        if 'debug_info' not in st.session_state:
-            st.session_state.debug_info = []
-        
-        st.session_state.debug_info.append(f"Starting response generation for '{question}' as '{character}'")
-        st.session_state.process_status = "Initializing crew..."
-
-        # 🛠️ FIX: create crew_instance directly, like your main.py
-        crew_instance = HarryPotterRAGCrew()
-        crew = crew_instance.crew()
-
-        st.session_state.process_status = "Setting up inputs..."
-        inputs = {
-            "question": question,
-            "character": character,
-        }
-
-        st.session_state.process_status = "Generating response..."
-        result = crew.kickoff(inputs=inputs)
+# Answer modes offered in the sidebar -> HarryPotterRAGCrew.answer modes
+answer_modes = {
+    "Auto (fast unless complex)": "auto",
+    "Fast (single call)": "fast",
+    "Full crew (three agents)": "crew",
+}
+
+# Background job body: runs on a JobManager worker and only touches the Job,
+# never st.session_state (which belongs to the session's script thread)
+def generate_response(job, question, character, mode="auto"):
+    job.set_status("Initializing crew...")
+    # crewai is imported on the first question, not while the page first renders;
+    # crew construction is cheap: the retriever is shared process-wide.
+    # One instance per job, never cached: Crew.kickoff writes the question into
+    # the crew's Task objects, so concurrent jobs must not share them
+    from src.agents.harry_potter_crew import HarryPotterRAGCrew
+    crew_instance = HarryPotterRAGCrew()
+
+    job.set_status("Generating response...")
+    # tokens land on the job as they arrive; the page wakes up on each change
+    for piece in crew_instance.answer_stream(question, character, mode=mode):
+        job.append(piece)
+    return job.text
+
+def assistant_bubble(character, body):
+    return f"""
+    <div class="chat-message assistant-message">
+        <div class="chat-content">
+            <div class="character-tag">{character}:</div>
+            <p>{body}</p>
+        </div>
+    </div>
+    """
+
+def in_fragment_rerun():
+    """True while only a fragment is rerunning (st.rerun(scope="fragment") is invalid otherwise)."""
+    ctx = get_script_run_ctx()
+    return bool(ctx and ctx.fragment_ids_this_run)
+
+# Renders the pending answer; reruns (only this fragment) when the job changes.
+# run_every starts the fragment-only reruns after a full-app run
+@st.fragment(run_every=JOB_WAIT_SECONDS)
+def pending_answer():
+    job = get_job_manager().get(st.session_state.current_job_id)
+    character = st.session_state.current_character
+    if job is None:
+        st.session_state.is_answering = False
+        st.rerun()
 
-        st.session_state.process_status = "Processing complete!"
-        result_queue.put(result)
-    
-    except Exception as e:
-        error_msg = f"Error: {str(e)}"
+    snap = job.snapshot()
+    if snap["status"] in ("done", "error"):
+        if snap["status"] == "error":
+            st.session_state.debug_info.append(f"ERROR: Error: {snap['error']}")
+            content = "I'm sorry, an error occurred while processing your question. Please try again."
+        else:
+            content = snap["result"]
+        st.session_state.messages.append({
+            "role": "assistant",
+            "content": content,
+            "character": character
+        })
+        st.session_state.is_answering = False
+        st.session_state.current_job_id = None
+        # full rerun: the answer moves into the message history
+        st.rerun()
 
-        if 'debug_info' not in st.session_state:
-            st.session_state.debug_info = []
+    # partial answer so far, or the status line until the first token arrives
+    body = f"{snap['text']} ▌" if snap["text"] else f"<em>{snap['message']}</em>"
+    st.markdown(assistant_bubble(character, body), unsafe_allow_html=True)
 
-        st.session_state.debug_info.append(f"ERROR: {error_msg}")
-        st.session_state.process_status = "Error occurred"
-        result_queue.put("I'm sorry, an error occurred while processing your question. Please try again.")
+    if not in_fragment_rerun():
+        # part of a full-app run: render and let run_every pick it up from here
+        return
+    # block (no CPU) until the job changes, instead of sleep-and-rerun polling
+    job.wait_for_change(snap["version"], timeout=JOB_WAIT_SECONDS)
+    st.rerun(scope="fragment")
 
 # Display messages
 def display_messages():
@@ -151,6 +201,13 @@ def main():
 
         st.session_state.selected_character = selected_character
 
+        st.markdown("### Answer Mode")
+        answer_mode_label = st.radio(
+            "How should the answer be produced?",
+            options=list(answer_modes),
+            key="answer_mode",
+        )
+
         st.markdown("---")
 
         if st.button("🧹 Clear Conversation"):
@@ -171,24 +228,7 @@ def main():
         display_messages()
 
         if st.session_state.is_answering:
-            selected_character = st.session_state.current_character
-            with st.container():
-                st.markdown(f"""
-                <div class="chat-message assistant-message">
-                    <div class="chat-content">
-                        <div class="character-tag">{selected_character}:</div>
-                        <p><em>{st.session_state.process_status}</em></p>
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
-
-                progress_bar = st.progress(0)
-                if hasattr(st.session_state, 'progress_value'):
-                    if st.session_state.progress_value < 100:
-                        st.session_state.progress_value += 1
-                else:
-                    st.session_state.progress_value = 0
-                progress_bar.progress(st.session_state.progress_value)
+            pending_answer()
 
         st.markdown('</div>', unsafe_allow_html=True)
 
@@ -203,47 +243,21 @@ def main():
                     "content": question
                 })
 
-                st.session_state.is_answering = True
-                st.session_state.current_character = st.session_state.selected_character
-                st.session_state.process_status = "Thinking..."
-                st.session_state.progress_value = 0
-
-                if 'result_queue' not in st.session_state:
-                    st.session_state.result_queue = queue.Queue()
-
-                while not st.session_state.result_queue.empty():
-                    try:
-                        st.session_state.result_queue.get_nowait()
-                    except:
-                        pass
-
-                thread = threading.Thread(
-                    target=generate_response,
-                    args=(question, st.session_state.selected_character, st.session_state.result_queue)
-                )
-                thread.daemon = True
-                thread.start()
-
-                st.rerun()
-
-    if st.session_state.is_answering and hasattr(st.session_state, 'result_queue'):
-        try:
-            try:
-                result = st.session_state.result_queue.get_nowait()
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": result,
-                    "character": st.session_state.current_character
-                })
-                st.session_state.is_answering = False
-                st.session_state.progress_value = 100
-                st.rerun()
-            except queue.Empty:
-                time.sleep(0.1)
-                st.rerun()
-        except Exception as e:
-            st.error(f"Error processing response. Please try again.")
-            st.session_state.is_answering = False
+                try:
+                    job = get_job_manager().submit(
+                        generate_response,
+                        question,
+                        st.session_state.selected_character,
+                        answer_modes[st.session_state.answer_mode],
+                    )
+                except JobQueueFull:
+                    st.session_state.messages.pop()
+                    st.warning("The owls are all busy right now. Please ask again in a moment.")
+                else:
+                    st.session_state.is_answering = True
+                    st.session_state.current_character = st.session_state.selected_character
+                    st.session_state.current_job_id = job.id
+                    st.rerun()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,156 @@
+"""
+Outbound client benchmark against a local mock embedding endpoint.
+
+    python -m benchmarks.http_client_benchmark --out benchmarks/http_client.json
+
+Starts a mock server on 127.0.0.1 that answers like the Gemini embedding
+endpoint, but rejects a share of requests with 429 + Retry-After and
+answers another share slowly (the latency tail). The shared HTTPClient is
+then run against it with and without hedging. The report has latency
+percentiles, the requests, retries and hedges each run needed, and the
+TCP connections the server saw (keep-alive pooling keeps that near the
+pool size). No network access and no API key are needed.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from benchmarks.retrieval_benchmark import git_revision, percentiles  # noqa: E402
+
+DIM = 8
+
+
+class MockEmbeddingHandler(BaseHTTPRequestHandler):
+    """POST {"text"} -> {"embedding"}, {"texts"} -> {"embeddings"}, with injected 429s and slow answers."""
+
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True  # headers and body go out in separate writes
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        with server.lock:
+            server.requests += 1
+            roll = server.rng.random()
+        if roll < server.fail_rate:
+            self._send(429, {"error": "rate limited"}, {"Retry-After": "0"})
+            return
+        time.sleep((server.slow_ms if roll < server.fail_rate + server.slow_rate else server.latency_ms) / 1000)
+        if "texts" in body:
+            self._send(200, {"embeddings": [self._vector(t) for t in body["texts"]]})
+        else:
+            self._send(200, {"embedding": self._vector(body.get("text", ""))})
+
+    @staticmethod
+    def _vector(text: str):
+        rng = random.Random(text)
+        return [rng.random() for _ in range(DIM)]
+
+    def _send(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def start_mock_server(fail_rate: float = 0.1, slow_rate: float = 0.05, latency_ms: float = 5,
+                      slow_ms: float = 500, seed: int = 0) -> ThreadingHTTPServer:
+    """Mock endpoint on a free local port, served from a daemon thread; .url is its address."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockEmbeddingHandler)
+    server.daemon_threads = True
+    server.fail_rate, server.slow_rate = fail_rate, slow_rate
+    server.latency_ms, server.slow_ms = latency_ms, slow_ms
+    server.rng = random.Random(seed)
+    server.lock = threading.Lock()
+    server.connections = server.requests = 0
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/embed"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_client(args, hedge_after_ms) -> Dict[str, Any]:
+    from src.utils.http_client import HTTPClient, RetryPolicy
+    from src.utils.llm_service import GeminiEmbeddingPlugin
+
+    server = start_mock_server(args.fail_rate, args.slow_rate, args.latency_ms, args.slow_ms)
+    client = HTTPClient(pool_size=args.concurrency, hedge_after_ms=hedge_after_ms,
+                        policy=RetryPolicy(max_retries=6, base_s=0.01, max_s=0.2))
+    plugin = GeminiEmbeddingPlugin("mock", "mock", "test-key", server.url, client=client)
+
+    def one(i):
+        start = time.perf_counter()
+        vec = plugin.embed(f"text {i}")
+        return time.perf_counter() - start, vec is not None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(one, range(args.requests)))
+    wall = time.perf_counter() - start
+    batch_start = time.perf_counter()
+    plugin.embed_batch([f"text {i}" for i in range(args.requests)])
+    batch_s = time.perf_counter() - batch_start
+
+    report = {
+        "hedge_after_ms": hedge_after_ms,
+        "latency": percentiles([s * 1000 for s, _ in results]),
+        "failed": sum(1 for _, ok in results if not ok),
+        "wall_s": round(wall, 3),
+        "batched_wall_s": round(batch_s, 3),
+        "client": dict(client.stats),
+        "server_requests": server.requests,
+        "server_connections": server.connections,
+    }
+    client.close()
+    server.shutdown()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pooled/retrying/hedged HTTP client")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--fail-rate", type=float, default=0.1, help="share of requests answered 429")
+    parser.add_argument("--slow-rate", type=float, default=0.05, help="share of slow answers")
+    parser.add_argument("--latency-ms", type=float, default=5)
+    parser.add_argument("--slow-ms", type=float, default=500)
+    parser.add_argument("--hedge-after-ms", type=float, default=100)
+    parser.add_argument("--out", help="write the JSON report here (stable key order for diffs)")
+    args = parser.parse_args()
+
+    report = {
+        "revision": git_revision(),
+        "no_hedging": run_client(args, None),
+        "hedging": run_client(args, args.hedge_after_ms),
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
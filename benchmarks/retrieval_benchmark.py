@@ -0,0 +1,280 @@
+"""
+Retrieval benchmark against data/harry_potter.pdf.
+
+    python -m benchmarks.retrieval_benchmark --out benchmarks/results.json
+
+Reports cold-start time, index build time, search latency percentiles, QPS at
+several concurrency levels, peak RSS and recall@k on the golden question set
+(--expansion adds recall@k with query alias expansion, for comparison).
+Build and search numbers come in two flavours: "uncached" with the persistent
+embedding cache switched off (every chunk / query goes through the model) and
+"cached" against a warm throwaway cache; the user's cache is never touched.
+No LLM is called and no API key is needed, so the suite runs offline once the
+embedding model is in the local HF cache.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden_questions.json")
+
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+
+def peak_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return float("nan")
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    import numpy as np
+    return {
+        f"p{p}_ms": round(float(np.percentile(samples, p)), 3) for p in (50, 95, 99)
+    } if samples else {}
+
+
+def load_golden(path: str = GOLDEN_PATH) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def measure_cold_start() -> Dict[str, Any]:
+    """Fresh interpreter: import the retriever and load the index, nothing cached in-process."""
+    code = (
+        "import time, json; t0 = time.perf_counter()\n"
+        "from src.utils.retriever import warm_up\n"
+        "t1 = time.perf_counter(); warm_up(); t2 = time.perf_counter()\n"
+        "from benchmarks.retrieval_benchmark import peak_rss_mb\n"
+        "print(json.dumps({'import_s': t1 - t0, 'load_s': t2 - t1, 'peak_rss_mb': peak_rss_mb()}))\n"
+    )
+    start = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=PROJECT_ROOT, env=os.environ.copy(),
+        capture_output=True, text=True, check=True,
+    )
+    wall = time.perf_counter() - start
+    stats = json.loads(out.stdout.strip().splitlines()[-1])
+    return {
+        "wall_s": round(wall, 3),
+        "import_s": round(stats["import_s"], 3),
+        "load_s": round(stats["load_s"], 3),
+        "peak_rss_mb": stats["peak_rss_mb"],
+    }
+
+
+@contextmanager
+def embedding_cache(cache):
+    """Run with the shared EmbeddingService's persistent cache swapped for `cache` (None: no cache)."""
+    from src.utils.retriever import get_embeddings
+
+    emb = get_embeddings()
+    saved, emb.cache = emb.cache, cache
+    try:
+        yield emb
+    finally:
+        emb.cache = saved
+
+
+def temp_embedding_cache(folder: str):
+    from src.utils.embedding_service import EmbeddingCache
+    return EmbeddingCache(os.path.join(folder, "embeddings.sqlite"))
+
+
+def build_once(pdf_path: str, cache) -> Dict[str, Any]:
+    """Build a fresh index in a temp folder with the given embedding cache."""
+    from src.utils.retriever import Retriever
+
+    folder = tempfile.mkdtemp(prefix="hp_bench_index_")
+    try:
+        with embedding_cache(cache) as emb:
+            encoded, cache_hits = emb.encoded, emb.cache_hits
+            retriever = Retriever(pdf_path, folder)
+            start = time.perf_counter()
+            retriever.load()
+            elapsed = time.perf_counter() - start
+            return {
+                "build_s": round(elapsed, 3),
+                "stages_s": {k: round(v, 3) for k, v in sorted(retriever._processor.timings.items())},
+                "chunks": len(retriever._vs) if hasattr(retriever._vs, "__len__") else None,
+                "embeddings_encoded": emb.encoded - encoded,
+                "embedding_cache_hits": emb.cache_hits - cache_hits,
+            }
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def measure_build(pdf_path: str, cache_folder: str) -> Dict[str, Any]:
+    """Index build with every chunk embedded, then again with all embeddings cached."""
+    cache = temp_embedding_cache(cache_folder)
+    return {
+        "uncached": build_once(pdf_path, None),
+        # the first build only fills the throwaway cache
+        "cached": (build_once(pdf_path, cache), build_once(pdf_path, cache))[1],
+    }
+
+
+def measure_search(retriever, golden, mode: str, repeats: int, k: int = 5) -> Dict[str, Any]:
+    latencies = []
+    for _ in range(repeats):
+        for item in golden:
+            # defeat the query-result cache so every call does real work
+            retriever.query_cache.invalidate()
+            t0 = time.perf_counter()
+            retriever.search(item["question"], k=k, mode=mode)
+            latencies.append((time.perf_counter() - t0) * 1000)
+    return dict(percentiles(latencies), samples=len(latencies))
+
+
+def measure_qps(retriever, golden, mode: str, levels: List[int], seconds: float) -> Dict[str, float]:
+    questions = [g["question"] for g in golden]
+    out = {}
+    for workers in levels:
+        deadline = time.perf_counter() + seconds
+
+        def worker(offset):
+            n = 0
+            while time.perf_counter() < deadline:
+                q = questions[(offset + n) % len(questions)]
+                # bypass the result cache: it would turn this into a dict-lookup benchmark
+                retriever.query_cache.invalidate()
+                retriever.search(q, k=5, mode=mode)
+                n += 1
+            return n
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            done = sum(pool.map(worker, range(workers)))
+        out[str(workers)] = round(done / (time.perf_counter() - start), 2)
+    return out
+
+
+def measure_recall(retriever, golden, mode: str, ks=(1, 5, 10), expand: bool = False) -> Dict[str, float]:
+    """
+    recall@k: share of golden questions with an expected passage in the top k.
+    With `expand` the questions' alias rewrites are searched too (as the tool
+    does with QUERY_EXPANSION) and the results fused.
+    """
+    from src.utils.query_expansion import expand_query
+
+    max_k = max(ks)
+    hits = {k: 0 for k in ks}
+    for item in golden:
+        retriever.query_cache.invalidate()
+        if expand:
+            docs = retriever.search_many(expand_query(item["question"]), k=max_k, mode=mode)
+        else:
+            docs = retriever.search(item["question"], k=max_k, mode=mode)
+        first = next(
+            (rank for rank, d in enumerate(docs, start=1)
+             if any(e.lower() in d.page_content.lower() for e in item["expected"])),
+            None,
+        )
+        for k in ks:
+            hits[k] += first is not None and first <= k
+    return {f"recall@{k}": round(hits[k] / len(golden), 3) for k in ks}
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def run(args) -> Dict[str, Any]:
+    cache_folder = tempfile.mkdtemp(prefix="hp_bench_cache_")
+    try:
+        return _run(args, cache_folder)
+    finally:
+        shutil.rmtree(cache_folder, ignore_errors=True)
+
+
+def _run(args, cache_folder: str) -> Dict[str, Any]:
+    from src import config
+    from src.utils.retriever import get_retriever
+
+    golden = load_golden(args.golden)
+    report: Dict[str, Any] = {
+        "revision": git_revision(),
+        "config": {
+            "INDEX_FORMAT": config.INDEX_FORMAT,
+            "INDEX_TYPE": config.INDEX_TYPE,
+            "EMBEDDING_MODEL": config.EMBEDDING_MODEL,
+            "EMBEDDING_BATCH_SIZE": config.EMBEDDING_BATCH_SIZE,
+        },
+        "golden_questions": len(golden),
+    }
+    if not args.skip_cold_start:
+        report["cold_start"] = measure_cold_start()
+    if not args.skip_build:
+        report["index_build"] = measure_build(args.pdf or config.PDF_PATH, cache_folder)
+
+    retriever = get_retriever(args.pdf).load()
+    warm_cache = temp_embedding_cache(cache_folder)
+    report["search"] = {}
+    for mode in args.modes:
+        report["search"][mode] = {"recall": measure_recall(retriever, golden, mode)}
+        # uncached: every query is embedded; cached: query vectors come from a warm cache
+        for label, cache in (("uncached", None), ("cached", warm_cache)):
+            with embedding_cache(cache):
+                if cache is not None:
+                    measure_search(retriever, golden, mode, repeats=1)
+                report["search"][mode][label] = {
+                    "latency": measure_search(retriever, golden, mode, args.repeats),
+                    "qps": measure_qps(retriever, golden, mode, args.concurrency, args.qps_seconds),
+                }
+        if args.expansion:
+            # before/after for QUERY_EXPANSION on the same index
+            report["search"][mode]["recall_expanded"] = measure_recall(retriever, golden, mode, expand=True)
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Harry Potter retrieval pipeline")
+    parser.add_argument("--pdf", help="PDF to benchmark (default: PDF_PATH from config)")
+    parser.add_argument("--golden", default=GOLDEN_PATH, help="golden question/passage JSON")
+    parser.add_argument("--modes", nargs="+", default=["vector", "hybrid"])
+    parser.add_argument("--repeats", type=int, default=5, help="latency passes over the golden set")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--qps-seconds", type=float, default=3.0)
+    parser.add_argument("--expansion", action="store_true",
+                        help="also report recall with query alias expansion")
+    parser.add_argument("--skip-cold-start", action="store_true")
+    parser.add_argument("--skip-build", action="store_true")
+    parser.add_argument("--offline", action="store_true", help="forbid Hugging Face downloads")
+    parser.add_argument("--out", help="write the JSON report here (stable key order for diffs)")
+    args = parser.parse_args()
+
+    if args.offline:
+        os.environ["HF_HUB_OFFLINE"] = "1"
+        os.environ["TRANSFORMERS_OFFLINE"] = "1"
+
+    report = run(args)
+    text = json.dumps(report, indent=2, sort_keys=True)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Startup profile: how long each entry module takes to import in a fresh interpreter.
+
+    python -m benchmarks.startup_profile --out benchmarks/startup.json [--load]
+
+For every module the report has the wall time of `import <module>`, the
+slowest imports it pulled in (from `python -X importtime`) and which heavy
+packages (torch, crewai, langchain, ...) got loaded along the way. Light
+modules must import within STARTUP_IMPORT_BUDGET_S and without any heavy
+package; the exit status is 1 if one does not. --load also times warm_up()
+(index load) and the first query.
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+from typing import Any, Dict, List
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+# what CLI tools, health checks and worker forks import: budgeted
+LIGHT_MODULES = [
+    "src.config",
+    "src.utils.retriever",
+    "src.utils.llm_service",
+    "src.utils.job_manager",
+    "src.agents.direct_pipeline",
+    "server",
+]
+# pull in crewai by design: reported, not budgeted
+HEAVY_MODULES = [
+    "src.utils.tools",
+    "src.agents.harry_potter_crew",
+]
+HEAVY_PACKAGES = [
+    "torch", "transformers", "sentence_transformers", "crewai", "litellm",
+    "langchain_core", "langchain_community", "google.generativeai", "pdfplumber", "faiss",
+]
+
+_IMPORT_PROBE = (
+    "import sys, time, json\n"
+    "t0 = time.perf_counter()\n"
+    "import {module}\n"
+    "wall = time.perf_counter() - t0\n"
+    "heavy = {heavy!r}\n"
+    "print(json.dumps({{'wall_s': wall, 'heavy': [p for p in heavy if p in sys.modules]}}))\n"
+)
+
+_LOAD_PROBE = (
+    "import time, json\n"
+    "t0 = time.perf_counter()\n"
+    "from src.utils.retriever import warm_up\n"
+    "t1 = time.perf_counter(); retriever = warm_up(); t2 = time.perf_counter()\n"
+    "retriever.search('Who is Harry Potter?', k=5); t3 = time.perf_counter()\n"
+    "print(json.dumps({'import_s': t1 - t0, 'warm_up_s': t2 - t1, 'first_query_s': t3 - t2}))\n"
+)
+
+
+def parse_importtime(stderr: str, top: int = 10) -> List[Dict[str, Any]]:
+    """Slowest modules by self time from `-X importtime` output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            rows.append({
+                "module": name.strip(),
+                "self_ms": round(int(self_us) / 1000, 2),
+                "cumulative_ms": round(int(cumulative_us) / 1000, 2),
+            })
+        except ValueError:
+            continue
+    rows.sort(key=lambda r: -r["self_ms"])
+    return rows[:top]
+
+
+def profile_import(module: str, top: int = 10) -> Dict[str, Any]:
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _IMPORT_PROBE.format(module=module, heavy=HEAVY_PACKAGES)],
+        cwd=PROJECT_ROOT, env=os.environ.copy(), capture_output=True, text=True,
+    )
+    if out.returncode != 0:
+        return {"error": out.stderr.strip().splitlines()[-1] if out.stderr.strip() else "failed"}
+    stats = json.loads(out.stdout.strip().splitlines()[-1])
+    return {
+        "wall_s": round(stats["wall_s"], 3),
+        "heavy_packages": stats["heavy"],
+        "slowest": parse_importtime(out.stderr, top),
+    }
+
+
+def profile_load() -> Dict[str, Any]:
+    out = subprocess.run(
+        [sys.executable, "-c", _LOAD_PROBE], cwd=PROJECT_ROOT, env=os.environ.copy(),
+        capture_output=True, text=True, check=True,
+    )
+    return {k: round(v, 3) for k, v in json.loads(out.stdout.strip().splitlines()[-1]).items()}
+
+
+def run(args) -> Dict[str, Any]:
+    from src.config import STARTUP_IMPORT_BUDGET_S
+    from benchmarks.retrieval_benchmark import git_revision
+
+    report: Dict[str, Any] = {
+        "revision": git_revision(),
+        "budget_s": STARTUP_IMPORT_BUDGET_S,
+        "imports": {},
+        "over_budget": [],
+    }
+    for module in LIGHT_MODULES + HEAVY_MODULES:
+        print(f"⏱️ import {module}", file=sys.stderr)
+        stats = profile_import(module, args.top)
+        report["imports"][module] = stats
+        if module in LIGHT_MODULES and (
+            "error" in stats or stats["wall_s"] > STARTUP_IMPORT_BUDGET_S or stats["heavy_packages"]
+        ):
+            report["over_budget"].append(module)
+    if args.load:
+        report["load"] = profile_load()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile import time and startup of the entry modules")
+    parser.add_argument("--top", type=int, default=10, help="slowest imports listed per module")
+    parser.add_argument("--load", action="store_true", help="also time warm_up() and the first query")
+    parser.add_argument("--out", help="write the JSON report here (stable key order for diffs)")
+    args = parser.parse_args()
+
+    report = run(args)
+    text = json.dumps(report, indent=2, sort_keys=True)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    if report["over_budget"]:
+        print(f"❌ Over the startup budget: {', '.join(report['over_budget'])}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,434 @@
+"""
+Headless HTTP/JSON server for the Harry Potter RAG pipeline.
+
+    python server.py [--host 127.0.0.1] [--port 8000] [--stub-llm] [--trace [PATH]] [--asyncio]
+
+    GET  /health   index + queue status
+    GET  /metrics  per-stage span metrics (latency, tokens, hits, cache hits; needs --trace)
+    POST /search   {"query", "k"?, "mode"?, "book"?, "chapter_from"?, "chapter_to"?,
+                    "characters"?, "format"?: "json" | "text"}  -> retrieval only
+    POST /answer   {"question", "character", "mode"?: "auto" | "fast" | "crew",
+                    "k"?, "include_passages"?}                  -> full in-character answer
+
+Concurrent unfiltered searches (including the retrieval step of fast-path
+answers, which otherwise run exactly as direct_pipeline.answer_directly)
+are micro-batched into one encoder call and one vector search.
+Requests over the queue limits get 503 with a Retry-After header.
+--stub-llm swaps Gemini for a local echo so the server runs without network
+access or an API key. --trace records spans to PATH (JSONL, default
+TRACE_PATH) and aggregates them for /metrics. --asyncio serves every
+connection from one event loop instead of a thread per request: searches
+await the batcher, answers await Gemini (HarryPotterRAGCrew.aanswer for crew
+mode), so slow LLM calls do not each hold a thread.
+"""
+import json
+import time
+import asyncio
+import argparse
+import functools
+import threading
+import traceback
+from contextlib import contextmanager
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.utils.tracing import span
+
+RETRY_AFTER_SECONDS = 1
+MAX_K = 50
+ROUTES = {
+    ("GET", "/health"): "health",
+    ("GET", "/metrics"): "metrics",
+    ("POST", "/search"): "search",
+    ("POST", "/answer"): "answer",
+}
+
+
+class StubLLM:
+    """Offline stand-in for LLMService: answers with the question and how much context it got."""
+
+    def generate_response(self, prompt, cache_parts=None):
+        question = prompt.rsplit("Question:", 1)[-1].split("\n", 1)[0].strip()
+        passages = prompt.count("\n---\n") + 1 if "Book passages:" in prompt else 0
+        return f"[stub answer] {question} ({passages} passages, {len(prompt)} prompt chars)"
+
+    async def agenerate_response(self, prompt, cache_parts=None):
+        return self.generate_response(prompt, cache_parts)
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+def parse_k(body, default=5):
+    """The request's result count: an integer from 1 to MAX_K, else 400."""
+    k = body.get("k", default)
+    try:
+        if isinstance(k, (bool, float)):
+            raise ValueError
+        k = int(k)
+    except (TypeError, ValueError):
+        raise HTTPError(400, f"'k' must be an integer, got {k!r}")
+    if not 1 <= k <= MAX_K:
+        raise HTTPError(400, f"'k' must be between 1 and {MAX_K}")
+    return k
+
+
+def route(method, target):
+    """The RAGService method serving `target`, else 404."""
+    path = target.split("?", 1)[0].rstrip("/") or "/"
+    name = ROUTES.get((method, path))
+    if name is None:
+        raise HTTPError(404, f"no route for {method} {path}")
+    return name
+
+
+def parse_body(raw):
+    try:
+        body = json.loads(raw or b"{}")
+    except ValueError:
+        raise HTTPError(400, "request body must be JSON")
+    if not isinstance(body, dict):
+        raise HTTPError(400, "request body must be a JSON object")
+    return body
+
+
+class BatchedSearch:
+    """Retriever stand-in for direct_pipeline.(a)retrieve: searches go through the service's batcher."""
+
+    def __init__(self, service):
+        self.service = service
+
+    def search(self, query, k=5, mode="vector", filters=None):
+        return self.service._search(query, k, mode, filters)
+
+    async def asearch(self, query, k=5, mode="vector", filters=None):
+        return await self.service._asearch(query, k, mode, filters)
+
+
+class RAGService:
+    """Everything the handlers share: retriever, search batcher, LLM and admission limits."""
+
+    def __init__(self, pdf_path=None, stub_llm=False):
+        from src.config import SERVER_MAX_INFLIGHT_ANSWERS
+        from src.utils.retriever import warm_up
+        from src.utils.search_batcher import SearchBatcher
+
+        self.pdf_path = pdf_path
+        self.stub_llm = stub_llm
+        self.retriever = warm_up(pdf_path)
+        self.batcher = SearchBatcher(self.retriever)
+        self.llm = StubLLM() if stub_llm else None
+        self.searcher = BatchedSearch(self)
+        self._answer_slots = threading.BoundedSemaphore(SERVER_MAX_INFLIGHT_ANSWERS)
+        self.max_inflight_answers = SERVER_MAX_INFLIGHT_ANSWERS
+        self.inflight_answers = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def _busy(self, message):
+        with self._lock:
+            self.rejected += 1
+        return HTTPError(503, message, {"Retry-After": str(RETRY_AFTER_SECONDS)})
+
+    def _search(self, query, k, mode, filters=None):
+        from src.utils.search_batcher import BatcherFull
+
+        if filters is not None:
+            # filtered scans are per-query anyway, so they skip the batcher
+            return self.retriever.search(query, k=k, mode=mode, filters=filters)
+        try:
+            return self.batcher.search(query, k=k, mode=mode)
+        except BatcherFull as e:
+            raise self._busy(str(e))
+
+    async def _asearch(self, query, k, mode, filters=None):
+        from src.utils.search_batcher import BatcherFull
+
+        if filters is not None:
+            return await self.retriever.asearch(query, k=k, mode=mode, filters=filters)
+        try:
+            return await self.batcher.asearch(query, k=k, mode=mode)
+        except BatcherFull as e:
+            raise self._busy(str(e))
+
+    def _get_llm(self):
+        if self.llm is None:
+            from src.agents.direct_pipeline import get_llm_service
+            self.llm = get_llm_service()
+        return self.llm
+
+    def _new_crew(self):
+        # one per request: Crew.kickoff writes the inputs into the crew's Task
+        # objects, so concurrent answers must not share an instance
+        from src.agents.harry_potter_crew import HarryPotterRAGCrew
+        return HarryPotterRAGCrew(pdf_path=self.pdf_path)
+
+    def health(self):
+        return {
+            "status": "ok",
+            "index_version": self.retriever.index_version,
+            "chunks": len(self.retriever),
+            "llm": "stub" if self.stub_llm else "gemini",
+            "batcher": self.batcher.stats(),
+            "answers_in_flight": self.inflight_answers,
+            "rejected": self.rejected,
+            "query_cache": self.retriever.query_cache.stats(),
+        }
+
+    def metrics(self):
+        from src.utils.tracing import tracer
+        return {"tracing": tracer.enabled, "trace_path": tracer.path, "spans": tracer.metrics()}
+
+    def _search_args(self, body):
+        from src.config import SEARCH_MODE
+        from src.utils.search_filters import SearchFilter
+
+        query = body.get("query")
+        if not query or not isinstance(query, str):
+            raise HTTPError(400, "'query' (string) is required")
+        k = parse_k(body)
+        mode = body.get("mode", SEARCH_MODE)
+        if mode not in ("vector", "hybrid"):
+            raise HTTPError(400, f"unknown search mode {mode!r}")
+        return query, k, mode, SearchFilter.from_dict(body)
+
+    @staticmethod
+    def _search_result(body, query, docs):
+        if body.get("format") == "text":
+            # exactly what PDFVectorSearchTool hands the agents (without importing crewai)
+            from src.utils.context_compressor import format_passages
+            return {"text": format_passages(docs, query)}
+        return {"results": [{"text": d.page_content, "metadata": d.metadata} for d in docs]}
+
+    def search(self, body):
+        query, k, mode, filters = self._search_args(body)
+        return self._search_result(body, query, self._search(query, k, mode, filters))
+
+    async def asearch(self, body):
+        from src.utils.retriever import run_in_search_pool
+
+        query, k, mode, filters = self._search_args(body)
+        docs = await self._asearch(query, k, mode, filters)
+        # format=text compresses the passages (embedding model): off the loop
+        return await run_in_search_pool(self._search_result, body, query, docs)
+
+    def _answer_args(self, body):
+        from src.agents.direct_pipeline import ANSWER_MODES, is_complex
+
+        question, character = body.get("question"), body.get("character")
+        if not question or not character:
+            raise HTTPError(400, "'question' and 'character' are required")
+        mode = body.get("mode", "auto")
+        if mode not in ANSWER_MODES:
+            raise HTTPError(400, f"mode must be one of {ANSWER_MODES}")
+        if mode == "auto":
+            mode = "crew" if is_complex(question) and not self.stub_llm else "fast"
+        if mode == "crew" and self.stub_llm:
+            raise HTTPError(400, "crew mode needs the real LLM (server started with --stub-llm)")
+        return question, character, mode, parse_k(body)
+
+    @contextmanager
+    def _answer_slot(self):
+        if not self._answer_slots.acquire(blocking=False):
+            raise self._busy(f"{self.max_inflight_answers} answers already in flight")
+        with self._lock:
+            self.inflight_answers += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.inflight_answers -= 1
+            self._answer_slots.release()
+
+    def answer(self, body):
+        from src.agents.direct_pipeline import answer_directly, retrieve
+
+        question, character, mode, k = self._answer_args(body)
+        with self._answer_slot():
+            out = {"mode": mode}
+            if mode == "fast":
+                docs = retrieve(question, k=k, retriever=self.searcher)
+                out["answer"] = answer_directly(question, character, pdf_path=self.pdf_path,
+                                                llm=self._get_llm(), docs=docs)
+                if body.get("include_passages"):
+                    out["passages"] = [d.page_content for d in docs]
+            else:
+                out["answer"] = self._new_crew().answer(question, character, mode="crew")
+            return out
+
+    async def aanswer(self, body):
+        from src.agents.direct_pipeline import aanswer_directly, aretrieve
+
+        question, character, mode, k = self._answer_args(body)
+        loop = asyncio.get_running_loop()
+        with self._answer_slot():
+            out = {"mode": mode}
+            if mode == "fast":
+                docs = await aretrieve(question, k=k, retriever=self.searcher)
+                llm = self.llm or await loop.run_in_executor(None, self._get_llm)
+                out["answer"] = await aanswer_directly(question, character, pdf_path=self.pdf_path,
+                                                       llm=llm, docs=docs)
+                if body.get("include_passages"):
+                    out["passages"] = [d.page_content for d in docs]
+            else:
+                # building a crew imports crewai the first time: not on the loop
+                crew = await loop.run_in_executor(None, self._new_crew)
+                out["answer"] = await crew.aanswer(question, character, mode="crew")
+            return out
+
+
+class RAGRequestHandler(BaseHTTPRequestHandler):
+    service: RAGService = None
+
+    def _send(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self, method):
+        start = time.perf_counter()
+        try:
+            name = route(method, self.path)
+            if method == "POST":
+                length = int(self.headers.get("Content-Length") or 0)
+                body = parse_body(self.rfile.read(length))
+                with span(f"http.{name}"):
+                    result = getattr(self.service, name)(body)
+            else:
+                result = getattr(self.service, name)()
+            result["took_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            self._send(200, result)
+        except HTTPError as e:
+            self._send(e.status, {"error": str(e)}, e.headers)
+        except Exception as e:
+            traceback.print_exc()
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def make_server(host, port, service):
+    handler = type("Handler", (RAGRequestHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+async def handle_async(service, method, target, raw):
+    """One request on the event loop -> (status, payload, headers); POSTs use the service's a* methods."""
+    start = time.perf_counter()
+    try:
+        name = route(method, target)
+        if method == "POST":
+            body = parse_body(raw)
+            with span(f"http.{name}"):
+                result = await getattr(service, "a" + name)(body)
+        else:
+            result = getattr(service, name)()
+        result["took_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        return 200, result, {}
+    except HTTPError as e:
+        return e.status, {"error": str(e)}, e.headers
+    except Exception as e:
+        traceback.print_exc()
+        return 500, {"error": f"{type(e).__name__}: {e}"}, {}
+
+
+async def _serve_connection(service, reader, writer):
+    """Minimal HTTP/1.1: one request per connection, answered with Connection: close."""
+    try:
+        try:
+            method, target, _ = (await reader.readline()).decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            raw = await reader.readexactly(int(headers.get("content-length") or 0))
+        except (ValueError, asyncio.IncompleteReadError):
+            status, payload, extra = 400, {"error": "malformed HTTP request"}, {}
+        else:
+            status, payload, extra = await handle_async(service, method, target, raw)
+        data = json.dumps(payload).encode("utf-8")
+        head = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+                "Content-Type: application/json",
+                f"Content-Length: {len(data)}",
+                "Connection: close"]
+        head += [f"{key}: {value}" for key, value in extra.items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve_async(host, port, service, ready=None):
+    """Serve until cancelled; `ready` (an asyncio.Event) is set once the socket listens."""
+    server = await asyncio.start_server(functools.partial(_serve_connection, service), host, port)
+    async with server:
+        if ready is not None:
+            ready.set()
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the Harry Potter RAG pipeline over HTTP/JSON")
+    parser.add_argument("--host", help="bind address (default: SERVER_HOST from config)")
+    parser.add_argument("--port", type=int, help="port (default: SERVER_PORT from config)")
+    parser.add_argument("--pdf", help="PDF to serve (default: PDF_PATH from config)")
+    parser.add_argument("--stub-llm", action="store_true", help="answer with a local echo instead of Gemini")
+    parser.add_argument("--trace", nargs="?", const="", metavar="PATH",
+                        help="record trace spans (JSONL at PATH, default TRACE_PATH) and serve /metrics")
+    parser.add_argument("--asyncio", action="store_true",
+                        help="serve from one asyncio event loop instead of a thread per request")
+    args = parser.parse_args()
+
+    from src.config import SERVER_HOST, SERVER_PORT, TRACE_PATH
+
+    if args.trace is not None:
+        from src.utils.tracing import enable_tracing
+        enable_tracing(args.trace or TRACE_PATH)
+        print(f"🔎 Tracing to {args.trace or TRACE_PATH}")
+
+    print("🪄 Loading the index...")
+    service = RAGService(args.pdf, stub_llm=args.stub_llm)
+    host, port = args.host or SERVER_HOST, args.port or SERVER_PORT
+    llm = "stub" if args.stub_llm else "Gemini"
+    if args.asyncio:
+        print(f"🚀 Serving on http://{host}:{port} ({llm} LLM, asyncio)")
+        try:
+            asyncio.run(serve_async(host, port, service))
+        except KeyboardInterrupt:
+            print("🧹 Shutting down...")
+        return
+    server = make_server(host, port, service)
+    print(f"🚀 Serving on http://{host}:{port} ({llm} LLM)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("🧹 Shutting down...")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+from crewai import LLM
+
+from src.utils.response_cache import get_response_cache, response_key
+from src.utils.tracing import current_span, span
+
+
+def llm_settings(llm) -> dict:
+    return {
+        "model": getattr(llm, "model", str(llm)),
+        "temperature": getattr(llm, "temperature", None),
+        "max_tokens": getattr(llm, "max_tokens", None),
+    }
+
+
+def with_response_cache(llm):
+    """
+    Route an agent LLM's plain completions through the response cache, keyed by
+    the exact messages (which carry the question, character and the retrieved
+    passages from tool results) and the model settings. Calls that offer tools
+    or stream are passed straight through. Patches `llm` in place and returns it.
+    """
+    original = llm.call
+
+    def call(messages, tools=None, *args, **kwargs):
+        with span("llm.agent_call", model=getattr(llm, "model", ""), tools=bool(tools),
+                  messages=len(messages) if isinstance(messages, list) else 1):
+            cache = get_response_cache()
+            if cache is None or tools or kwargs.get("available_functions") or getattr(llm, "stream", False):
+                return original(messages, tools, *args, **kwargs)
+            current_span().set(cache_hit=True)
+            key = response_key("agent", llm_settings(llm), messages=messages)
+            return cache.get_or_compute(key, lambda: uncached(messages, tools, *args, **kwargs), "agent")
+
+    def uncached(*args, **kwargs):
+        current_span().set(cache_hit=False)
+        return original(*args, **kwargs)
+
+    # object.__setattr__: some crewai LLM classes are pydantic models
+    object.__setattr__(llm, "call", call)
+    return llm
+
+
+def cached_llm(model: str, **kwargs):
+    return with_response_cache(LLM(model=model, **kwargs))
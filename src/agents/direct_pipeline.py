@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import re
+import threading
+import traceback
+from typing import TYPE_CHECKING, AsyncIterator, Iterator, List, Optional, Sequence, Tuple
+
+from src.config import CONTEXT_COMPRESSION, CONTEXT_TOKEN_BUDGET, CONTEXT_SCORER, PERSONA_PROFILES
+from src.utils.context_compressor import context_passages
+from src.utils.index_manifest import hash_text
+from src.utils.retriever import get_retriever, run_in_search_pool
+from src.utils.reranker import asearch_reranked, search_reranked
+from src.utils.response_cache import context_hash, get_response_cache
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+# one retrieval + one LLM call, instead of three agents each with their own calls
+DIRECT_PROMPT = """You are {character} from the Harry Potter books. Answer the question below
+in {character}'s own voice: their vocabulary, speech patterns, personality and point of view.
+Stay consistent with the book passages provided; if they do not cover the question, answer
+as {character} plausibly would without inventing major plot facts.
+{persona}
+Book passages:
+{context}
+
+Question: {question}
+
+{character}'s answer:"""
+
+# questions that need multi-step reasoning go to the full crew
+COMPLEX_PATTERNS = [
+    r"\bcompare\b", r"\bcomparison\b", r"\bdifferences?\b", r"\bversus\b", r"\bvs\.?\b",
+    r"\bover the (course|years|series)\b", r"\bhow did .* change\b", r"\bevolve[sd]?\b",
+    r"\bstep by step\b", r"\banaly[sz]e\b", r"\bexplain why\b.*\band\b",
+]
+COMPLEX_MAX_WORDS = 30
+
+ANSWER_MODES = ("auto", "fast", "crew")
+
+_llm = None
+_llm_lock = threading.Lock()
+
+
+def get_llm_service():
+    """Shared LLMService, created on first use."""
+    global _llm
+    with _llm_lock:
+        if _llm is None:
+            from src.utils.llm_service import LLMService
+            _llm = LLMService()
+        return _llm
+
+
+def is_complex(question: str) -> bool:
+    """Heuristic: long, multi-part or comparative questions need the full crew."""
+    q = question.lower()
+    if len(q.split()) > COMPLEX_MAX_WORDS or q.count("?") > 1:
+        return True
+    return any(re.search(p, q) for p in COMPLEX_PATTERNS)
+
+
+def format_context(docs: List[Document], question: Optional[str] = None) -> str:
+    if not docs:
+        return "(no relevant passages found)"
+    return "\n---\n".join(context_passages(question, docs))
+
+
+def persona_for(character: str, pdf_path: Optional[str] = None) -> Optional[str]:
+    """The character's mined persona profile (as in the persona crew), or None if there is none."""
+    if not PERSONA_PROFILES:
+        return None
+    try:
+        from src.utils.persona_profiles import get_persona_profiles
+        return get_persona_profiles(pdf_path).persona(character)
+    except Exception:
+        traceback.print_exc()
+        return None
+
+
+def build_prompt(question: str, character: str, docs: List[Document],
+                 persona: Optional[str] = None) -> str:
+    voice = f"\nHow {character} speaks in the books:\n{persona}\n" if persona else ""
+    return DIRECT_PROMPT.format(character=character, question=question, persona=voice,
+                                context=format_context(docs, question))
+
+
+def cache_parts(question: str, character: str, docs: List[Document],
+                persona: Optional[str] = None) -> dict:
+    """What a fast-path answer depends on besides the model settings (response-cache key)."""
+    # prompt template included, so editing DIRECT_PROMPT retires old answers
+    # (the system prompt is in the LLM's settings, which every key includes)
+    parts = {"question": question, "character": character, "context": context_hash(docs),
+             "prompt": hash_text(DIRECT_PROMPT)}
+    if persona:
+        # re-mined profiles change the prompt
+        parts["persona"] = hash_text(persona)
+    if CONTEXT_COMPRESSION:
+        # the prompt holds the compressed passages, so their settings are part of the key
+        parts["compression"] = [CONTEXT_TOKEN_BUDGET, CONTEXT_SCORER]
+    return parts
+
+
+def prepare(question: str, character: str, docs: List[Document],
+            pdf_path: Optional[str] = None) -> Tuple[str, dict]:
+    """(prompt, cache parts) for a fast-path answer, with the character's persona if one was mined."""
+    persona = persona_for(character, pdf_path)
+    return build_prompt(question, character, docs, persona), cache_parts(question, character, docs, persona)
+
+
+def retrieve(question: str, pdf_path: Optional[str] = None, k: int = 5, retriever=None) -> List[Document]:
+    """
+    The fast path's passages: search (reranked if enabled) on `retriever`
+    (anything with Retriever.search's signature), default the shared one.
+    """
+    return search_reranked(retriever or get_retriever(pdf_path), question, k=k)
+
+
+def answer_directly(question: str, character: str, pdf_path: Optional[str] = None,
+                    k: int = 5, llm=None, docs: Optional[List[Document]] = None) -> str:
+    """Fast path: retrieve once (unless `docs` were retrieved already), prompt once."""
+    if docs is None:
+        docs = retrieve(question, pdf_path, k)
+    llm = llm or get_llm_service()
+    prompt, parts = prepare(question, character, docs, pdf_path)
+    return llm.generate_response(prompt, cache_parts=parts)
+
+
+def stream_directly(question: str, character: str, pdf_path: Optional[str] = None,
+                    k: int = 5, llm=None) -> Iterator[str]:
+    """Fast path, streamed: yields answer text as Gemini produces it (a cached answer in one piece)."""
+    docs = retrieve(question, pdf_path, k)
+    llm = llm or get_llm_service()
+    prompt, parts = prepare(question, character, docs, pdf_path)
+    key = llm.response_cache_key(prompt, parts)
+    cached = get_response_cache().get(key) if key else None
+    if cached is not None:
+        yield cached
+        return
+    pieces = []
+    for piece in llm.generate_response_stream(prompt):
+        pieces.append(piece)
+        yield piece
+    if key:
+        get_response_cache().put(key, "".join(pieces).strip(), "direct")
+
+
+async def aretrieve(question: str, pdf_path: Optional[str] = None, k: int = 5,
+                    queries: Optional[Sequence[str]] = None, retriever=None) -> List[Document]:
+    """
+    Retrieve off the event loop; extra `queries` (rephrasings) are searched
+    concurrently and fused, then reranked against `question` if enabled.
+    `retriever` is anything with Retriever.asearch's signature.
+    """
+    return await asearch_reranked(retriever or get_retriever(pdf_path), question, k=k, queries=queries)
+
+
+async def aanswer_directly(question: str, character: str, pdf_path: Optional[str] = None,
+                           k: int = 5, llm=None, queries: Optional[Sequence[str]] = None,
+                           docs: Optional[List[Document]] = None) -> str:
+    """Async fast path: retrieval on the search pool, Gemini awaited natively."""
+    if docs is None:
+        docs = await aretrieve(question, pdf_path, k, queries)
+    llm = llm or get_llm_service()
+    # context compression runs the embedding model (and profiles may be mined): on the search pool
+    prompt, parts = await run_in_search_pool(prepare, question, character, docs, pdf_path)
+    return await llm.agenerate_response(prompt, cache_parts=parts)
+
+
+async def astream_directly(question: str, character: str, pdf_path: Optional[str] = None,
+                           k: int = 5, llm=None,
+                           queries: Optional[Sequence[str]] = None) -> AsyncIterator[str]:
+    """Async fast path, streamed."""
+    docs = await aretrieve(question, pdf_path, k, queries)
+    llm = llm or get_llm_service()
+    prompt, parts = await run_in_search_pool(prepare, question, character, docs, pdf_path)
+    key = llm.response_cache_key(prompt, parts)
+    cached = await get_response_cache().aget(key) if key else None
+    if cached is not None:
+        yield cached
+        return
+    pieces = []
+    async for piece in llm.agenerate_response_stream(prompt):
+        pieces.append(piece)
+        yield piece
+    if key:
+        await get_response_cache().aput(key, "".join(pieces).strip(), "direct")
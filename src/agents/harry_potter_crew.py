@@ -1,24 +1,37 @@
-from crewai import Agent, Crew, Process, Task
+from crewai import Agent, Crew, LLM, Process, Task
 from crewai.project import CrewBase, agent, crew, task
 import os
+import time
 import yaml
 import traceback
-from dotenv import load_dotenv
 from pathlib import Path
 
+from src.config import load_env, CONTEXT_COMPRESSION, CONTEXT_TOKEN_BUDGET, CONTEXT_SCORER, PERSONA_PROFILES
 from src.utils.tools import PDFVectorSearchTool
+from src.agents.direct_pipeline import (
+    ANSWER_MODES, aanswer_directly, answer_directly, astream_directly, is_complex, stream_directly,
+)
+from src.utils.crew_streaming import stream_kickoff
+from src.utils.index_manifest import hash_text
+from src.utils.response_cache import context_hash, get_response_cache, response_key
+from src.agents.cached_llm import cached_llm
+from src.utils.retriever import run_in_search_pool
+from src.utils.tracing import current_span, span, tracer
+from src.utils.persona_profiles import get_persona_profiles
 
 @CrewBase
 class HarryPotterRAGCrew:
     """Minimal Harry Potter RAG Crew with semantic retrieval + memory."""
 
-    def __init__(self, pdf_path: str = None, config_dir: str = None):
-        load_dotenv()
+    def __init__(self, pdf_path: str = None, config_dir: str = None, stream_llm=None):
+        load_env()
+        # streaming LLM for the final agent (set only for answer_stream runs)
+        self.stream_llm = stream_llm
         # PROJECT_ROOT = D:/Harry_Potter_RAG
         project_root = Path(__file__).parents[2]
 
-        # PDF path (overrideable)
-        self.pdf_path = pdf_path or str(project_root / "data" / "harry_potter.pdf")
+        # PDF path (overrideable); None searches the whole corpus (data/corpus.yaml)
+        self.pdf_path = pdf_path
 
         # CONFIG DIR overrideable, else default to src/agents/config
         if config_dir:
@@ -30,21 +43,53 @@ class HarryPotterRAGCrew:
         # load YAMLs
         try:
             with open(self.config_dir / "agents.yaml") as f:
-                self.agents_config = yaml.safe_load(f)
+                agents_text = f.read()
             with open(self.config_dir / "tasks.yaml") as f:
-                self.tasks_config = yaml.safe_load(f)
+                tasks_text = f.read()
+            self.agents_config = yaml.safe_load(agents_text)
+            self.tasks_config = yaml.safe_load(tasks_text)
         except Exception:
             traceback.print_exc()
+            agents_text = tasks_text = ""
             self.agents_config = {}
             self.tasks_config = {}
+        # prompt/config edits must not be answered from the response cache
+        self.config_hash = hash_text(agents_text + tasks_text)
+        # end of the previous crew task (tracing)
+        self._task_clock = time.perf_counter()
+        # persona profiles mined from the index stand in for the analysis agent
+        self.personas = self._load_personas()
+        # the retrieval agent's search tool (built on first use)
+        self._tool = None
+
+    def _load_personas(self):
+        if not PERSONA_PROFILES or "generate_response_with_persona" not in self.tasks_config:
+            return None
+        try:
+            return get_persona_profiles(self.pdf_path)
+        except Exception:
+            traceback.print_exc()
+            return None
+
+    def _persona_for(self, character: str):
+        return self.personas.persona(character) if self.personas is not None else None
+
+    def _agent_model(self, name: str) -> str:
+        model = self.agents_config.get(name, {}).get("llm", "gemini/gemini-1.5-flash")
+        return getattr(model, "model", model)  # CrewBase may have mapped it to an LLM already
+    def _search_tool(self) -> PDFVectorSearchTool:
+        if self._tool is None:
+            self._tool = PDFVectorSearchTool(pdf_path=self.pdf_path)
+        return self._tool
+
     @agent
     def retrieval_agent(self):
         """Agent that uses semantic PDF search."""
-        rag_tool = PDFVectorSearchTool(pdf_path=self.pdf_path)
         return Agent(
             config=self.agents_config["retrieval_agent"],
             verbose=True,
-            tools=[rag_tool],
+            tools=[self._search_tool()],
+            llm=cached_llm(self._agent_model("retrieval_agent")),
         )
 
     @agent
@@ -53,14 +98,17 @@ class HarryPotterRAGCrew:
         return Agent(
             config=self.agents_config["character_analysis_agent"],
             verbose=True,
+            llm=cached_llm(self._agent_model("character_analysis_agent")),
         )
 
     @agent
     def response_generation_agent(self):
         """Agent that generates final response, with memory."""
+        llm = self.stream_llm or cached_llm(self._agent_model("response_generation_agent"))
         return Agent(
             config=self.agents_config["response_generation_agent"],
             verbose=True,
+            llm=llm,
         )
 
     @task
@@ -76,11 +124,159 @@ class HarryPotterRAGCrew:
         return Task(config=self.tasks_config["generate_response"])
     
 
-    @crew
-    def crew(self) -> Crew:
+    def _trace_task(self, output):
+        """task_callback: one span per finished task, timed from the previous one."""
+        now = time.perf_counter()
+        tracer.record("crew.task", (now - self._task_clock) * 1000,
+                      agent=str(getattr(output, "agent", "")).strip(),
+                      output_chars=len(str(getattr(output, "raw", "") or "")))
+        self._task_clock = now
+
+    def _trace_step(self, step):
+        """step_callback: count agent steps (thoughts, tool calls) on the kickoff span."""
+        current_span().add("steps")
+
+    def _make_crew(self, agents, tasks) -> Crew:
         return Crew(
-            agents=self.agents,
-            tasks=self.tasks,
+            agents=agents,
+            tasks=tasks,
             process=Process.sequential,
             verbose=True,
+            task_callback=self._trace_task,
+            step_callback=self._trace_step,
         )
+
+    @crew
+    def crew(self) -> Crew:
+        """The three-task crew (retrieve, analyze the character, answer); memoized by @crew."""
+        return self._make_crew(self.agents, self.tasks)
+
+    def persona_crew(self) -> Crew:
+        """
+        Retrieve, then answer with the character's persona profile in the prompt
+        instead of an analyze_character step. Deliberately not a @crew method:
+        that decorator memoizes per instance, and both shapes are needed here.
+        """
+        respond = Task(config=self.tasks_config["generate_response_with_persona"])
+        return self._make_crew([self.retrieval_agent(), self.response_generation_agent()],
+                               [self.retrieve_context(), respond])
+
+    def _crew_for(self, question: str, character: str):
+        """(crew, kickoff inputs) for one question: the two-task crew when the character has a persona."""
+        persona = self._persona_for(character)
+        crew = self.persona_crew() if persona else self.crew()
+        return crew, {"question": question, "character": character, "persona": persona or ""}
+
+    def _kickoff_span(self, character: str, **attrs):
+        self._task_clock = time.perf_counter()
+        return span("crew.kickoff", character=character, **attrs)
+
+    def _crew_cache_key(self, question: str, character: str):
+        """
+        Response-cache key for a full crew answer: question, character, the passages
+        the retrieval agent's tool returns for the question (searched the way the
+        tool searches, with its mode/rerank/expansion settings), the agents'
+        models and the YAML config.
+        """
+        if get_response_cache() is None:
+            return None
+        tool = self._search_tool()
+        docs = tool.search_docs(question)
+        settings = {
+            "models": {name: self._agent_model(name) for name in self.agents_config},
+            "config": self.config_hash,
+            "search": tool.search_settings(),
+        }
+        if CONTEXT_COMPRESSION:
+            # the tool hands the agents compressed passages
+            settings["compression"] = [CONTEXT_TOKEN_BUDGET, CONTEXT_SCORER]
+        persona = self._persona_for(character)
+        if persona:
+            settings["persona"] = hash_text(persona)
+        return response_key("crew", settings, question=question, character=character,
+                            context=context_hash(docs))
+
+    def answer(self, question: str, character: str, mode: str = "auto") -> str:
+        """
+        Answer in character.
+        mode="fast": one retrieval + one LLM call; "crew": the full three-agent crew;
+        "auto": fast unless the question looks complex (see direct_pipeline.is_complex).
+        """
+        if mode not in ANSWER_MODES:
+            raise ValueError(f"mode must be one of {ANSWER_MODES}, got {mode!r}")
+        fast = mode == "fast" or (mode == "auto" and not is_complex(question))
+        with span("answer", mode=mode, path="fast" if fast else "crew"):
+            if fast:
+                return answer_directly(question, character, pdf_path=self.pdf_path)
+
+            def kickoff():
+                crew, inputs = self._crew_for(question, character)
+                with self._kickoff_span(character, persona=bool(inputs["persona"])):
+                    return str(crew.kickoff(inputs=inputs))
+
+            key = self._crew_cache_key(question, character)
+            if key is None:
+                return kickoff()
+            return get_response_cache().get_or_compute(key, kickoff, "crew")
+
+    async def aanswer(self, question: str, character: str, mode: str = "auto") -> str:
+        """
+        Async answer(): the fast path awaits retrieval and Gemini without tying up a
+        thread; crew mode runs the (synchronous) crew through kickoff_async.
+        """
+        if mode not in ANSWER_MODES:
+            raise ValueError(f"mode must be one of {ANSWER_MODES}, got {mode!r}")
+        fast = mode == "fast" or (mode == "auto" and not is_complex(question))
+        with span("answer", mode=mode, path="fast" if fast else "crew", is_async=True):
+            if fast:
+                return await aanswer_directly(question, character, pdf_path=self.pdf_path)
+
+            async def kickoff():
+                crew, inputs = self._crew_for(question, character)
+                with self._kickoff_span(character, persona=bool(inputs["persona"])):
+                    return str(await crew.kickoff_async(inputs=inputs))
+
+            # the key embeds and searches the question: on the search pool, not the loop
+            key = await run_in_search_pool(self._crew_cache_key, question, character)
+            if key is None:
+                return await kickoff()
+            return await get_response_cache().aget_or_compute(key, kickoff, "crew")
+
+    async def aanswer_stream(self, question: str, character: str, mode: str = "auto"):
+        """Async answer_stream(); crew mode falls back to one piece once the crew is done."""
+        if mode not in ANSWER_MODES:
+            raise ValueError(f"mode must be one of {ANSWER_MODES}, got {mode!r}")
+        if mode == "fast" or (mode == "auto" and not is_complex(question)):
+            async for piece in astream_directly(question, character, pdf_path=self.pdf_path):
+                yield piece
+            return
+        yield await self.aanswer(question, character, mode="crew")
+
+    def answer_stream(self, question: str, character: str, mode: str = "auto"):
+        """
+        Like answer(), but yields the response text as it is generated.
+        In crew mode only the final agent streams; earlier agents run as usual.
+        """
+        if mode not in ANSWER_MODES:
+            raise ValueError(f"mode must be one of {ANSWER_MODES}, got {mode!r}")
+        if mode == "fast" or (mode == "auto" and not is_complex(question)):
+            yield from stream_directly(question, character, pdf_path=self.pdf_path)
+            return
+
+        key = self._crew_cache_key(question, character)
+        cached = get_response_cache().get(key) if key else None
+        if cached is not None:
+            yield cached
+            return
+
+        # a fresh crew so the streaming LLM is wired into its final agent only
+        llm = LLM(model=self._agent_model("response_generation_agent"), stream=True)
+        streaming_crew = HarryPotterRAGCrew(self.pdf_path, str(self.config_dir), stream_llm=llm)
+        pieces = []
+        crew, inputs = streaming_crew._crew_for(question, character)
+        with streaming_crew._kickoff_span(character, streaming=True, persona=bool(inputs["persona"])):
+            for piece in stream_kickoff(crew, llm, inputs):
+                pieces.append(piece)
+                yield piece
+        if key:
+            get_response_cache().put(key, "".join(pieces).strip(), "crew")
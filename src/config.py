@@ -1,35 +1,243 @@
 import os
-from dotenv import load_dotenv
-import yaml
-import google.generativeai as genai
+import threading
 
-# Load environment variables
-load_dotenv()
+# Nothing here touches the network or the environment at import time: .env is
+# read and Gemini configured on first use (get_gemini_api_key / configure_genai),
+# so CLI tools, health checks and worker forks import this module for free.
+_env_lock = threading.Lock()
+_env_loaded = False
+_genai_configured = False
 
-# Configure Gemini API
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise ValueError("Please set GEMINI_API_KEY in .env file")
 
-genai.configure(api_key=GEMINI_API_KEY)
+def load_env():
+    """Load .env into os.environ (once per process)."""
+    global _env_loaded
+    with _env_lock:
+        if not _env_loaded:
+            from dotenv import load_dotenv
+            load_dotenv()
+            _env_loaded = True
+
+
+def get_gemini_api_key() -> str:
+    load_env()
+    key = os.getenv("GEMINI_API_KEY")
+    if not key:
+        raise ValueError("Please set GEMINI_API_KEY in .env file")
+    return key
+
+
+def configure_genai():
+    """Configure google.generativeai with GEMINI_API_KEY (once) and return the module."""
+    global _genai_configured
+    import google.generativeai as genai
+    if not _genai_configured:
+        genai.configure(api_key=get_gemini_api_key())
+        _genai_configured = True
+    return genai
+
+
+def __getattr__(name):
+    # `from src.config import GEMINI_API_KEY` keeps working, resolved lazily
+    if name == "GEMINI_API_KEY":
+        return get_gemini_api_key()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # File paths
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
 PDF_PATH = os.path.join(DATA_DIR, "harry_potter.pdf")
+# Multi-book corpus: the books, their editions' header/footer rules and chapter
+# heading pattern. Each book gets its own index shard (INDEX_FOLDER/shards/<id>),
+# so adding a book builds only that shard. Without the file the corpus is PDF_PATH.
+CORPUS_MANIFEST = os.path.join(DATA_DIR, "corpus.yaml")
+CORPUS_WORKERS = 4       # shards built / searched concurrently
 AGENT_CONFIG_PATH = os.path.join(os.path.dirname(__file__), "agents", "agent_config.yaml")
 TASK_CONFIG_PATH = os.path.join(os.path.dirname(__file__), "tasks", "task_config.yaml")
 
 
 # Helper functions for loading YAML configs
 def load_agent_config():
+    import yaml
     with open(AGENT_CONFIG_PATH, 'r') as f:
         return yaml.safe_load(f)
 
 def load_task_config():
+    import yaml
     with open(TASK_CONFIG_PATH, 'r') as f:
         return yaml.safe_load(f)
 
 # Vector store configuration
-CHUNK_SIZE = 1000
-CHUNK_OVERLAP = 200
-EMBEDDING_MODEL = "all-MiniLM-L6-v2"
\ No newline at end of file
+# Final chunk size/overlap in characters, cut in a single pass by
+# PDFProcessor.chunk_spans; 512 chars (~120 word pieces) stays well inside
+# the embedding model's 256-token window, so no chunk is truncated.
+CHUNK_SIZE = 512
+CHUNK_OVERLAP = 100
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+# Embedding engine: texts per encoder call and the persistent (model, text hash) cache
+CACHE_DIR = os.path.join(os.path.dirname(DATA_DIR), ".cache")
+EMBEDDING_BATCH_SIZE = 64
+EMBEDDING_CACHE_PATH = os.path.join(CACHE_DIR, "embeddings.sqlite")
+EMBEDDING_CACHE_MAX_ENTRIES = 200_000
+
+# PDF extraction: processes used to parse pages (None → os.cpu_count()) and pages per task
+EXTRACT_WORKERS = None
+EXTRACT_BATCH_PAGES = 8
+
+# Query-result cache: LRU size, TTL in seconds, and the cosine similarity at which
+# a new query reuses a cached one's results (None disables near-duplicate reuse)
+QUERY_CACHE_SIZE = 1024
+QUERY_CACHE_TTL = 3600
+QUERY_CACHE_SIMILARITY = None
+
+# LLM response cache (SQLite): answers keyed by normalized question, character,
+# retrieved chunks and model settings. Entries are fresh for RESPONSE_CACHE_TTL
+# seconds; for RESPONSE_CACHE_STALE_TTL seconds after that a stale answer is
+# still returned while a background call refreshes it (0 disables that).
+# Least recently used entries go once the cache grows past RESPONSE_CACHE_MAX_BYTES.
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_PATH = os.path.join(CACHE_DIR, "responses.sqlite")
+RESPONSE_CACHE_TTL = 24 * 3600
+RESPONSE_CACHE_STALE_TTL = 0
+RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# On-disk index format: "mmap" (memory-mapped vectors + columnar chunk store, no pickle)
+# or "faiss" (LangChain's index.faiss + pickled index.pkl docstore)
+INDEX_FORMAT = "mmap"
+
+# Search index over the mmap store: "flat" (exact), "ivfpq", "hnsw" or "sq8" (int8 scalar-quantized).
+# Compare them on the current corpus with: python -m src.utils.ann_index
+INDEX_TYPE = "flat"
+IVF_NLIST = 256          # inverted lists (capped at n_chunks / 39)
+IVF_NPROBE = 16          # lists scanned per query
+PQ_M = 16                # PQ sub-quantizers; must divide the embedding dim (384)
+PQ_NBITS = 8
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+
+# Retrieval mode: "vector" or "hybrid" (BM25 + vector, reciprocal-rank fusion)
+SEARCH_MODE = "vector"
+HYBRID_CANDIDATES = 50   # rows taken from each ranking before fusion
+RRF_K = 60
+# Query expansion: the search tool also searches rewrites of the query with a
+# name swapped for the other names of the same person or thing below (plus any
+# variants the agent passes), up to QUERY_EXPANSION_MAX phrasings in total. All
+# of them are embedded in one batch, searched in one batched index call and
+# fused into one deduplicated top-k. Off by default until it shows a recall
+# gain on the golden set (python -m benchmarks.retrieval_benchmark --expansion);
+# only unambiguous names are listed, since a generic one ("the mirror") rewrites
+# unrelated questions.
+QUERY_EXPANSION = False
+QUERY_EXPANSION_MAX = 4
+QUERY_ALIASES = [
+    ["Voldemort", "You-Know-Who", "Tom Riddle", "He-Who-Must-Not-Be-Named", "the Dark Lord"],
+    ["Dumbledore", "Albus Dumbledore"],
+    ["Hagrid", "Rubeus Hagrid", "Keeper of Keys"],
+    ["McGonagall", "Professor McGonagall", "Minerva McGonagall"],
+    ["Snape", "Professor Snape", "Severus Snape"],
+    ["Quirrell", "Professor Quirrell"],
+    ["Malfoy", "Draco Malfoy", "Draco"],
+    ["Philosopher's Stone", "Sorcerer's Stone"],
+]
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Optional rerank stage: take RERANK_CANDIDATES hits, rescore (query, chunk) pairs
+# with a small CPU cross-encoder in batches of RERANK_BATCH_SIZE and keep the top-k.
+# Reranking stops early rather than exceed RERANK_BUDGET_MS per query (None: no
+# limit); scores are cached in memory for RERANK_CACHE_SIZE (query, chunk) pairs.
+RERANK_ENABLED = False
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_CANDIDATES = 50
+RERANK_BATCH_SIZE = 16
+RERANK_BUDGET_MS = 200
+RERANK_CACHE_SIZE = 20_000
+# Context assembly before prompts: retrieved chunks are merged (the CHUNK_OVERLAP
+# text is dropped, touching chunks of one chapter joined) and, past
+# CONTEXT_TOKEN_BUDGET (~4 chars per token), trimmed to the sentences closest to
+# the query. CONTEXT_SCORER: "embedding" (one batch through the shared
+# embedding engine) or "lexical" (idf-weighted term overlap, no model call).
+# Sentence vectors are kept in an in-memory LRU of CONTEXT_SENTENCE_CACHE entries
+# rather than the persistent embedding cache, which they would crowd out.
+CONTEXT_COMPRESSION = True
+CONTEXT_TOKEN_BUDGET = 400
+CONTEXT_SCORER = "embedding"
+CONTEXT_SENTENCE_CACHE = 20_000
+# Characters offered in the app, with the names the books use for them as a
+# speaker ("said Hagrid"). Persona profiles (python -m src.utils.persona_profiles)
+# are mined from the indexed corpus for each: dialogue style, signature words,
+# descriptions and up to PERSONA_QUOTES example lines. The crew uses a profile
+# instead of its character-analysis call when the character has at least
+# PERSONA_MIN_LINES attributed lines; profiles are rebuilt when the index changes.
+CHARACTERS = {
+    "Harry Potter": ["Harry", "Harry Potter", "Potter"],
+    "Hermione Granger": ["Hermione", "Hermione Granger"],
+    "Ron Weasley": ["Ron", "Ron Weasley"],
+    "Albus Dumbledore": ["Dumbledore", "Professor Dumbledore", "Albus Dumbledore"],
+    "Severus Snape": ["Snape", "Professor Snape", "Severus Snape"],
+    "Draco Malfoy": ["Malfoy", "Draco", "Draco Malfoy"],
+    "Luna Lovegood": ["Luna", "Luna Lovegood"],
+    "Rubeus Hagrid": ["Hagrid", "Rubeus Hagrid"],
+    "Minerva McGonagall": ["McGonagall", "Professor McGonagall", "Minerva McGonagall"],
+    "Sirius Black": ["Sirius", "Sirius Black", "Black"],
+}
+PERSONA_PROFILES = True
+PERSONA_QUOTES = 6
+PERSONA_MIN_LINES = 5
+# Threads the async path (Retriever.asearch) offloads embedding + search onto;
+# None lets ThreadPoolExecutor pick min(32, cpu_count + 4)
+SEARCH_WORKERS = None
+
+# Background answer jobs (Streamlit): concurrent workers, queued-job limit, and
+# how long finished jobs are kept for their session to pick up
+JOB_WORKERS = 4
+JOB_MAX_QUEUED = 16
+JOB_RETENTION_SECONDS = 600
+
+# Headless HTTP server (python server.py): concurrent searches are micro-batched
+# (up to SERVER_BATCH_MAX queries, the first waiting at most SERVER_BATCH_WAIT_MS);
+# beyond the pending/in-flight limits requests are refused with 503 + Retry-After
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8000
+SERVER_BATCH_MAX = 32
+SERVER_BATCH_WAIT_MS = 5
+SERVER_MAX_PENDING_SEARCHES = 256
+SERVER_MAX_INFLIGHT_ANSWERS = 8
+
+# Tracing: spans for tool setup, index load/build, query embedding, search,
+# rerank, Gemini calls (with token counts) and crew tasks. Off by default (a
+# disabled span costs one attribute check); `python server.py --trace` or
+# src.utils.tracing.enable_tracing() turn it on. Spans go to TRACE_PATH as JSONL;
+# per-stage metrics (latency percentiles over the last TRACE_SAMPLES spans) are
+# served at GET /metrics.
+TRACE_ENABLED = False
+TRACE_PATH = os.path.join(CACHE_DIR, "traces.jsonl")
+TRACE_SAMPLES = 1000
+
+# Outbound calls. HTTP (the Gemini embedding endpoint) goes through one pooled
+# keep-alive session per process with (connect, read) timeouts; 429/5xx and
+# timeouts are retried with jittered exponential backoff (Retry-After wins).
+# Idempotent calls are hedged: a duplicate is sent if the first has not
+# answered after HTTP_HEDGE_AFTER_MS (None disables hedging).
+HTTP_TIMEOUT_S = 30
+HTTP_CONNECT_TIMEOUT_S = 5
+HTTP_POOL_SIZE = 16
+HTTP_MAX_RETRIES = 4
+HTTP_BACKOFF_BASE_S = 0.5
+HTTP_BACKOFF_MAX_S = 20
+HTTP_HEDGE_AFTER_MS = 1500
+EMBEDDING_HTTP_BATCH = 64   # texts per embedding request
+# Gemini generation: token-bucket rate limit shared by the process, concurrent
+# calls (a stream holds its slot until drained), per-call timeout. Retries as above.
+# The limiter is off (None) so it never caps below the real quota; set it to your
+# project's quota in requests/second, e.g. 15 requests/minute -> 0.25, LLM_BURST
+# being how many may go out back to back.
+LLM_RATE_PER_S = None
+LLM_BURST = 5
+LLM_MAX_CONCURRENCY = 8
+LLM_TIMEOUT_S = 60
+
+# Startup: `python -m benchmarks.startup_profile` fails if importing any of the
+# light entry modules (config, retriever, fast path, server) takes longer than this
+STARTUP_IMPORT_BUDGET_S = 0.5
@@ -0,0 +1,192 @@
+import os
+import json
+import time
+import argparse
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from src.config import (
+    INDEX_TYPE,
+    IVF_NLIST,
+    IVF_NPROBE,
+    PQ_M,
+    PQ_NBITS,
+    HNSW_M,
+    HNSW_EF_CONSTRUCTION,
+    HNSW_EF_SEARCH,
+)
+
+ANN_INDEX_FILE = "ann.faiss"
+ANN_INFO_FILE = "ann.json"
+INDEX_TYPES = ("flat", "ivfpq", "hnsw", "sq8")
+
+
+def index_params(index_type: str = INDEX_TYPE) -> Dict[str, Any]:
+    """Build/search parameters for an index type, taken from src/config.py."""
+    if index_type == "ivfpq":
+        return {"nlist": IVF_NLIST, "nprobe": IVF_NPROBE, "m": PQ_M, "nbits": PQ_NBITS}
+    if index_type == "hnsw":
+        return {"m": HNSW_M, "ef_construction": HNSW_EF_CONSTRUCTION, "ef_search": HNSW_EF_SEARCH}
+    if index_type in ("flat", "sq8"):
+        return {}
+    raise ValueError(f"Unknown INDEX_TYPE {index_type!r}; expected one of {INDEX_TYPES}")
+
+
+def build_ann_index(vectors: np.ndarray, index_type: str = INDEX_TYPE,
+                    params: Optional[Dict[str, Any]] = None):
+    """Train (if needed) and fill a FAISS index of the given type with `vectors`."""
+    import faiss
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, dim = vectors.shape
+    params = dict(index_params(index_type), **(params or {}))
+
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "sq8":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, params["m"])
+        index.hnsw.efConstruction = params["ef_construction"]
+    elif index_type == "ivfpq":
+        # k-means wants ~39 training points per list; shrink nlist on small corpora
+        nlist = max(1, min(params["nlist"], n // 39))
+        m = params["m"]
+        if dim % m:
+            raise ValueError(f"PQ_M={m} must divide the embedding dimension {dim}")
+        # same for the 2**nbits PQ centroids per sub-quantizer
+        nbits = params["nbits"]
+        while nbits > 4 and n < 39 * 2 ** nbits:
+            nbits -= 1
+        quantizer = faiss.IndexFlatL2(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, m, nbits)
+    else:
+        index_params(index_type)  # raises
+
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    configure_search(index, index_type, params)
+    return index
+
+
+def configure_search(index, index_type: str, params: Dict[str, Any]):
+    if index_type == "ivfpq":
+        index.nprobe = params["nprobe"]
+    elif index_type == "hnsw":
+        index.hnsw.efSearch = params["ef_search"]
+
+
+def load_or_build_ann(folder: str, vectors: np.ndarray, source_hash: str,
+                      index_type: str = INDEX_TYPE):
+    """
+    Return the ANN index saved in `folder` if it matches the source hash and
+    current parameters, otherwise build it and save it (faiss's own format, no pickle).
+    """
+    import faiss
+
+    params = index_params(index_type)
+    signature = {"index_type": index_type, "params": params,
+                 "source_hash": source_hash, "count": int(len(vectors))}
+    index_path = os.path.join(folder, ANN_INDEX_FILE)
+    info_path = os.path.join(folder, ANN_INFO_FILE)
+    try:
+        with open(info_path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        saved = None
+
+    if saved == signature and os.path.exists(index_path):
+        index = faiss.read_index(index_path)
+        configure_search(index, index_type, params)
+        return index
+
+    print(f"🔄 Building {index_type} index over {len(vectors)} vectors...")
+    index = build_ann_index(vectors, index_type, params)
+    faiss.write_index(index, index_path)
+    with open(info_path, "w", encoding="utf-8") as f:
+        json.dump(signature, f)
+    return index
+
+
+def recall_report(vectors: np.ndarray, queries: np.ndarray,
+                  index_types: Sequence[str] = INDEX_TYPES,
+                  ks: Sequence[int] = (1, 5, 10)) -> List[Dict[str, Any]]:
+    """
+    recall@k and per-query latency of each index type, measured against the
+    exact flat index on the same vectors.
+    """
+    import faiss
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    max_k = max(ks)
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, max_k)
+
+    rows = []
+    for index_type in index_types:
+        start = time.perf_counter()
+        index = build_ann_index(vectors, index_type)
+        build_s = time.perf_counter() - start
+
+        latencies = []
+        found = np.empty((len(queries), max_k), dtype=np.int64)
+        # one query at a time, as the retriever searches
+        for i, q in enumerate(queries):
+            t0 = time.perf_counter()
+            _, ids = index.search(q[None], max_k)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            found[i] = ids[0]
+
+        row = {
+            "index_type": index_type,
+            "params": index_params(index_type),
+            "build_s": round(build_s, 4),
+            "latency_ms_p50": round(float(np.percentile(latencies, 50)), 4),
+            "latency_ms_p95": round(float(np.percentile(latencies, 95)), 4),
+        }
+        for k in ks:
+            hits = sum(len(set(found[i, :k]) & set(truth[i, :k])) for i in range(len(queries)))
+            row[f"recall@{k}"] = round(hits / (k * len(queries)), 4)
+        rows.append(row)
+    return rows
+
+
+def sample_queries(vectors: np.ndarray, n: int = 200, noise: float = 0.05,
+                   seed: int = 0) -> np.ndarray:
+    """Perturbed copies of stored vectors, used when no real query set is given."""
+    rng = np.random.default_rng(seed)
+    picks = vectors[rng.choice(len(vectors), size=min(n, len(vectors)), replace=False)]
+    scale = noise * float(np.linalg.norm(picks, axis=1).mean()) / np.sqrt(vectors.shape[1])
+    return (picks + rng.normal(0, scale, picks.shape)).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="recall@k vs latency for each index type")
+    parser.add_argument("--queries", type=int, default=200, help="number of sampled queries")
+    parser.add_argument("--types", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES)
+    parser.add_argument("--out", help="write the report as JSON to this path")
+    args = parser.parse_args()
+
+    from src.utils.retriever import warm_up
+    from src.utils.mmap_store import MmapVectorStore
+
+    # every book shard of the corpus, stacked
+    vectors = np.concatenate([
+        np.asarray(vs.vectors) if isinstance(vs, MmapVectorStore)
+        else vs.index.reconstruct_n(0, vs.index.ntotal)
+        for vs in warm_up().stores()
+    ])
+
+    rows = recall_report(vectors, sample_queries(vectors, args.queries), args.types)
+    print(json.dumps(rows, indent=2))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
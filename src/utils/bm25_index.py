@@ -0,0 +1,141 @@
+import os
+import re
+import json
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.config import BM25_K1, BM25_B
+
+BM25_INFO_FILE = "bm25.json"
+BM25_DOCS_FILE = "bm25_docs.npy"
+BM25_TFS_FILE = "bm25_tfs.npy"
+BM25_DOCLEN_FILE = "bm25_doclen.npy"
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:['’][a-z]+)?")
+STOPWORDS = frozenset(
+    "a an and are as at be but by did do does for from had has have he her him his how i if in "
+    "into is it its me my no not of on or our she so that the their them then there they this "
+    "to was we were what when where which who whom why will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens, possessives folded ("Harry's" -> "harry"), stopwords dropped."""
+    tokens = []
+    for tok in TOKEN_PATTERN.findall(text.lower()):
+        tok = re.sub(r"['’]s$", "", tok)
+        if tok and tok not in STOPWORDS:
+            tokens.append(tok)
+    return tokens
+
+
+class BM25Index:
+    """
+    Okapi BM25 over the indexed chunks, stored as a prebuilt inverted index:
+    bm25.json maps each term to a slice of the postings arrays, and
+    bm25_docs.npy / bm25_tfs.npy hold (row, term frequency) postings.
+    Rows are the same row numbers as the vector store.
+    """
+
+    def __init__(self, folder: str):
+        with open(os.path.join(folder, BM25_INFO_FILE), "r", encoding="utf-8") as f:
+            info = json.load(f)
+        self.info = info
+        self.terms: Dict[str, Tuple[int, int]] = {t: tuple(v) for t, v in info["terms"].items()}
+        self.avgdl: float = info["avgdl"]
+        self.docs = np.load(os.path.join(folder, BM25_DOCS_FILE), mmap_mode="r")
+        self.tfs = np.load(os.path.join(folder, BM25_TFS_FILE), mmap_mode="r")
+        self.doclen = np.asarray(np.load(os.path.join(folder, BM25_DOCLEN_FILE)), dtype=np.float32)
+        # the length-normalisation term depends only on the document
+        self._norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doclen / max(self.avgdl, 1e-9))
+
+    @staticmethod
+    def read_info(folder: str) -> Optional[dict]:
+        try:
+            with open(os.path.join(folder, BM25_INFO_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def build(folder: str, texts: Iterable[str], source_hash: str = "") -> None:
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        doclen = []
+        for row, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doclen.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((row, tf))
+
+        terms = {}
+        docs, tfs = [], []
+        for term in sorted(postings):
+            plist = postings[term]
+            terms[term] = [len(docs), len(plist)]
+            docs.extend(r for r, _ in plist)
+            tfs.extend(tf for _, tf in plist)
+
+        os.makedirs(folder, exist_ok=True)
+        np.save(os.path.join(folder, BM25_DOCS_FILE), np.asarray(docs, dtype=np.int32), allow_pickle=False)
+        np.save(os.path.join(folder, BM25_TFS_FILE), np.asarray(tfs, dtype=np.float32), allow_pickle=False)
+        np.save(os.path.join(folder, BM25_DOCLEN_FILE), np.asarray(doclen, dtype=np.int32), allow_pickle=False)
+        with open(os.path.join(folder, BM25_INFO_FILE), "w", encoding="utf-8") as f:
+            json.dump({
+                "count": len(doclen),
+                "avgdl": float(np.mean(doclen)) if doclen else 0.0,
+                "source_hash": source_hash,
+                "terms": terms,
+            }, f)
+
+    def __len__(self) -> int:
+        return len(self.doclen)
+
+    def scores(self, query: str) -> np.ndarray:
+        n = len(self)
+        scores = np.zeros(n, dtype=np.float32)
+        for term in set(tokenize(query)):
+            span = self.terms.get(term)
+            if span is None:
+                continue
+            start, df = span
+            docs = self.docs[start:start + df]
+            tf = self.tfs[start:start + df]
+            idf = np.log(1 + (n - df + 0.5) / (df + 0.5))
+            # a term appears once per posting list, so plain fancy-index += is safe
+            scores[docs] += idf * tf * (BM25_K1 + 1) / (tf + self._norm[docs])
+        return scores
+
+    def search_rows(self, query: str, k: int = 10,
+                    mask: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Top-k (row, score) pairs; rows with no matching term (or outside mask) are left out."""
+        scores = self.scores(query)
+        if mask is not None:
+            scores[~mask] = 0
+        hits = np.flatnonzero(scores)
+        if not len(hits):
+            return []
+        k = min(k, len(hits))
+        top = hits[np.argpartition(-scores[hits], k - 1)[:k]] if k < len(hits) else hits
+        top = top[np.lexsort((top, -scores[top]))]
+        return [(int(i), float(scores[i])) for i in top]
+
+
+def load_or_build_bm25(folder: str, texts_fn, source_hash: str) -> BM25Index:
+    """Open the inverted index in `folder`, rebuilding it from texts_fn() if stale."""
+    info = BM25Index.read_info(folder)
+    if info is None or info.get("source_hash") != source_hash:
+        print("🔄 Building BM25 inverted index...")
+        BM25Index.build(folder, texts_fn(), source_hash)
+    return BM25Index(folder)
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = 60) -> List[int]:
+    """Fuse several ranked row lists: score(row) = sum 1 / (k + rank)."""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, start=1):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (k + rank)
+    # ties keep the order rows were first seen in
+    return sorted(fused, key=lambda r: -fused[r])
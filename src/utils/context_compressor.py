@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import re
+import math
+import threading
+from collections import Counter, OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.config import (
+    CHUNK_OVERLAP, CONTEXT_COMPRESSION, CONTEXT_TOKEN_BUDGET, CONTEXT_SCORER, CONTEXT_SENTENCE_CACHE,
+)
+from src.utils.bm25_index import tokenize
+from src.utils.tracing import span
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+# sentence ends: . ! ? (plus closing quotes/brackets) followed by whitespace
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])[\"'”’)\]]*\s+")
+# passages whose overlap is shorter than this are not glued by text matching
+MIN_TEXT_OVERLAP = 20
+ELLIPSIS = " … "
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough LLM token count (~4 characters per token for English prose)."""
+    return max(1, (len(text) + 3) // 4)
+
+
+def _group(doc: Document) -> Tuple[Any, Any]:
+    meta = doc.metadata or {}
+    return meta.get("book") or meta.get("source"), meta.get("chapter")
+
+
+def _text_overlap(left: str, right: str) -> int:
+    """Length of the longest suffix of `left` that starts `right` (chunk overlap left by the splitter)."""
+    for n in range(min(len(left), len(right), 2 * CHUNK_OVERLAP), MIN_TEXT_OVERLAP - 1, -1):
+        if left.endswith(right[:n]):
+            return n
+    return 0
+
+
+class _Passage:
+    __slots__ = ("text", "rank", "group", "start", "end")
+
+    def __init__(self, doc: Document, rank: int):
+        meta = doc.metadata or {}
+        self.text = doc.page_content.strip()
+        self.rank = rank
+        self.group = _group(doc)
+        self.start: Optional[int] = meta.get("start")
+        self.end: Optional[int] = meta.get("end")
+
+    def absorb(self, other: "_Passage") -> bool:
+        """Merge `other` into this passage if they overlap or touch; False if they do not."""
+        if other.group != self.group:
+            return False
+        if other.text in self.text:
+            self.rank = min(self.rank, other.rank)
+            return True
+        if None not in (self.start, self.end, other.start, other.end):
+            # offsets into the cleaned text (set by the chunker): exact merge
+            first, second = (self, other) if self.start <= other.start else (other, self)
+            if second.start > first.end + 2:
+                return False
+            tail = second.text[max(0, first.end - second.start):] if second.end > first.end else ""
+            self.text = first.text + (" " if tail and second.start >= first.end else "") + tail
+            self.start, self.end = first.start, max(first.end, second.end)
+        else:
+            n = _text_overlap(self.text, other.text)
+            if n:
+                self.text += other.text[n:]
+            else:
+                n = _text_overlap(other.text, self.text)
+                if not n:
+                    return False
+                self.text = other.text + self.text[n:]
+        self.rank = min(self.rank, other.rank)
+        return True
+
+
+def merge_passages(docs: Sequence[Document]) -> List[str]:
+    """
+    Retrieved chunks as passages: exact duplicates and the chunk overlap are
+    removed and chunks that touch in the same chapter are joined. Passages
+    keep the order of their best-ranked chunk.
+    """
+    passages: List[_Passage] = []
+    for rank, doc in enumerate(docs):
+        p = _Passage(doc, rank)
+        # joining two passages can make a third one touch the result
+        while True:
+            host = next((q for q in passages if q.absorb(p)), None)
+            if host is None:
+                break
+            passages.remove(host)
+            p = host
+        passages.append(p)
+    passages.sort(key=lambda q: q.rank)
+    return [p.text for p in passages]
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in SENTENCE_SPLIT.split(text) if s.strip()]
+
+
+def _lexical_scores(query: str, sentences: Sequence[str]) -> np.ndarray:
+    """Query-term overlap weighted by idf across the candidate sentences."""
+    q_terms = set(tokenize(query))
+    docs = [set(tokenize(s)) for s in sentences]
+    df = Counter(t for d in docs for t in d)
+    n = len(docs)
+    return np.array([
+        sum(math.log(1 + n / df[t]) for t in q_terms & d) / math.sqrt(1 + len(d))
+        for d in docs
+    ])
+
+
+class _SentenceVectors:
+    """
+    In-memory LRU of sentence embeddings. Sentences are scored once per prompt
+    and rarely matter again, so they stay out of the persistent embedding cache.
+    """
+
+    def __init__(self, max_size: int = CONTEXT_SENTENCE_CACHE):
+        self.max_size = max_size
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embed(self, service, sentences: Sequence[str]) -> np.ndarray:
+        out: List[Optional[np.ndarray]] = [None] * len(sentences)
+        with self._lock:
+            for i, sent in enumerate(sentences):
+                vec = self._cache.get(sent)
+                if vec is not None:
+                    self._cache.move_to_end(sent)
+                    out[i] = vec
+        todo = list(dict.fromkeys(s for s, v in zip(sentences, out) if v is None))
+        if todo:
+            fresh = dict(zip(todo, np.asarray(service.embed_transient(todo), dtype=np.float32)))
+            with self._lock:
+                for sent, vec in fresh.items():
+                    self._cache[sent] = vec
+                while len(self._cache) > self.max_size:
+                    self._cache.popitem(last=False)
+            out = [v if v is not None else fresh[s] for s, v in zip(sentences, out)]
+        return np.stack(out)
+
+
+_sentence_vectors = _SentenceVectors()
+
+
+def _embedding_scores(query: str, sentences: Sequence[str]) -> np.ndarray:
+    """Cosine similarity of each sentence to the query (one encoder batch for the uncached sentences)."""
+    from src.utils.retriever import get_embeddings
+    service = get_embeddings()
+    # the query goes through the persistent cache (retrieval embedded it already)
+    q = np.asarray(service.embed_query(query), dtype=np.float32)
+    vectors = _sentence_vectors.embed(service, sentences)
+    q /= np.linalg.norm(q) + 1e-12
+    vectors = vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12)
+    return vectors @ q
+
+
+def compress_context(query: str, docs: Sequence[Document],
+                     budget_tokens: Optional[int] = CONTEXT_TOKEN_BUDGET,
+                     scorer: str = CONTEXT_SCORER) -> List[str]:
+    """
+    Passages for a prompt: merged (see merge_passages), then, if they exceed
+    `budget_tokens`, trimmed to the sentences most similar to the query that
+    fit. Kept sentences stay in reading order; gaps are marked with "…".
+    Every passage keeps at least its best sentence while the budget allows.
+    """
+    with span("context.compress", chunks=len(docs)) as s:
+        passages = merge_passages(docs)
+        before = sum(estimate_tokens(p) for p in passages)
+        s.set(passages=len(passages), tokens_in=before)
+        if not budget_tokens or before <= budget_tokens:
+            s.set(tokens_out=before)
+            return passages
+
+        sentences = [(i, j, sent) for i, p in enumerate(passages) for j, sent in enumerate(split_sentences(p))]
+        texts = [sent for _, _, sent in sentences]
+        scores = _embedding_scores(query, texts) if scorer == "embedding" else _lexical_scores(query, texts)
+
+        # each passage's best sentence first (in passage order), then the rest by score
+        order = sorted(range(len(sentences)), key=lambda k: -scores[k])
+        best: Dict[int, int] = {}
+        for k in order:
+            best.setdefault(sentences[k][0], k)
+        ranked = [best[i] for i in sorted(best)] + [k for k in order if k not in set(best.values())]
+
+        kept, used = set(), 0
+        for k in ranked:
+            cost = estimate_tokens(texts[k]) + 1  # + the joining space or "…"
+            if used + cost > budget_tokens:
+                continue
+            kept.add(k)
+            used += cost
+
+        out: List[str] = []
+        for i in range(len(passages)):
+            picked = [(j, texts[k]) for k, (pi, j, _) in enumerate(sentences) if pi == i and k in kept]
+            if not picked:
+                continue
+            text, prev = "", None
+            for j, sent in picked:
+                if prev is not None:
+                    text += " " if j == prev + 1 else ELLIPSIS
+                text += sent
+                prev = j
+            out.append(text)
+        s.set(tokens_out=sum(estimate_tokens(p) for p in out))
+        return out
+
+
+def context_passages(query: Optional[str], docs: Sequence[Document],
+                     compress: bool = CONTEXT_COMPRESSION) -> List[str]:
+    """The passage texts a prompt gets: compressed for `query`, or the chunks as retrieved."""
+    if not compress or not query or not docs:
+        return [doc.page_content for doc in docs]
+    return compress_context(query, docs)
+
+
+def format_passages(docs: Sequence[Document], query: Optional[str] = None) -> str:
+    """The search results as the retrieval tool hands them to the agents."""
+    if not docs:
+        return "No relevant passages found."
+    # overlap removed, touching chunks joined, trimmed to the query's budget
+    return "\n---\n".join(context_passages(query, docs))
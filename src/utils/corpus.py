@@ -0,0 +1,87 @@
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+from src.config import CORPUS_MANIFEST, PDF_PATH
+
+
+class BookSpec:
+    """One document of the corpus: where it lives and how its edition is cleaned."""
+
+    def __init__(self, book_id: str, path: str, title: str = "", edition: str = "",
+                 header_patterns: Optional[List[str]] = None,
+                 footer_patterns: Optional[List[str]] = None,
+                 chapter_pattern: Optional[str] = None):
+        self.id = book_id
+        self.path = path
+        self.title = title or book_id
+        self.edition = edition
+        self.header_patterns = header_patterns
+        self.footer_patterns = footer_patterns
+        self.chapter_pattern = chapter_pattern
+
+    def processor_options(self) -> Dict[str, Any]:
+        """Keyword arguments for PDFProcessor."""
+        return {
+            "header_patterns": self.header_patterns,
+            "footer_patterns": self.footer_patterns,
+            "chapter_pattern": self.chapter_pattern,
+            "book": self.title,
+        }
+
+    def __repr__(self) -> str:
+        return f"BookSpec({self.id!r}, {self.path!r})"
+
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-") or "book"
+
+
+def load_corpus(path: str = CORPUS_MANIFEST, skip_missing: bool = True) -> List[BookSpec]:
+    """
+    Books listed in the corpus manifest, each with its edition's cleaning rules
+    merged in: a book's header/footer patterns are tried before its
+    edition's, its chapter_pattern replaces the edition's. Relative paths are
+    resolved against the manifest's folder; books whose file is missing are
+    skipped with a warning. Without a manifest the corpus is just PDF_PATH.
+    """
+    if not os.path.exists(path):
+        return [BookSpec(_slug(os.path.splitext(os.path.basename(PDF_PATH))[0]), PDF_PATH)]
+
+    import yaml
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = yaml.safe_load(f) or {}
+
+    editions: Dict[str, Dict[str, Any]] = manifest.get("editions") or {}
+    base = os.path.dirname(os.path.abspath(path))
+    books, seen = [], set()
+    for entry in manifest.get("books") or []:
+        edition = entry.get("edition", "")
+        if edition and edition not in editions:
+            raise ValueError(f"Book {entry.get('id') or entry.get('path')!r} uses unknown edition {edition!r}")
+        rules = dict(editions.get(edition, {}))
+        for key in ("header_patterns", "footer_patterns"):
+            if entry.get(key):
+                rules[key] = list(entry[key]) + list(rules.get(key) or [])
+        if entry.get("chapter_pattern"):
+            rules["chapter_pattern"] = entry["chapter_pattern"]
+
+        book_path = os.path.join(base, entry["path"])
+        book_id = entry.get("id") or _slug(os.path.splitext(os.path.basename(book_path))[0])
+        if book_id in seen:
+            raise ValueError(f"Duplicate book id {book_id!r} in {path}")
+        seen.add(book_id)
+        if not os.path.exists(book_path):
+            if skip_missing:
+                print(f"⚠️ Skipping {book_id}: {book_path} not found.")
+                continue
+            raise FileNotFoundError(book_path)
+        books.append(BookSpec(
+            book_id, book_path, title=entry.get("title", ""), edition=edition,
+            header_patterns=rules.get("header_patterns"),
+            footer_patterns=rules.get("footer_patterns"),
+            chapter_pattern=rules.get("chapter_pattern"),
+        ))
+    if not books:
+        raise FileNotFoundError(f"None of the books in {path} were found.")
+    return books
@@ -0,0 +1,95 @@
+import queue
+import threading
+import contextvars
+from typing import Any, Dict, Iterator
+
+FINAL_ANSWER_MARKER = "Final Answer:"
+
+_DONE = object()
+# id(LLM instance) -> queue receiving that LLM's stream chunks
+_routes: Dict[int, "queue.Queue"] = {}
+_routes_lock = threading.Lock()
+_installed = False
+
+
+def _install_handler():
+    """Register one process-wide LLMStreamChunkEvent handler that routes by LLM instance."""
+    global _installed
+    with _routes_lock:
+        if _installed:
+            return
+        try:
+            from crewai.events import crewai_event_bus, LLMStreamChunkEvent
+        except ImportError:  # older crewai
+            from crewai.utilities.events import crewai_event_bus
+            from crewai.utilities.events.llm_events import LLMStreamChunkEvent
+
+        @crewai_event_bus.on(LLMStreamChunkEvent)
+        def _on_chunk(source, event):
+            q = _routes.get(id(source))
+            if q is not None:
+                q.put(event.chunk)
+
+        _installed = True
+
+
+def _final_answer_only(chunks: Iterator[str]) -> Iterator[str]:
+    """Drop the agent's 'Thought: ...' preamble; stream what follows 'Final Answer:'."""
+    buffer = ""
+    streaming = False
+    for chunk in chunks:
+        if streaming:
+            yield chunk
+            continue
+        buffer += chunk
+        pos = buffer.find(FINAL_ANSWER_MARKER)
+        if pos >= 0:
+            streaming = True
+            rest = buffer[pos + len(FINAL_ANSWER_MARKER):].lstrip()
+            if rest:
+                yield rest
+
+
+def stream_kickoff(crew, llm, inputs: Dict[str, Any]) -> Iterator[str]:
+    """
+    Run crew.kickoff in a worker thread and yield the final answer's tokens as
+    `llm` (the streaming LLM of the last agent) emits them. Falls back to the
+    complete result if nothing was streamed.
+    """
+    _install_handler()
+    chunks: "queue.Queue" = queue.Queue()
+    outcome: Dict[str, Any] = {}
+
+    def run():
+        try:
+            outcome["result"] = crew.kickoff(inputs=inputs)
+        except Exception as e:
+            outcome["error"] = e
+        finally:
+            chunks.put(_DONE)
+
+    with _routes_lock:
+        _routes[id(llm)] = chunks
+    try:
+        # the caller's context, so trace spans from the crew nest under its span
+        threading.Thread(target=contextvars.copy_context().run, args=(run,), daemon=True).start()
+
+        def drain():
+            while True:
+                item = chunks.get()
+                if item is _DONE:
+                    return
+                yield item
+
+        streamed = False
+        for text in _final_answer_only(drain()):
+            streamed = True
+            yield text
+    finally:
+        with _routes_lock:
+            _routes.pop(id(llm), None)
+
+    if "error" in outcome:
+        raise outcome["error"]
+    if not streamed:
+        yield str(outcome.get("result", ""))
@@ -0,0 +1,178 @@
+import os
+import time
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from src.config import (
+    EMBEDDING_MODEL,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_CACHE_PATH,
+    EMBEDDING_CACHE_MAX_ENTRIES,
+)
+from src.utils.index_manifest import hash_text
+
+
+def full_model_name(model_name: str) -> str:
+    return model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+
+
+class EmbeddingCache:
+    """
+    Persistent (model name, text hash) -> float32 vector cache in SQLite.
+    Least recently used rows are evicted once max_entries is exceeded. The row
+    count is kept in memory (seeded at open) so inserts never scan the table.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH,
+                 max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL,"
+                " last_used REAL NOT NULL, PRIMARY KEY (model, text_hash))"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+            )
+            self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model: str, hashes: Iterable[str]) -> Dict[str, List[float]]:
+        hashes = list(set(hashes))
+        found: Dict[str, List[float]] = {}
+        now = time.time()
+        with self._lock, self._conn:
+            # stay under SQLite's bound-parameter limit
+            for i in range(0, len(hashes), 500):
+                part = hashes[i:i + 500]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({marks})",
+                    [model, *part],
+                ).fetchall()
+                for h, blob in rows:
+                    found[h] = np.frombuffer(blob, dtype=np.float32).tolist()
+                if rows:
+                    self._conn.execute(
+                        f"UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash IN ({marks})",
+                        [now, model, *part],
+                    )
+        return found
+
+    def put_many(self, model: str, vectors: Dict[str, List[float]]):
+        if not vectors:
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            # a hash always maps to the same vector, so rows another process
+            # added meanwhile are kept and only counted as inserted when new
+            inserted = self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                [(model, h, np.asarray(v, dtype=np.float32).tobytes(), now) for h, v in vectors.items()],
+            ).rowcount
+            self._count += inserted
+            if self._count > self.max_entries:
+                self._evict()
+
+    def _evict(self):
+        # other processes may share the file: recount before trimming (rare)
+        (self._count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        if self._count <= self.max_entries:
+            return
+        # trim to 90% so we do not evict on every insert
+        excess = self._count - int(self.max_entries * 0.9)
+        self._count -= self._conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN "
+            "(SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,),
+        ).rowcount
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM embeddings")
+            self._count = 0
+
+
+class EmbeddingService(Embeddings):
+    """
+    SentenceTransformer embeddings with length-sorted batching and a persistent cache.
+    Implements LangChain's Embeddings interface so FAISS can use it directly.
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL,
+                 batch_size: int = EMBEDDING_BATCH_SIZE,
+                 cache: Optional[EmbeddingCache] = None):
+        self.model_name = full_model_name(model_name)
+        self.batch_size = batch_size
+        self.cache = cache
+        self._model = None
+        self._model_lock = threading.Lock()
+        # texts actually sent through the encoder vs served from cache
+        self.encoded = 0
+        self.cache_hits = 0
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from src.config import load_env
+                    load_env()  # HF_* settings may live in .env
+                    from sentence_transformers import SentenceTransformer
+                    self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        """Encode without the cache, sorting by length so each batch pads little."""
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        out: List[Optional[List[float]]] = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            idx = order[start:start + self.batch_size]
+            vecs = self.model.encode(
+                [texts[i] for i in idx],
+                batch_size=len(idx),
+                convert_to_numpy=True,
+                show_progress_bar=False,
+            )
+            for i, vec in zip(idx, vecs):
+                out[i] = vec.tolist()
+        self.encoded += len(texts)
+        return out
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        texts = [t.replace("\n", " ") for t in texts]
+        hashes = [hash_text(t) for t in texts]
+        known = self.cache.get_many(self.model_name, hashes) if self.cache is not None else {}
+
+        # encode each distinct uncached text once
+        todo: Dict[str, str] = {}
+        for h, t in zip(hashes, texts):
+            if h not in known and h not in todo:
+                todo[h] = t
+        self.cache_hits += len(texts) - sum(1 for h in hashes if h in todo)
+        if todo:
+            fresh = dict(zip(todo.keys(), self._encode(list(todo.values()))))
+            if self.cache is not None:
+                self.cache.put_many(self.model_name, fresh)
+            known.update(fresh)
+        return [known[h] for h in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def embed_transient(self, texts: List[str]) -> List[List[float]]:
+        """Embeddings for throwaway texts (e.g. sentences being scored): never written to the cache."""
+        return self._encode([t.replace("\n", " ") for t in texts]) if texts else []
@@ -0,0 +1,290 @@
+import time
+import random
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional, Union
+
+from src.config import (
+    HTTP_TIMEOUT_S,
+    HTTP_CONNECT_TIMEOUT_S,
+    HTTP_POOL_SIZE,
+    HTTP_MAX_RETRIES,
+    HTTP_BACKOFF_BASE_S,
+    HTTP_BACKOFF_MAX_S,
+    HTTP_HEDGE_AFTER_MS,
+)
+from src.utils.tracing import current_span
+
+# statuses worth another try: rate limited, or the server/gateway had a bad moment
+RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+
+
+class HTTPClientError(RuntimeError):
+    """A request that failed for good (non-retryable status, or out of retries)."""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter: `rate` tokens per second, at most `burst` saved
+    up. acquire() blocks until a token is free; wait_time() lets async code
+    sleep on the event loop instead.
+    """
+
+    def __init__(self, rate: Optional[float], burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited_s = 0.0
+
+    def wait_time(self, tokens: float = 1.0) -> float:
+        """Take `tokens` now (possibly going into debt); seconds to wait before using them."""
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            self._tokens -= tokens
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.waited_s += wait
+            return wait
+
+    def acquire(self, tokens: float = 1.0):
+        wait = self.wait_time(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: float = 1.0):
+        wait = self.wait_time(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, honouring Retry-After when the server sends one."""
+
+    def __init__(self, max_retries: int = HTTP_MAX_RETRIES, base_s: float = HTTP_BACKOFF_BASE_S,
+                 max_s: float = HTTP_BACKOFF_MAX_S):
+        self.max_retries = max_retries
+        self.base_s = base_s
+        self.max_s = max_s
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        if retry_after is not None:
+            return min(self.max_s, retry_after)
+        return random.uniform(0, min(self.max_s, self.base_s * (2 ** attempt)))
+
+
+def _retry_after(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None  # HTTP-date form: fall back to our own backoff
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """
+    True for errors another attempt may fix: timeouts, dropped connections and
+    429/5xx answers, whether they come from requests or from an SDK
+    (google.api_core errors carry the HTTP status as `code`).
+    """
+    status = getattr(exc, "status", None) or getattr(exc, "code", None)
+    if isinstance(status, int) and status in RETRY_STATUSES:
+        return True
+    if isinstance(exc, (TimeoutError, ConnectionError, asyncio.TimeoutError)):
+        return True
+    return type(exc).__name__ in (
+        "ResourceExhausted", "ServiceUnavailable", "DeadlineExceeded", "InternalServerError",
+        "TooManyRequests", "Timeout", "ConnectTimeout", "ReadTimeout", "ConnectionError",
+    )
+
+
+def call_with_retries(fn: Callable[[], Any], policy: Optional[RetryPolicy] = None,
+                      limiter: Optional[TokenBucket] = None,
+                      slots: Optional[threading.Semaphore] = None,
+                      on_retry: Optional[Callable[[BaseException], None]] = None) -> Any:
+    """
+    Run fn() under the rate limiter and concurrency slots, retrying retryable
+    failures with jittered backoff. The last error is re-raised.
+    """
+    policy = policy or RetryPolicy()
+    for attempt in range(policy.max_retries + 1):
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            if slots is None:
+                return fn()
+            with slots:
+                return fn()
+        except Exception as e:
+            if attempt >= policy.max_retries or not is_retryable(e):
+                raise
+            current_span().add("retries")
+            if on_retry is not None:
+                on_retry(e)
+            time.sleep(policy.delay(attempt, getattr(e, "retry_after", None)))
+
+
+SLOT_POLL_MAX_S = 0.1
+
+
+async def _aacquire_slot(slots: threading.Semaphore):
+    """Take a thread semaphore's slot without blocking the event loop (polls with backoff)."""
+    delay = 0.005
+    while not slots.acquire(blocking=False):
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, SLOT_POLL_MAX_S)
+
+
+@asynccontextmanager
+async def aslot(slots: threading.Semaphore):
+    """`async with aslot(slots)`: hold a thread semaphore's slot from the event loop."""
+    await _aacquire_slot(slots)
+    try:
+        yield
+    finally:
+        slots.release()
+
+
+async def acall_with_retries(fn: Callable[[], Any], policy: Optional[RetryPolicy] = None,
+                             limiter: Optional[TokenBucket] = None,
+                             slots: Union[threading.Semaphore, asyncio.Semaphore, None] = None,
+                             on_retry: Optional[Callable[[BaseException], None]] = None) -> Any:
+    """
+    Async call_with_retries: fn() returns an awaitable; waits happen on the event loop.
+    `slots` may be the same threading semaphore the sync calls use, so one
+    concurrency cap covers threads and event loops alike.
+    """
+    policy = policy or RetryPolicy()
+    for attempt in range(policy.max_retries + 1):
+        if limiter is not None:
+            await limiter.aacquire()
+        try:
+            if slots is None:
+                return await fn()
+            if isinstance(slots, asyncio.Semaphore):
+                async with slots:
+                    return await fn()
+            async with aslot(slots):
+                return await fn()
+        except Exception as e:
+            if attempt >= policy.max_retries or not is_retryable(e):
+                raise
+            current_span().add("retries")
+            if on_retry is not None:
+                on_retry(e)
+            await asyncio.sleep(policy.delay(attempt, getattr(e, "retry_after", None)))
+
+
+class HTTPClient:
+    """
+    Shared JSON-over-HTTP client: one keep-alive requests.Session with a
+    connection pool of `pool_size`, (connect, read) timeouts on every call,
+    token-bucket rate limiting, jittered retries on 429/5xx/timeouts and,
+    for idempotent calls, request hedging: if the first attempt has not
+    answered after `hedge_after_ms`, a duplicate is sent and whichever
+    answers first wins.
+    """
+
+    def __init__(self, timeout: float = HTTP_TIMEOUT_S, connect_timeout: float = HTTP_CONNECT_TIMEOUT_S,
+                 pool_size: int = HTTP_POOL_SIZE, policy: Optional[RetryPolicy] = None,
+                 limiter: Optional[TokenBucket] = None,
+                 hedge_after_ms: Optional[float] = HTTP_HEDGE_AFTER_MS,
+                 headers: Optional[Dict[str, str]] = None):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.timeout = (connect_timeout, timeout)
+        self.policy = policy or RetryPolicy()
+        self.limiter = limiter
+        self.hedge_after_ms = hedge_after_ms
+        self.session = requests.Session()
+        # retries are ours (with jitter and hedging), not urllib3's
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Content-Type": "application/json", **(headers or {})})
+        self._hedge_pool = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="hp-http")
+        self._stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "errors": 0}
+
+    def _count(self, key: str, n: int = 1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def _send(self, url: str, payload: Any, timeout, headers) -> Any:
+        """One attempt: JSON in, JSON out; retryable failures raise HTTPClientError with a status."""
+        self._count("requests")
+        response = self.session.post(url, json=payload, timeout=timeout or self.timeout, headers=headers)
+        if response.status_code >= 400:
+            err = HTTPClientError(f"POST {url} -> {response.status_code}: {response.text[:200]}",
+                                  response.status_code)
+            err.retry_after = _retry_after(response.headers.get("Retry-After"))
+            raise err
+        return response.json()
+
+    def _send_hedged(self, url: str, payload: Any, timeout, headers) -> Any:
+        first = self._hedge_pool.submit(self._send, url, payload, timeout, headers)
+        done, _ = wait([first], timeout=self.hedge_after_ms / 1000)
+        if done:
+            return first.result()
+        # slow tail: race a duplicate against the original
+        self._count("hedges")
+        second = self._hedge_pool.submit(self._send, url, payload, timeout, headers)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                if fut.exception() is None:
+                    if fut is second:
+                        self._count("hedge_wins")
+                    return fut.result()
+                error = fut.exception()
+        raise error
+
+    def post_json(self, url: str, payload: Any, timeout: Optional[float] = None,
+                  idempotent: bool = False, headers: Optional[Dict[str, str]] = None) -> Any:
+        """
+        POST `payload` as JSON and return the decoded answer. Hedging is only
+        used for `idempotent` calls (e.g. embeddings), never for generation.
+        """
+        hedge = idempotent and self.hedge_after_ms
+        timeout = (self.timeout[0], timeout) if timeout else None
+
+        def attempt():
+            if hedge:
+                return self._send_hedged(url, payload, timeout, headers)
+            return self._send(url, payload, timeout, headers)
+
+        try:
+            return call_with_retries(attempt, self.policy, self.limiter,
+                                     on_retry=lambda e: self._count("retries"))
+        except Exception:
+            self._count("errors")
+            raise
+
+    def close(self):
+        self._hedge_pool.shutdown(wait=False)
+        self.session.close()
+
+
+_clients: Dict[str, HTTPClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_http_client(name: str = "default", **kwargs) -> HTTPClient:
+    """Process-wide HTTPClient per name, so every caller shares its connection pool."""
+    with _clients_lock:
+        client = _clients.get(name)
+        if client is None:
+            client = _clients[name] = HTTPClient(**kwargs)
+        return client
@@ -0,0 +1,81 @@
+import os
+import json
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def hash_text(text: str) -> str:
+    """Content hash used for pages and chunks."""
+    return hashlib.md5(text.encode("utf-8")).hexdigest()
+
+
+def chunk_ids(texts: List[str]) -> List[Tuple[str, str]]:
+    """
+    Deterministic (docstore id, content hash) pairs for a list of chunk texts.
+    Identical chunks get an occurrence suffix so ids stay unique.
+    """
+    seen: Dict[str, int] = {}
+    out = []
+    for text in texts:
+        h = hash_text(text)
+        n = seen.get(h, 0)
+        seen[h] = n + 1
+        out.append((f"{h}-{n}", h))
+    return out
+
+
+class IndexManifest:
+    """Per-page and per-chunk content hashes describing what a FAISS index holds."""
+
+    def __init__(self, pdf_hash: str = "", pages: List[str] = None,
+                 chunks: List[Tuple[str, str]] = None, rules: str = ""):
+        self.pdf_hash = pdf_hash
+        self.pages = pages or []
+        # (docstore id, content hash) in index order
+        self.chunks = chunks or []
+        # hash of the cleaning rules the chunks were produced with ("" = defaults)
+        self.rules = rules
+
+    @classmethod
+    def load(cls, index_folder: str) -> Optional["IndexManifest"]:
+        path = os.path.join(index_folder, MANIFEST_FILE)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != MANIFEST_VERSION:
+            return None
+        return cls(
+            pdf_hash=data.get("pdf_hash", ""),
+            pages=data.get("pages", []),
+            chunks=[tuple(c) for c in data.get("chunks", [])],
+            rules=data.get("rules", ""),
+        )
+
+    def save(self, index_folder: str):
+        os.makedirs(index_folder, exist_ok=True)
+        path = os.path.join(index_folder, MANIFEST_FILE)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "version": MANIFEST_VERSION,
+                "pdf_hash": self.pdf_hash,
+                "pages": self.pages,
+                "chunks": [list(c) for c in self.chunks],
+                "rules": self.rules,
+            }, f)
+        os.replace(tmp, path)
+
+    def changed_pages(self, page_hashes: List[str]) -> List[int]:
+        """0-based indices of pages that differ from (or were added since) this manifest."""
+        changed = [i for i, h in enumerate(page_hashes)
+                   if i >= len(self.pages) or self.pages[i] != h]
+        # pages removed from the end count as changed too
+        changed.extend(range(len(page_hashes), len(self.pages)))
+        return changed
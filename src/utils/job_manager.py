@@ -0,0 +1,134 @@
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from src.config import JOB_WORKERS, JOB_MAX_QUEUED, JOB_RETENTION_SECONDS
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+ERROR = "error"
+
+
+class JobQueueFull(RuntimeError):
+    """Raised when too many jobs are already waiting for a worker."""
+
+
+class Job:
+    """
+    Status object for one background answer. Workers mutate it through
+    set_status/append/finish/fail; readers take snapshot() and block in
+    wait_for_change() instead of polling.
+    """
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = QUEUED
+        self.message = "Waiting for a free wizard..."
+        self.text = ""
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.version = 0
+        self.finished_at: Optional[float] = None
+        self._cond = threading.Condition()
+
+    def _bump(self):
+        self.version += 1
+        self._cond.notify_all()
+
+    def set_status(self, message: str, status: str = RUNNING):
+        with self._cond:
+            self.status, self.message = status, message
+            self._bump()
+
+    def append(self, text: str):
+        with self._cond:
+            self.text += text
+            self._bump()
+
+    def finish(self, result: Any):
+        with self._cond:
+            self.status, self.result, self.message = DONE, result, "Done"
+            self.finished_at = time.time()
+            self._bump()
+
+    def fail(self, error: BaseException):
+        with self._cond:
+            self.status, self.error, self.message = ERROR, error, "Error occurred"
+            self.finished_at = time.time()
+            self._bump()
+
+    @property
+    def done(self) -> bool:
+        return self.status in (DONE, ERROR)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "version": self.version,
+                "status": self.status,
+                "message": self.message,
+                "text": self.text,
+                "result": self.result,
+                "error": self.error,
+            }
+
+    def wait_for_change(self, version: int, timeout: Optional[float] = None) -> int:
+        """Block until the job's version moves past `version` (or timeout); return the new version."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.version != version, timeout=timeout)
+            return self.version
+
+
+class JobManager:
+    """Bounded worker pool running Jobs; jobs are looked up by id."""
+
+    def __init__(self, max_workers: int = JOB_WORKERS, max_queued: int = JOB_MAX_QUEUED,
+                 retention: float = JOB_RETENTION_SECONDS):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hp-job")
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.retention = retention
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        for job_id in [j.id for j in self._jobs.values() if j.finished_at and j.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Job:
+        """Run fn(job, *args, **kwargs) on a worker; its return value becomes job.result."""
+        job = Job()
+        with self._lock:
+            self._prune()
+            waiting = sum(1 for j in self._jobs.values() if j.status == QUEUED)
+            if waiting >= self.max_queued:
+                raise JobQueueFull(f"{waiting} jobs already waiting")
+            self._jobs[job.id] = job
+
+        def run():
+            job.set_status("Thinking...")
+            try:
+                job.finish(fn(job, *args, **kwargs))
+            except Exception as e:
+                job.fail(e)
+
+        self._pool.submit(run)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return counts
+
+    def shutdown(self, wait: bool = False):
+        self._pool.shutdown(wait=wait)
@@ -1,53 +1,77 @@
 # services/llm_services.py
 import os
-import requests
-from dotenv import load_dotenv
-import google.generativeai as genai
+import time
+import threading
 
-# Load environment variables
-load_dotenv(override=True)
+from src.config import (
+    EMBEDDING_HTTP_BATCH,
+    LLM_BURST,
+    LLM_MAX_CONCURRENCY,
+    LLM_RATE_PER_S,
+    LLM_TIMEOUT_S,
+    configure_genai,
+    load_env,
+)
+from src.utils.http_client import (
+    RetryPolicy,
+    TokenBucket,
+    acall_with_retries,
+    aslot,
+    call_with_retries,
+    get_http_client,
+)
+from src.utils.index_manifest import hash_text
+from src.utils.response_cache import get_response_cache, response_key
+from src.utils.tracing import current_span, span
 
-# Import configuration from your config file (assumed to be named config.py)
-try:
-    from config import GEMINI_API_KEY, SERPAPI_API_KEY  # Additional config values if needed
-except ImportError:
-    GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY", "your-gemini-api-key")
+# Gemini generation calls share one rate limiter and one set of concurrency slots per process
+_llm_limiter = TokenBucket(LLM_RATE_PER_S, LLM_BURST)
+_llm_slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+_llm_retry = RetryPolicy()
 
-# Placeholder for Gemini embedding plugin: assumes your embedding endpoint accepts a JSON POST request.
+
+# Placeholder for Gemini embedding plugin: assumes your embedding endpoint accepts a JSON POST request
+# ({"text": ...} -> {"embedding": [...]}, and {"texts": [...]} -> {"embeddings": [[...], ...]} for batches).
 class GeminiEmbeddingPlugin:
-    def __init__(self, model, deployment_name, api_key, endpoint):
+    def __init__(self, model, deployment_name, api_key, endpoint, client=None):
         self.model = model
         self.deployment_name = deployment_name
         self.api_key = api_key
         self.endpoint = endpoint
+        # pooled keep-alive session with timeouts, retries and hedging (shared process-wide)
+        self.client = client or get_http_client("embedding")
+
+    def _post(self, **payload):
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        data = {"model": self.model, "deployment": self.deployment_name, **payload}
+        return self.client.post_json(self.endpoint, data, idempotent=True, headers=headers)
 
     def embed(self, text):
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        data = {
-            "model": self.model,
-            "deployment": self.deployment_name,
-            "text": text
-        }
         try:
-            response = requests.post(self.endpoint, json=data, headers=headers)
-            response.raise_for_status()
-            embedding = response.json().get("embedding")
-            return embedding
+            return self._post(text=text).get("embedding")
         except Exception as e:
             print("Error using Gemini embedding:", e)
             return None
 
+    def embed_batch(self, texts):
+        """Embed many texts with one request per EMBEDDING_HTTP_BATCH texts."""
+        vectors = []
+        for i in range(0, len(texts), EMBEDDING_HTTP_BATCH):
+            vectors.extend(self._post(texts=texts[i:i + EMBEDDING_HTTP_BATCH])["embeddings"])
+        return vectors
+
 # Fallback embedding using Hugging Face's SentenceTransformers
 class HuggingFaceEmbeddingPlugin:
     def __init__(self, model_name='sentence-transformers/all-MiniLM-L6-v2'):
-        from sentence_transformers import SentenceTransformer
-        self.model = SentenceTransformer(model_name)
+        # shares the batched, cached embedding service used by the retriever
+        from src.utils.retriever import get_embeddings
+        self.model = get_embeddings(model_name)
 
     def embed(self, text):
-        return self.model.encode(text, convert_to_tensor=True)
+        return self.model.embed_query(text)
+
+    def embed_batch(self, texts):
+        return self.model.embed_documents(texts)
 
 class LLMService:
     def __init__(self):
@@ -55,7 +79,8 @@ class LLMService:
         Initialize the LLM service using environment variables and default settings.
         The default parameters can be updated as needed.
         """
-        self.api_key = GEMINI_API_KEY
+        load_env()
+        self.api_key = os.environ.get("GEMINI_API_KEY")
         if not self.api_key:
             raise ValueError("GEMINI_API_KEY is not set.")
 
@@ -73,50 +98,184 @@ class LLMService:
         self.embedding_deployment = "gemini-embedding-deployment"
 
         self.initialize_llm()
-        self.initialize_embedding()
+        # the embedding backend (and the Gemini endpoint's test call) is set up on first use
+        self._embedding = None
 
     def initialize_llm(self):
         """
         Configure the Gemini LLM using the google.generativeai library.
         Reference: https://developers.google.com/generativeai
         """
-        genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel("gemini-2.0-flash")
+        genai = configure_genai()
+        self.model_name = "gemini-2.0-flash"
+        self.model = genai.GenerativeModel(self.model_name)
         # If the API offers additional endpoint settings, include them as needed.
 
-    def generate_response(self, prompt):
+    def settings(self):
+        """Everything besides the prompt that shapes a response (part of the cache key)."""
+        return {
+            "model": self.model_name,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "system_prompt": self.system_prompt,
+        }
+
+    def response_cache_key(self, prompt, cache_parts=None):
         """
-        Generate a text response using the Gemini LLM.
-        Combines the system prompt with the user prompt.
+        Response-cache key for a prompt, or None when the cache is off. Callers that
+        know what the prompt was built from pass `cache_parts` (question, character,
+        context hash) so equivalent requests share an entry; otherwise the prompt is the key.
+        """
+        if get_response_cache() is None:
+            return None
+        if cache_parts:
+            return response_key("direct", self.settings(), **cache_parts)
+        return response_key("prompt", self.settings(), prompt=hash_text(prompt))
+
+    @staticmethod
+    def _record_usage(response):
+        """Note a real Gemini call and its token counts on the current trace span."""
+        trace = current_span()
+        trace.set(cache_hit=False)
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            trace.set(prompt_tokens=getattr(usage, "prompt_token_count", 0) or 0,
+                      output_tokens=getattr(usage, "candidates_token_count", 0) or 0)
+
+    def _call(self, full_prompt, stream=False):
+        """
+        generate_content with a timeout, under the shared rate limit and slots,
+        retried on 429/5xx. A stream is only started here; its caller holds the
+        slot itself until the stream is drained.
         """
+        return call_with_retries(
+            lambda: self.model.generate_content(
+                full_prompt, stream=stream, request_options={"timeout": LLM_TIMEOUT_S}
+            ),
+            _llm_retry, _llm_limiter, None if stream else _llm_slots,
+        )
+
+    async def _acall(self, full_prompt, stream=False):
+        """_call for the event loop: same rate limit and the same LLM_MAX_CONCURRENCY slots."""
+        return await acall_with_retries(
+            lambda: self.model.generate_content_async(
+                full_prompt, stream=stream, request_options={"timeout": LLM_TIMEOUT_S}
+            ),
+            _llm_retry, _llm_limiter, None if stream else _llm_slots,
+        )
+
+    def _generate(self, prompt):
         full_prompt = f"{self.system_prompt}\n{prompt}"
-        response = self.model.generate_content(full_prompt)
+        response = self._call(full_prompt)
+        self._record_usage(response)
         generated_text = response.text.strip() if response.text else ""
         return generated_text
 
+    def generate_response(self, prompt, cache_parts=None):
+        """
+        Generate a text response using the Gemini LLM.
+        Combines the system prompt with the user prompt.
+        Responses are served from / stored in the persistent response cache.
+        """
+        with span("llm.generate", model=self.model_name, prompt_chars=len(prompt), cache_hit=True):
+            key = self.response_cache_key(prompt, cache_parts)
+            if key is None:
+                return self._generate(prompt)
+            kind = "direct" if cache_parts else "prompt"
+            return get_response_cache().get_or_compute(key, lambda: self._generate(prompt), kind)
+
+    def generate_response_stream(self, prompt):
+        """
+        Stream a text response from the Gemini LLM, yielding text pieces as
+        they arrive instead of waiting for the whole answer.
+        """
+        full_prompt = f"{self.system_prompt}\n{prompt}"
+        # the slot covers the whole stream: Gemini is still generating while it is read
+        with span("llm.stream", model=self.model_name, prompt_chars=len(prompt)) as s, _llm_slots:
+            start, first = time.perf_counter(), True
+            # retried only until the stream starts; a broken stream is not replayed
+            response = self._call(full_prompt, stream=True)
+            for chunk in response:
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # chunks without text parts (e.g. safety metadata only)
+                    continue
+                if text:
+                    if first:
+                        s.set(first_token_ms=round((time.perf_counter() - start) * 1000, 3))
+                        first = False
+                    yield text
+            self._record_usage(response)
+
+    async def agenerate_response(self, prompt, cache_parts=None):
+        """
+        Async version of generate_response: awaits Gemini without holding a thread,
+        so one event loop can have many questions in flight.
+        """
+        with span("llm.generate", model=self.model_name, prompt_chars=len(prompt), cache_hit=True):
+            key = self.response_cache_key(prompt, cache_parts)
+            if key is None:
+                return await self._agenerate(prompt)
+            kind = "direct" if cache_parts else "prompt"
+            return await get_response_cache().aget_or_compute(key, lambda: self._agenerate(prompt), kind)
+
+    async def _agenerate(self, prompt):
+        full_prompt = f"{self.system_prompt}\n{prompt}"
+        response = await self._acall(full_prompt)
+        self._record_usage(response)
+        return response.text.strip() if response.text else ""
+
+    async def agenerate_response_stream(self, prompt):
+        """
+        Async version of generate_response_stream (an async generator of text pieces).
+        """
+        full_prompt = f"{self.system_prompt}\n{prompt}"
+        with span("llm.stream", model=self.model_name, prompt_chars=len(prompt)) as s:
+            async with aslot(_llm_slots):
+                start, first = time.perf_counter(), True
+                response = await self._acall(full_prompt, stream=True)
+                async for chunk in response:
+                    try:
+                        text = chunk.text
+                    except ValueError:
+                        continue
+                    if text:
+                        if first:
+                            s.set(first_token_ms=round((time.perf_counter() - start) * 1000, 3))
+                            first = False
+                        yield text
+                self._record_usage(response)
+
     def initialize_embedding(self):
         """
         Initialize embeddings using Gemini if the endpoint is available,
         otherwise fallback to Hugging Face embeddings.
         """
         if self.gemini_embedding_endpoint:
-            self.embedding = GeminiEmbeddingPlugin(
+            self._embedding = GeminiEmbeddingPlugin(
                 model=self.embedding_model,
                 deployment_name=self.embedding_deployment,
                 api_key=self.api_key,
                 endpoint=self.gemini_embedding_endpoint
             )
             # Test the Gemini embedding functionality with a simple input.
-            test_emb = self.embedding.embed("test")
+            test_emb = self._embedding.embed("test")
             if test_emb is None:
                 print("Gemini embedding failed; switching to Hugging Face.")
-                self.embedding = HuggingFaceEmbeddingPlugin()
+                self._embedding = HuggingFaceEmbeddingPlugin()
             else:
                 print("Using Gemini embedding service.")
         else:
-            self.embedding = HuggingFaceEmbeddingPlugin()
+            self._embedding = HuggingFaceEmbeddingPlugin()
             print("GEMINI_EMBEDDING_ENDPOINT not set; using Hugging Face embeddings.")
 
+    @property
+    def embedding(self):
+        if self._embedding is None:
+            self.initialize_embedding()
+        return self._embedding
+
     def get_llm(self):
         """
         Return configuration and parameters for the Gemini LLM.
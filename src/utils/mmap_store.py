@@ -0,0 +1,338 @@
+from __future__ import annotations
+
+import os
+import re
+import json
+import mmap
+import time
+import shutil
+import weakref
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+STORE_FILE = "store.json"
+VECTORS_FILE = "vectors.npy"
+NORMS_FILE = "norms.npy"
+OFFSETS_FILE = "text_offsets.npy"
+TEXT_FILE = "texts.bin"
+META_FILE = "meta.json"
+META_CODES_FILE = "meta_codes.npy"
+SPANS_FILE = "spans.npy"
+# per-row integer metadata, stored as int64 columns of spans.npy (-1 = missing)
+# instead of dictionary-encoding one distinct value per row into meta.json
+SPAN_KEYS = ("start", "end")
+# names the versioned subfolder (v<ns>-<pid>) holding the live store; written
+# files never change, a rebuild writes a new subfolder and swaps the pointer
+CURRENT_FILE = "CURRENT"
+VERSION_DIR = re.compile(r"v\d+-\d+")
+STORE_VERSION = 2
+# version 1 kept start/end in meta.json; still readable (vectors are reused on rebuild)
+READABLE_VERSIONS = (1, STORE_VERSION)
+
+# stores open in this process, so a write never deletes a version still mapped here
+_open_stores = weakref.WeakSet()
+
+
+class MmapVectorStore:
+    """
+    Read-only, pickle-free vector store backed by memory-mapped files:
+
+    - vectors.npy / norms.npy: float32 embeddings and their squared norms
+    - texts.bin + text_offsets.npy: every chunk's UTF-8 text in one blob
+    - meta.json + meta_codes.npy: dictionary-encoded metadata columns
+    - spans.npy: chunk start/end offsets (SPAN_KEYS) as int64 columns
+
+    Opening it only maps the files, so several processes share one copy in the
+    page cache and startup does not grow with the corpus. Search is exact L2,
+    the same ranking FAISS's flat index gives, unless an approximate index
+    (IVF-PQ / HNSW / SQ8, see ann_index.py) is attached.
+
+    The files live in a versioned subfolder named by CURRENT; write() fills a
+    new subfolder and replaces CURRENT in one rename, so a reader in any
+    process maps either the old store or the new one, never a mix. Indexes
+    written before CURRENT existed (files directly in the folder) still open.
+    """
+
+    def __init__(self, folder: str, embedding=None):
+        self.folder = folder
+        self.embedding = embedding
+        for attempt in range(2):
+            self.path = self.resolve(folder)
+            try:
+                self._open(self.path)
+                break
+            except FileNotFoundError:
+                # pruned between reading CURRENT and opening it: a newer store is live
+                if attempt:
+                    raise
+        # optional faiss index over the same rows; None = exact scan
+        self.ann = None
+        _open_stores.add(self)
+
+    def _open(self, path: str):
+        with open(os.path.join(path, STORE_FILE), "r", encoding="utf-8") as f:
+            self.info: Dict[str, Any] = json.load(f)
+        if self.info.get("version") not in READABLE_VERSIONS:
+            raise ValueError(f"Unsupported index store version in {path}")
+
+        self.vectors = np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r")
+        self.norms = np.load(os.path.join(path, NORMS_FILE), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, OFFSETS_FILE), mmap_mode="r")
+        self.meta_codes = np.load(os.path.join(path, META_CODES_FILE), mmap_mode="r")
+        spans = os.path.join(path, SPANS_FILE)
+        self.spans = np.load(spans, mmap_mode="r") if self.info["version"] >= 2 else None
+        with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.meta_keys: List[str] = meta["keys"]
+        self.meta_values: List[List[Any]] = meta["values"]
+
+        with open(os.path.join(path, TEXT_FILE), "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            # the mapping outlives the file object
+            self._text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def attach_ann(self, index):
+        if index is not None and index.ntotal != len(self):
+            raise ValueError("ANN index does not match the store's row count")
+        self.ann = index
+
+    @staticmethod
+    def resolve(folder: str) -> str:
+        """The directory holding the live store's files."""
+        try:
+            with open(os.path.join(folder, CURRENT_FILE), "r", encoding="utf-8") as f:
+                return os.path.join(folder, f.read().strip())
+        except FileNotFoundError:
+            return folder
+
+    @staticmethod
+    def exists(folder: str) -> bool:
+        return os.path.exists(os.path.join(MmapVectorStore.resolve(folder), STORE_FILE))
+
+    @staticmethod
+    def read_info(folder: str) -> Optional[Dict[str, Any]]:
+        """store.json alone (cheap): used to check the index without mapping it."""
+        try:
+            with open(os.path.join(MmapVectorStore.resolve(folder), STORE_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def stamp(folder: str, pdf_hash: str):
+        """Record a new source hash for an unchanged store."""
+        info = MmapVectorStore.read_info(folder)
+        if info is None:
+            return
+        info["pdf_hash"] = pdf_hash
+        path = MmapVectorStore.resolve(folder)
+        tmp = os.path.join(path, STORE_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(info, f)
+        os.replace(tmp, os.path.join(path, STORE_FILE))
+
+    @classmethod
+    def write(cls, folder: str, texts: Sequence[str], metadatas: Sequence[Dict[str, Any]],
+              vectors: Sequence[Sequence[float]], pdf_hash: str = "") -> None:
+        vecs = np.asarray(vectors, dtype=np.float32)
+        if vecs.ndim != 2 or len(vecs) != len(texts):
+            raise ValueError("vectors must be a (n_chunks, dim) matrix")
+
+        blobs = [t.encode("utf-8") for t in texts]
+        offsets = np.zeros(len(blobs) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in blobs], out=offsets[1:])
+
+        spans = np.full((len(metadatas), len(SPAN_KEYS)), -1, dtype=np.int64)
+        for row, m in enumerate(metadatas):
+            for col, key in enumerate(SPAN_KEYS):
+                if isinstance(m.get(key), int):
+                    spans[row, col] = m[key]
+
+        # dictionary-encode every other metadata key into an int32 column (-1 = missing)
+        keys: List[str] = sorted({k for m in metadatas for k in m
+                                  if k not in SPAN_KEYS or not isinstance(m[k], int)})
+        values: List[List[Any]] = [[] for _ in keys]
+        lookup: List[Dict[str, int]] = [{} for _ in keys]
+        codes = np.full((len(metadatas), len(keys)), -1, dtype=np.int32)
+        for row, m in enumerate(metadatas):
+            for col, key in enumerate(keys):
+                if key not in m or (key in SPAN_KEYS and isinstance(m[key], int)):
+                    continue
+                token = json.dumps(m[key], sort_keys=True)
+                code = lookup[col].get(token)
+                if code is None:
+                    code = lookup[col][token] = len(values[col])
+                    values[col].append(m[key])
+                codes[row, col] = code
+
+        version = f"v{time.time_ns()}-{os.getpid()}"
+        path = os.path.join(folder, version)
+        os.makedirs(path)
+
+        np.save(os.path.join(path, VECTORS_FILE), vecs, allow_pickle=False)
+        np.save(os.path.join(path, NORMS_FILE), (vecs * vecs).sum(axis=1), allow_pickle=False)
+        np.save(os.path.join(path, OFFSETS_FILE), offsets, allow_pickle=False)
+        np.save(os.path.join(path, META_CODES_FILE), codes, allow_pickle=False)
+        np.save(os.path.join(path, SPANS_FILE), spans, allow_pickle=False)
+        with open(os.path.join(path, TEXT_FILE), "wb") as f:
+            for b in blobs:
+                f.write(b)
+        with open(os.path.join(path, META_FILE), "w", encoding="utf-8") as f:
+            json.dump({"keys": keys, "values": values}, f)
+        with open(os.path.join(path, STORE_FILE), "w", encoding="utf-8") as f:
+            json.dump({
+                "version": STORE_VERSION,
+                "count": int(len(vecs)),
+                "dim": int(vecs.shape[1]),
+                "metric": "l2",
+                "pdf_hash": pdf_hash,
+            }, f)
+
+        # the swap: readers see the old version until this rename, the new one after
+        tmp = os.path.join(folder, CURRENT_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(version)
+        os.replace(tmp, os.path.join(folder, CURRENT_FILE))
+        cls.prune(folder)
+
+    @staticmethod
+    def prune(folder: str):
+        """
+        Delete store versions other than the live one, skipping any still mapped
+        in this process. Other processes keep their mappings on POSIX (the data
+        goes once they unmap); where a mapped file cannot be deleted (Windows)
+        the version is left for a later prune.
+        """
+        current = MmapVectorStore.resolve(folder)
+        mapped = {os.path.abspath(s.path) for s in list(_open_stores) if s.vectors is not None}
+        for name in os.listdir(folder):
+            path = os.path.join(folder, name)
+            if (VERSION_DIR.fullmatch(name) and path != current
+                    and os.path.abspath(path) not in mapped and os.path.isdir(path)):
+                shutil.rmtree(path, ignore_errors=True)
+        if current != folder and os.path.abspath(folder) not in mapped:
+            # files of a store written before CURRENT existed
+            for name in (VECTORS_FILE, NORMS_FILE, OFFSETS_FILE, META_CODES_FILE, SPANS_FILE,
+                         TEXT_FILE, META_FILE, STORE_FILE):
+                try:
+                    os.remove(os.path.join(folder, name))
+                except OSError:
+                    pass
+
+    def __len__(self) -> int:
+        return int(self.vectors.shape[0])
+
+    def text(self, i: int) -> str:
+        return bytes(self._text[int(self.offsets[i]):int(self.offsets[i + 1])]).decode("utf-8")
+
+    def metadata(self, i: int) -> Dict[str, Any]:
+        row = self.meta_codes[i]
+        meta = {
+            key: self.meta_values[col][code]
+            for col, (key, code) in enumerate(zip(self.meta_keys, row))
+            if code >= 0
+        }
+        if self.spans is not None:
+            for key, value in zip(SPAN_KEYS, self.spans[i]):
+                if value >= 0:
+                    meta[key] = int(value)
+        return meta
+
+    def document(self, i: int) -> Document:
+        from langchain_core.documents import Document
+        return Document(page_content=self.text(i), metadata=self.metadata(i))
+
+    def l2_distances(self, embedding: Sequence[float]) -> np.ndarray:
+        q = np.asarray(embedding, dtype=np.float32)
+        # ||v - q||^2 = ||v||^2 - 2 v·q + ||q||^2
+        return self.norms - 2.0 * (self.vectors @ q) + float(q @ q)
+
+    def search_rows(self, embedding: Sequence[float], k: int = 4,
+                    mask: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """
+        Top-k (row, squared L2 distance) pairs, nearest first. With a boolean
+        row mask only the selected rows are scanned (exactly, even if an ANN
+        index is attached, since the slice is usually small).
+        """
+        n = len(self)
+        if n == 0:
+            return []
+        if mask is not None:
+            rows = np.flatnonzero(mask)
+            if not len(rows):
+                return []
+            q = np.asarray(embedding, dtype=np.float32)
+            dist = self.norms[rows] - 2.0 * (self.vectors[rows] @ q) + float(q @ q)
+            k = min(k, len(rows))
+            top = np.argpartition(dist, k - 1)[:k] if k < len(rows) else np.arange(len(rows))
+            top = top[np.lexsort((rows[top], dist[top]))]
+            return [(int(rows[i]), float(dist[i])) for i in top]
+
+        k = min(k, n)
+        if self.ann is not None:
+            q = np.asarray(embedding, dtype=np.float32)[None]
+            dists, rows = self.ann.search(q, k)
+            return [(int(i), float(d)) for d, i in zip(dists[0], rows[0]) if i >= 0]
+
+        dist = self.l2_distances(embedding)
+        top = np.argpartition(dist, k - 1)[:k] if k < n else np.arange(n)
+        # stable sort on (distance, row) matches FAISS's tie order
+        top = top[np.lexsort((top, dist[top]))]
+        return [(int(i), float(dist[i])) for i in top]
+
+    def search_rows_batch(self, embeddings: Sequence[Sequence[float]], k: int = 4,
+                          mask: Optional[np.ndarray] = None) -> List[List[Tuple[int, float]]]:
+        """search_rows() for several queries in one ANN call / one matrix product (over the masked rows)."""
+        n = len(self)
+        if n == 0 or not len(embeddings):
+            return [[] for _ in embeddings]
+        q = np.asarray(embeddings, dtype=np.float32)
+        rows = None
+        if mask is not None:
+            rows = np.flatnonzero(mask)
+            if not len(rows):
+                return [[] for _ in embeddings]
+            vectors, norms = self.vectors[rows], self.norms[rows]
+        elif self.ann is not None:
+            dists, found = self.ann.search(q, min(k, n))
+            return [
+                [(int(i), float(d)) for d, i in zip(drow, rrow) if i >= 0]
+                for drow, rrow in zip(dists, found)
+            ]
+        else:
+            vectors, norms = self.vectors, self.norms
+
+        m = len(norms)
+        k = min(k, m)
+        dist = norms[None, :] - 2.0 * (q @ vectors.T) + np.einsum("ij,ij->i", q, q)[:, None]
+        out = []
+        for row in dist:
+            top = np.argpartition(row, k - 1)[:k] if k < m else np.arange(m)
+            ids = rows[top] if rows is not None else top
+            order = np.lexsort((ids, row[top]))
+            out.append([(int(ids[i]), float(row[top[i]])) for i in order])
+        return out
+
+    def similarity_search_with_score_by_vector(self, embedding: Sequence[float],
+                                               k: int = 4) -> List[Tuple[Document, float]]:
+        return [(self.document(i), d) for i, d in self.search_rows(embedding, k)]
+
+    def similarity_search_by_vector(self, embedding: Sequence[float], k: int = 4) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search(self, query: str, k: int = 4) -> List[Document]:
+        if self.embedding is None:
+            raise ValueError("MmapVectorStore needs an embedding to search by text")
+        return self.similarity_search_by_vector(self.embedding.embed_query(query), k)
+
+    def close(self):
+        """Unmap the store's files (Windows cannot replace them while mapped); unusable afterwards."""
+        if isinstance(self._text, mmap.mmap):
+            self._text.close()
+        # numpy memmaps are unmapped once no array refers to them
+        self.vectors = self.norms = self.offsets = self.meta_codes = self.spans = None
+        self.ann = None
@@ -1,124 +1,342 @@
+from __future__ import annotations
+
 import os
-import pdfplumber
+import time
 import re
-from typing import List, Dict, Any
-from langchain_core.documents import Document
-from src.config import PDF_PATH, CHUNK_SIZE, CHUNK_OVERLAP
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, List, Dict, Any, Iterable, Iterator
+from src.config import PDF_PATH, CHUNK_SIZE, CHUNK_OVERLAP, EXTRACT_WORKERS, EXTRACT_BATCH_PAGES
+from src.utils.search_filters import NUMBER_WORDS_PATTERN
+from src.utils.tracing import span
+
+# "CHAPTER 12", "Chapter XII" or "CHAPTER TWELVE"; the title may sit on the next line
+CHAPTER_PATTERN = re.compile(
+    r"^(CHAPTER|Chapter)\s+(" + NUMBER_WORDS_PATTERN + r"|[IVX]+|\d+)\b\s*[:-]?\s*(.*)$",
+    re.MULTILINE
+)
+
+# running headers of the Sorcerer's Stone PDF; other editions set their own
+# (see the corpus manifest, data/corpus.yaml)
+DEFAULT_HEADER_PATTERNS = [
+    r"HARRY POTTER AND THE SORCERER['’]S STONE",
+    r"J\.K\. ROWLING",
+]
+
+# Break points for a chunk end, best first: paragraph, line, sentence, word.
+# Bump CHUNKER_VERSION when chunk boundaries change so indexes get rebuilt.
+CHUNK_BREAKS = (("\n\n",), ("\n",), (". ", "? ", "! "), (" ",))
+CHUNKER_VERSION = 3
+_WHITESPACE = re.compile(r"\s+")
+# cleaning rules reach across a line or two, so this much raw text before a
+# heading decides whether cleaning keeps it intact (see _heading_survives)
+HEADING_CONTEXT = 256
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+
+def _best_break(text: str, lo: int, hi: int) -> int:
+    """Position just after the best CHUNK_BREAKS separator in text[lo:hi], else hi."""
+    for seps in CHUNK_BREAKS:
+        found = [(text.rfind(sep, lo, hi), sep) for sep in seps]
+        cut = max((i + len(sep) for i, sep in found if i >= 0), default=-1)
+        if cut > lo:
+            return cut
+    return hi
+
+
+def _extract_page_range(pdf_path: str, start: int, stop: int) -> List[str]:
+    """Worker: extract pages [start, stop) in a separate process."""
+    import pdfplumber
+    with pdfplumber.open(pdf_path) as pdf:
+        return [pdf.pages[i].extract_text() or "" for i in range(start, stop)]
+
 
 class PDFProcessor:
-    def __init__(self, pdf_path: str = None):
+    def __init__(self, pdf_path: str = None, header_patterns: List[str] = None,
+                 footer_patterns: List[str] = None, chapter_pattern: str = None,
+                 book: str = None):
         # allow override, else use config
         self.pdf_path = pdf_path or PDF_PATH
         if not os.path.exists(self.pdf_path):
             raise FileNotFoundError(f"PDF not found at {self.pdf_path}")
+        # per-edition cleaning rules: header lines are removed wherever they
+        # appear, footer lines only as whole lines
+        patterns = DEFAULT_HEADER_PATTERNS if header_patterns is None else header_patterns
+        self.header_patterns = [re.compile(p + r"\s*\n", re.IGNORECASE) for p in patterns]
+        self.footer_patterns = [
+            re.compile(r"\n[ \t]*(?:" + p + r")[ \t]*(?=\n|$)", re.IGNORECASE)
+            for p in (footer_patterns or [])
+        ]
+        # must keep CHAPTER_PATTERN's groups: 2 = chapter number, 3 = title
+        # (an empty number group numbers the headings in order)
+        self.chapter_pattern = re.compile(chapter_pattern, re.MULTILINE) if chapter_pattern else CHAPTER_PATTERN
+        if self.chapter_pattern.groups < 3:
+            raise ValueError(f"chapter_pattern needs 3 groups (word, number, title): {self.chapter_pattern.pattern!r}")
+        # book title stored in chunk metadata (for multi-book corpora)
+        self.book = book
+        # seconds spent per stage (extract / clean / chapters / chunk)
+        self.timings: Dict[str, float] = {}
 
-    def extract_text(self) -> str:
-        """Extract raw text from the PDF; raise if empty."""
-        full_text = []
+    @contextmanager
+    def _timed(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] = self.timings.get(stage, 0.0) + time.perf_counter() - start
+
+    def page_count(self) -> int:
+        import pdfplumber
         with pdfplumber.open(self.pdf_path) as pdf:
-            for i, page in enumerate(pdf.pages, start=1):
-                text = page.extract_text()
-                if text:
-                    full_text.append(text)
+            return len(pdf.pages)
+
+    def iter_pages(self, workers: int = EXTRACT_WORKERS,
+                   batch_pages: int = EXTRACT_BATCH_PAGES) -> Iterator[str]:
+        """
+        Yield raw page text in page order ("" for pages without text).
+        With workers > 1, batches of pages are extracted in a process pool and
+        yielded as soon as each batch (in order) is ready.
+        """
+        workers = workers or os.cpu_count() or 1
+        if workers <= 1:
+            import pdfplumber
+            with pdfplumber.open(self.pdf_path) as pdf:
+                for page in pdf.pages:
+                    with self._timed("extract"):
+                        text = page.extract_text() or ""
+                    yield text
+            return
+
+        n_pages = self.page_count()
+        ranges = deque((i, min(i + batch_pages, n_pages)) for i in range(0, n_pages, batch_pages))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            # keep a bounded number of batches in flight so memory stays flat
+            while ranges or pending:
+                while ranges and len(pending) < workers * 2:
+                    start, stop = ranges.popleft()
+                    pending.append(pool.submit(_extract_page_range, self.pdf_path, start, stop))
+                with self._timed("extract"):
+                    texts = pending.popleft().result()
+                yield from texts
 
-        combined = "\n".join(full_text)
+    def extract_pages(self, workers: int = 1) -> List[str]:
+        """Extract raw text page by page ("" for pages without text)."""
+        with span("pdf.extract", source=os.path.basename(self.pdf_path), workers=workers or 0) as s:
+            pages = list(self.iter_pages(workers=workers))
+            s.set(pages=len(pages))
+        return pages
+
+    def join_pages(self, pages: List[str]) -> str:
+        """Combine per-page text exactly as extract_text does; raise if empty."""
+        combined = "\n".join(p for p in pages if p)
         if not combined.strip():
             raise RuntimeError(f"No text extracted from PDF: {self.pdf_path}")
         return combined
 
+    def extract_text(self) -> str:
+        """Extract raw text from the PDF; raise if empty."""
+        return self.join_pages(self.extract_pages())
+
     def clean_text(self, text: str) -> str:
         """Strip page numbers, headers/footers, and collapse whitespace."""
+        with self._timed("clean"):
+            return self._clean_text(text)
+
+    def _clean_text(self, text: str) -> str:
         # strip page numbers like "\n   23\n"
         text = re.sub(r"\n\s*\d+\s*\n", "\n", text)
 
-        # remove common headers/footers (parameterize if you have multiple editions)
-        editions = [
-            r"HARRY POTTER AND THE SORCERER['’]S STONE",
-            r"J\.K\. ROWLING"
-        ]
-        for hdr in editions:
-            text = re.sub(hdr + r"\s*\n", "", text, flags=re.IGNORECASE)
+        # remove this edition's running headers/footers
+        for hdr in self.header_patterns:
+            text = hdr.sub("", text)
+        for ftr in self.footer_patterns:
+            text = ftr.sub("", text)
 
         # collapse 3+ newlines into two
         text = re.sub(r"\n{3,}", "\n\n", text)
         return text.strip()
 
-    def extract_chapters(self, text: str) -> List[Dict[str, Any]]:
+    def extract_chapters(self, text: str, base: int = 0, first: int = 1) -> List[Dict[str, Any]]:
         """
         Locate chapter headings and split out their text.
-        Supports both roman (I, II, III) and Arabic numerals.
+        Supports roman (I, II, III), Arabic and spelled-out (ONE, TWO) numbers;
+        unnumbered headings count on from `first`.
+        "start" is where the content begins in the cleaned text (`text` starts at `base`).
         """
-        pattern = re.compile(
-            r"^(CHAPTER|Chapter)\s+([IVX]+|\d+)\s*[:-]?\s*(.*)$",
-            re.MULTILINE
-        )
-        matches = list(pattern.finditer(text))
+        matches = list(self.chapter_pattern.finditer(text))
         if not matches:
             # fallback: treat entire text as one “chapter”
-            return [{"chapter_num": "1", "title": "", "content": text}]
+            return [{"chapter_num": "1", "title": "", "content": text, "start": base}]
 
         chapters = []
         for idx, m in enumerate(matches):
             start = m.end()
             end = matches[idx + 1].start() if idx + 1 < len(matches) else len(text)
+            content = text[start:end]
             chapters.append({
-                "chapter_num": m.group(2),
+                "chapter_num": m.group(2) or str(first + idx),
                 "title": m.group(3).strip(),
-                "content": text[start:end].strip()
+                "content": content.strip(),
+                "start": base + start + len(content) - len(content.lstrip()),
             })
         return chapters
 
+    def iter_chapters(self, pages: Iterable[str]) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming counterpart of clean_text + extract_chapters.
+        Raw text is buffered only until the next chapter heading shows up; the
+        completed chapter is then cleaned and yielded while later pages are
+        still being extracted. Cuts happen only at the start of a heading line
+        that cleaning keeps intact, so output equals the batch path; chapter
+        offsets count the cleaned segments back to back, one newline apart.
+        """
+        buffer = ""
+        started = False
+        pos = 0
+        count = 0
+        for page in pages:
+            if not page:
+                continue
+            # headings above the old last line were judged already (and kept)
+            scanned = buffer.rfind("\n") + 1
+            buffer = buffer + "\n" + page if started else page
+            started = True
+
+            # cut before the last heading whose line is complete and which
+            # cleaning leaves intact (a stripped header can glue it to the line above)
+            cut = 0
+            for m in self.chapter_pattern.finditer(buffer, scanned):
+                if m.start() > 0 and m.end() < len(buffer) and self._heading_survives(buffer, m):
+                    cut = m.start()
+            if not cut:
+                continue
+
+            segment, buffer = buffer[:cut], buffer[cut:]
+            cleaned = self.clean_text(segment)
+            with self._timed("chapters"):
+                # text before the first heading is front matter, as in extract_chapters
+                chapters = self.extract_chapters(cleaned, pos, count + 1) if self.chapter_pattern.search(cleaned) else []
+            pos += len(cleaned) + 1
+            count += len(chapters)
+            yield from chapters
+
+        if not buffer.strip():
+            raise RuntimeError(f"No text extracted from PDF: {self.pdf_path}")
+        cleaned = self.clean_text(buffer)
+        with self._timed("chapters"):
+            chapters = self.extract_chapters(cleaned, pos, count + 1)
+        yield from chapters
+
+    def _heading_survives(self, buffer: str, heading: re.Match) -> bool:
+        """
+        True if buffer[:heading.end()] still ends in a heading once cleaned.
+        Only the last HEADING_CONTEXT chars (from a newline) are cleaned, so
+        checking each heading costs the same however long the chapter is.
+        """
+        lo = buffer.rfind("\n", 0, max(0, heading.start() - HEADING_CONTEXT))
+        cleaned = self._clean_text(buffer[max(lo, 0):heading.end()])
+        last = None
+        for last in self.chapter_pattern.finditer(cleaned):
+            pass
+        return last is not None and last.end() == len(cleaned)
+
+    def _chunk_metadata(self, chap: Dict[str, Any], start: int, end: int) -> Dict[str, Any]:
+        meta = {
+            "source": os.path.basename(self.pdf_path),
+            "chapter": chap["chapter_num"],
+            "title": chap["title"],
+            # span of the chunk in the cleaned text
+            "start": start,
+            "end": end,
+        }
+        if self.book:
+            meta["book"] = self.book
+        return meta
+
+    @staticmethod
+    def chunk_spans(text: str, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> Iterator[tuple]:
+        """
+        (start, end) offsets of overlapping chunks of at most `size` chars.
+        A chunk ends at the best break (paragraph > line > sentence > word) in
+        the second half of its window, and the next one starts `overlap` chars
+        earlier at a word boundary. Each window is scanned a bounded number of
+        times, so this is linear in len(text).
+        """
+        n = len(text)
+        start = len(text) - len(text.lstrip())
+        while start < n:
+            end = min(start + size, n)
+            if end < n:
+                end = _best_break(text, start + size // 2, end)
+            stop = end
+            while stop > start and text[stop - 1].isspace():
+                stop -= 1
+            if stop > start:
+                yield start, stop
+            if end >= n:
+                return
+            # step back for the overlap, then forward to the next word start
+            nxt = max(end - overlap, start + 1)
+            if not text[nxt - 1].isspace():
+                m = _WHITESPACE.search(text, nxt, end)
+                nxt = m.end() if m else end
+            while nxt < n and text[nxt].isspace():
+                nxt += 1
+            start = nxt
+
     def split_into_chunks(self, chapters: List[Dict[str, Any]]) -> List[Document]:
-        """Break each chapter into overlapping chunks of ~CHUNK_SIZE."""
+        """Break each chapter into overlapping chunks of at most CHUNK_SIZE chars."""
+        with self._timed("chunk"):
+            return self._split_into_chunks(chapters)
+
+    def _split_into_chunks(self, chapters: List[Dict[str, Any]]) -> List[Document]:
+        from langchain_core.documents import Document
         docs: List[Document] = []
         for chap in chapters:
-            paras = re.split(r"\n\s*\n", chap["content"])
-            buffer = ""
-            meta_paras: List[str] = []
-            for p in paras:
-                p = p.strip()
-                if not p:
-                    continue
-                # if adding this paragraph will overflow
-                if len(buffer) + len(p) > CHUNK_SIZE:
-                    docs.append(Document(
-                        page_content=buffer.strip(),
-                        metadata={
-                            "source": os.path.basename(self.pdf_path),
-                            "chapter": chap["chapter_num"],
-                            "title": chap["title"],
-                            "paragraphs": meta_paras.copy()
-                        }
-                    ))
-                    # prepare next buffer with overlap
-                    overlap = buffer[-CHUNK_OVERLAP:] if CHUNK_OVERLAP < len(buffer) else buffer
-                    buffer = overlap + "\n\n" + p + "\n\n"
-                    # keep only paras still in buffer
-                    meta_paras = [pp for pp in meta_paras if pp in buffer] + [p]
-                else:
-                    buffer += p + "\n\n"
-                    meta_paras.append(p)
-
-            # final leftover
-            if buffer.strip():
+            content, base = chap["content"], chap.get("start", 0)
+            for start, end in self.chunk_spans(content):
                 docs.append(Document(
-                    page_content=buffer.strip(),
-                    metadata={
-                        "source": os.path.basename(self.pdf_path),
-                        "chapter": chap["chapter_num"],
-                        "title": chap["title"],
-                        "paragraphs": meta_paras.copy()
-                    }
+                    page_content=content[start:end],
+                    metadata=self._chunk_metadata(chap, base + start, base + end),
                 ))
-
         return docs
 
     def process(self) -> List[Document]:
         """Full pipeline: extract → clean → chapter-split → chunk."""
-        raw = self.extract_text()
-        cleaned = self.clean_text(raw)
-        chapters = self.extract_chapters(cleaned)
-        docs = self.split_into_chunks(chapters)
+        self.timings = {}
+        return self.process_text(self.extract_text())
+
+    def process_text(self, raw: str) -> List[Document]:
+        """clean → chapter-split → chunk on already extracted text."""
+        with span("pdf.process", source=os.path.basename(self.pdf_path), chars=len(raw)) as s:
+            cleaned = self.clean_text(raw)
+            with self._timed("chapters"):
+                chapters = self.extract_chapters(cleaned)
+            docs = self.split_into_chunks(chapters)
+            s.set(chapters=len(chapters), chunks=len(docs),
+                  **{f"{stage}_ms": round(sec * 1000, 3) for stage, sec in self.timings.items()})
         if not docs:
             raise RuntimeError("No chunks produced; check CHUNK_SIZE/OVERLAP settings.")
         return docs
+
+    def process_stream(self, workers: int = EXTRACT_WORKERS,
+                       pages: Iterable[str] = None) -> Iterator[Document]:
+        """
+        Streaming pipeline: pages are extracted in a process pool (or taken
+        from `pages`) and chunks are yielded chapter by chapter while later
+        pages are still parsing. Chunk texts match process_text's; offsets are
+        relative to the streamed segments (consistent within a chapter).
+        Per-stage seconds accumulate in self.timings.
+        """
+        self.timings = {}
+        produced = False
+        for chap in self.iter_chapters(self.iter_pages(workers=workers) if pages is None else pages):
+            for doc in self.split_into_chunks([chap]):
+                produced = True
+                yield doc
+        if not produced:
+            raise RuntimeError("No chunks produced; check CHUNK_SIZE/OVERLAP settings.")
@@ -0,0 +1,314 @@
+import os
+import re
+import json
+import math
+import argparse
+import threading
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from src.config import CHARACTERS, PERSONA_QUOTES, PERSONA_MIN_LINES
+from src.utils.bm25_index import tokenize
+from src.utils.index_manifest import hash_text
+from src.utils.tracing import span
+
+PERSONA_FILE = "personas.json"
+PERSONA_VERSION = 1
+
+SPEECH_VERBS = (
+    "said", "asked", "shouted", "yelled", "whispered", "muttered", "snapped", "replied",
+    "called", "cried", "roared", "added", "continued", "told", "growled", "sneered",
+    "drawled", "hissed", "bellowed", "exclaimed", "murmured", "answered", "barked",
+    "squeaked", "snarled", "sighed", "groaned", "gasped", "panted", "moaned", "laughed",
+)
+_VERB = "(?:" + "|".join(SPEECH_VERBS) + ")"
+# a speaker as the books name one: "Hagrid", "Professor McGonagall", "Mr. Weasley"
+_NAME = r"[A-Z][a-z]*(?:[A-Z][a-z]+)?"  # "Hagrid", "McGonagall"
+_SPEAKER = rf"(?:(?:Mr|Mrs|Madam|Professor|Uncle|Aunt)\.? )?{_NAME}(?: {_NAME})?"
+# curly quotes pair up by themselves; a straight quote only opens after a space
+# and closes before one (or punctuation), so an unclosed quote (speech running
+# on into the next paragraph) does not throw every later pairing off
+QUOTE = re.compile(
+    r"“([^“”]{2,600}?)”"
+    r"|(?<![^\s(—-])\"(?=\S)([^\"]{2,600}?)(?<=\S)\"(?![^\s.,;:!?)—-])"
+)
+# "...," said Hagrid / "...," Hagrid said   (right after the closing quote)
+SAID_AFTER = re.compile(
+    rf"\s*(?:(?P<verb>{_VERB})\s+(?P<speaker>{_SPEAKER})|(?P<speaker2>{_SPEAKER})\s+(?P<verb2>{_VERB}))\b"
+)
+# Hagrid said, "..."   (right before the opening quote)
+SAID_BEFORE = re.compile(rf"(?P<speaker>{_SPEAKER})\s+(?P<verb>{_VERB})[^.“”\"]{{0,30}}[,:]\s*$")
+SENTENCE = re.compile(r"[^.!?“”\"]*[.!?]")
+# characters named within this many characters of each other count as appearing together
+WINDOW = 600
+# what a descriptive sentence about a character tends to hang on
+DESCRIPTIVE = re.compile(
+    r"\b(?:was|looked|seemed|had|wore|face|eyes|voice|hair|beard|robes|smile[d]?|frown(?:ed|ing)?)\b"
+)
+
+
+def _rows(vs) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """(text, metadata) of every chunk in a vector store (mmap or FAISS docstore)."""
+    if hasattr(vs, "text"):
+        for i in range(len(vs)):
+            yield vs.text(i), vs.metadata(i)
+    else:
+        for doc in vs.docstore._dict.values():
+            yield doc.page_content, doc.metadata
+
+
+def stitch_chapters(rows) -> Iterator[str]:
+    """
+    The cleaned text of each chapter, rebuilt from its overlapping chunks by
+    their start/end offsets, so a line of dialogue cut at a chunk boundary is
+    whole again. Chunks without offsets are yielded as they are.
+    """
+    chapters: Dict[Tuple[Any, Any], List[Tuple[int, int, str]]] = defaultdict(list)
+    for text, meta in rows:
+        if meta.get("start") is None or meta.get("end") is None:
+            yield text
+            continue
+        chapters[(meta.get("book") or meta.get("source"), meta.get("chapter"))].append(
+            (meta["start"], meta["end"], text))
+    for parts in chapters.values():
+        parts.sort()
+        out, end = [], None
+        for start, stop, text in parts:
+            if end is None or start > end:
+                if out:
+                    yield "".join(out)
+                out, end = [text], stop
+            elif stop > end:
+                out.append(text[end - start:])
+                end = stop
+        if out:
+            yield "".join(out)
+
+
+def attributed_lines(text: str) -> Iterator[Tuple[str, str, str]]:
+    """(speaker, speech verb, line) for each quotation with a named speaker next to it."""
+    for m in QUOTE.finditer(text):
+        said = SAID_AFTER.match(text, m.end()) or SAID_BEFORE.search(text, max(0, m.start() - 80), m.start())
+        if not said:
+            continue
+        found = said.groupdict()
+        speaker = found["speaker"] or found.get("speaker2")
+        verb = found["verb"] or found.get("verb2")
+        yield speaker, verb.lower(), " ".join((m.group(1) or m.group(2)).split())
+
+
+def _distinctive(own: Counter, everyone: Counter, n: int, exclude: set) -> List[str]:
+    """Words a character uses notably more than the cast does (smoothed log-odds)."""
+    own_total, all_total = sum(own.values()) or 1, sum(everyone.values()) or 1
+    vocab = len(everyone) or 1
+
+    def score(word):
+        return (math.log((own[word] + 0.5) / (own_total + vocab))
+                - math.log((everyone[word] + 0.5) / (all_total + vocab)))
+
+    words = [w for w, c in own.items() if c >= 3 and len(w) > 1 and w not in exclude and not w.isdigit()]
+    return [w for w in sorted(words, key=lambda w: -score(w)) if score(w) > 0][:n]
+
+
+def _spread(items: List[str], n: int) -> List[str]:
+    """n items spread evenly over the list (so profiles are not all from chapter one)."""
+    if len(items) <= n:
+        return items
+    step = len(items) / n
+    return [items[int(i * step)] for i in range(n)]
+
+
+def mine_profiles(texts, characters: Dict[str, List[str]] = CHARACTERS,
+                  quotes: int = PERSONA_QUOTES) -> Dict[str, Dict[str, Any]]:
+    """
+    Persona profile per character from the corpus text: their attributed
+    dialogue (line count, length, ! and ? rates, favourite speech verbs,
+    distinctive words, example lines), sentences describing them and the
+    characters mentioned most often alongside them. No model calls.
+    """
+    by_alias = {alias: name for name, aliases in characters.items() for alias in aliases}
+    lines: Dict[str, List[Tuple[str, str]]] = defaultdict(list)
+    described: Dict[str, List[str]] = defaultdict(list)
+    together: Dict[str, Counter] = defaultdict(Counter)
+    passages: Counter = Counter()
+    alias_pattern = {
+        name: re.compile(r"\b(?:" + "|".join(re.escape(a) for a in sorted(aliases, key=len, reverse=True)) + r")\b")
+        for name, aliases in characters.items()
+    }
+    seen_lines = set()
+
+    for text in texts:
+        for speaker, verb, line in attributed_lines(text):
+            name = by_alias.get(speaker)
+            if name and (name, line) not in seen_lines:
+                seen_lines.add((name, line))
+                lines[name].append((verb, line))
+        for at in range(0, len(text), WINDOW):
+            window = text[at:at + WINDOW]
+            present = [name for name, pattern in alias_pattern.items() if pattern.search(window)]
+            for name in present:
+                passages[name] += 1
+                together[name].update(other for other in present if other != name)
+        for sentence in SENTENCE.findall(QUOTE.sub(" ", text)):
+            sentence = " ".join(sentence.split())
+            if not 40 <= len(sentence) <= 220 or not DESCRIPTIVE.search(sentence):
+                continue
+            for name, pattern in alias_pattern.items():
+                if pattern.match(sentence) and sentence not in described[name]:
+                    described[name].append(sentence)
+
+    words = {name: Counter(t for _, line in lines[name] for t in tokenize(line)) for name in characters}
+    everyone = sum(words.values(), Counter())
+    profiles = {}
+    for name, aliases in characters.items():
+        said = lines[name]
+        count = len(said)
+        exclude = {t for a in aliases for t in tokenize(a)}
+        signature = _distinctive(words[name], everyone, 8, exclude)
+        sig = set(signature)
+        verbs = Counter(v for v, _ in said)
+        verbs.pop("said", None)
+
+        def line_score(line):
+            toks = tokenize(line)
+            return sum(t in sig for t in toks) + 0.5 * bool(re.search(r"[!?]", line))
+
+        candidates = [line for _, line in said if 4 <= len(line.split()) <= 40]
+        # the best-scoring few, spread over the books in reading order
+        best = set(sorted(candidates, key=line_score, reverse=True)[:quotes * 3])
+        examples = _spread([line for line in candidates if line in best], quotes)
+        profiles[name] = {
+            "name": name,
+            "lines": count,
+            "passages": passages[name],
+            "avg_words": round(sum(len(l.split()) for _, l in said) / count, 1) if count else 0,
+            "exclaims": round(sum("!" in l for _, l in said) / count, 2) if count else 0,
+            "questions": round(sum("?" in l for _, l in said) / count, 2) if count else 0,
+            "verbs": [v for v, _ in verbs.most_common(4)],
+            "signature_words": signature,
+            "often_with": [other for other, _ in together[name].most_common(4)],
+            "described": _spread(described[name], 3),
+            "quotes": examples,
+        }
+    return profiles
+
+
+def render_persona(profile: Dict[str, Any]) -> str:
+    """The profile as a compact prompt block (what replaces the analysis agent's output)."""
+    name = profile["name"]
+    style = [f"lines average {profile['avg_words']:g} words"]
+    if profile["exclaims"] >= 0.2:
+        style.append(f"{profile['exclaims']:.0%} are exclamations")
+    if profile["questions"] >= 0.2:
+        style.append(f"{profile['questions']:.0%} are questions")
+    if profile["verbs"]:
+        style.append("often " + ", ".join(profile["verbs"]) + " rather than just said")
+    out = [f"Persona of {name} (from {profile['lines']} lines of dialogue in the books)",
+           "Speech: " + "; ".join(style) + "."]
+    if profile["signature_words"]:
+        out.append("Signature words: " + ", ".join(profile["signature_words"]) + ".")
+    if profile["often_with"]:
+        out.append("Usually appears with: " + ", ".join(profile["often_with"]) + ".")
+    for sentence in profile["described"]:
+        out.append(f"Described: {sentence}")
+    if profile["quotes"]:
+        out.append(f"How {name} talks:")
+        out.extend(f"- “{q}”" for q in profile["quotes"])
+    return "\n".join(out)
+
+
+class PersonaProfiles:
+    """
+    Character persona profiles for one index, stored next to it as
+    personas.json with the index fingerprint they were mined from. load()
+    reuses the file while the fingerprint matches and mines again otherwise,
+    so profiles are rebuilt only when the index changes.
+    """
+
+    def __init__(self, retriever, characters: Dict[str, List[str]] = CHARACTERS):
+        self.retriever = retriever
+        self.characters = characters
+        self.path = os.path.join(retriever.index_folder, PERSONA_FILE)
+        self.profiles: Dict[str, Dict[str, Any]] = {}
+        self.fingerprint: Optional[str] = None
+
+    def _settings(self) -> str:
+        return hash_text(json.dumps([PERSONA_VERSION, self.characters, PERSONA_QUOTES], sort_keys=True))
+
+    def load(self, rebuild: bool = False) -> "PersonaProfiles":
+        fingerprint = f"{self.retriever.index_fingerprint}:{self._settings()}"
+        if not rebuild and fingerprint == self.fingerprint:
+            return self
+        data = None if rebuild else self._read()
+        if data is None or data.get("fingerprint") != fingerprint:
+            print("🔄 Mining character persona profiles...")
+            with span("persona.build", characters=len(self.characters)) as s:
+                rows = (row for vs in self.retriever.stores() for row in _rows(vs))
+                data = {"fingerprint": fingerprint,
+                        "profiles": mine_profiles(stitch_chapters(rows), self.characters)}
+                s.set(lines=sum(p["lines"] for p in data["profiles"].values()))
+            self._write(data)
+        self.profiles = data["profiles"]
+        self.fingerprint = fingerprint
+        return self
+
+    def _read(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, data: Dict[str, Any]):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def get(self, character: str) -> Optional[Dict[str, Any]]:
+        """The character's profile, or None if unknown or too thin to stand in for an analysis."""
+        profile = self.profiles.get(character)
+        if profile is None or profile["lines"] < PERSONA_MIN_LINES:
+            return None
+        return profile
+
+    def persona(self, character: str) -> Optional[str]:
+        profile = self.get(character)
+        return render_persona(profile) if profile else None
+
+
+_profiles: Dict[Any, PersonaProfiles] = {}  # per retriever
+_profiles_lock = threading.Lock()
+
+
+def get_persona_profiles(pdf_path: Optional[str] = None) -> PersonaProfiles:
+    """Loaded profiles for the retriever get_retriever(pdf_path) returns, shared per process."""
+    from src.utils.retriever import get_retriever
+    retriever = get_retriever(pdf_path)
+    with _profiles_lock:
+        profiles = _profiles.get(retriever)
+        if profiles is None:
+            profiles = _profiles[retriever] = PersonaProfiles(retriever)
+        return profiles.load()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mine character persona profiles from the index")
+    parser.add_argument("--rebuild", action="store_true", help="mine again even if the index is unchanged")
+    parser.add_argument("--show", metavar="CHARACTER", help="print one character's persona block")
+    args = parser.parse_args()
+
+    from src.utils.retriever import get_retriever
+    profiles = PersonaProfiles(get_retriever()).load(rebuild=args.rebuild)
+    if args.show:
+        print(profiles.persona(args.show) or f"No usable profile for {args.show!r}.")
+        return
+    for name, profile in profiles.profiles.items():
+        status = "✅" if profiles.get(name) else "⚠️ too few lines, crew keeps the analysis step"
+        print(f"{name}: {profile['lines']} lines, {profile['passages']} passages {status}")
+    print(f"💾 {profiles.path}")
+
+
+if __name__ == "__main__":
+    main()
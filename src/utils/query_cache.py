@@ -0,0 +1,108 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.config import QUERY_CACHE_SIZE, QUERY_CACHE_TTL, QUERY_CACHE_SIMILARITY
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+class QueryCache:
+    """
+    LRU + TTL cache of query embeddings and their top-k results.
+
+    With `similarity_threshold` set, a miss on the exact query text falls back
+    to the cached query whose embedding has the highest cosine similarity, if
+    it is at least the threshold. Entries belong to one index version and the
+    whole cache is dropped when the index changes.
+    """
+
+    def __init__(self, max_entries: int = QUERY_CACHE_SIZE, ttl: float = QUERY_CACHE_TTL,
+                 similarity_threshold: Optional[float] = QUERY_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.index_version: Optional[str] = None
+        self._entries: "OrderedDict[Tuple[str, Any], Tuple[float, np.ndarray, List[Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    def invalidate(self, index_version: Optional[str] = None):
+        """Drop everything if the index version changed (or unconditionally if None)."""
+        with self._lock:
+            if index_version is None or index_version != self.index_version:
+                self._entries.clear()
+            self.index_version = index_version
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return bool(self.ttl) and now - stored_at > self.ttl
+
+    def get(self, query: str, k: Any) -> Optional[List[Any]]:
+        """Exact lookup by normalized query text; counts a miss only via get_similar."""
+        key = (normalize_query(query), k)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry[0], now):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(entry[2])
+
+    def get_similar(self, k: Any, embedding: Sequence[float]) -> Optional[List[Any]]:
+        """Near-duplicate lookup; records a miss when nothing is close enough."""
+        with self._lock:
+            if self.similarity_threshold is None or not self._entries:
+                self.misses += 1
+                return None
+            now = time.time()
+            query = _unit(embedding)
+            best_key, best_sim = None, self.similarity_threshold
+            for key, (stored_at, vec, _) in self._entries.items():
+                if key[1] != k or self._expired(stored_at, now):
+                    continue
+                sim = float(np.dot(query, vec))
+                if sim >= best_sim:
+                    best_key, best_sim = key, sim
+            if best_key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.near_hits += 1
+            return list(self._entries[best_key][2])
+
+    def put(self, query: str, k: Any, embedding: Sequence[float], results: List[Any]):
+        key = (normalize_query(query), k)
+        with self._lock:
+            self._entries[key] = (time.time(), _unit(embedding), list(results))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.near_hits + self.misses
+            return {
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.near_hits) / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "index_version": self.index_version,
+            }
+
+
+def _unit(vec: Sequence[float]) -> np.ndarray:
+    arr = np.asarray(vec, dtype=np.float32)
+    norm = float(np.linalg.norm(arr))
+    return arr / norm if norm else arr
@@ -0,0 +1,59 @@
+import re
+from itertools import zip_longest
+from typing import Iterable, List, Optional, Sequence, Union
+
+from src.config import QUERY_ALIASES, QUERY_EXPANSION_MAX
+
+
+def _alias_pattern(aliases: Sequence[str]) -> "re.Pattern":
+    # longest first, so "Tom Riddle" wins over a shorter alias inside it
+    names = sorted(aliases, key=len, reverse=True)
+    return re.compile(r"(?<!\w)(?:" + "|".join(re.escape(a) for a in names) + r")(?!\w)", re.IGNORECASE)
+
+
+_PATTERNS = [(group, _alias_pattern(group)) for group in QUERY_ALIASES]
+
+
+def alias_variants(query: str) -> List[str]:
+    """
+    Rewrites of `query` with a known name swapped for each of its other names
+    ("Who is You-Know-Who?" -> "Who is Voldemort?", "Who is Tom Riddle?", ...).
+    One name is swapped per rewrite; with several names in the query their
+    rewrites alternate, so a short list still covers each of them.
+    """
+    found = []
+    for group, pattern in _PATTERNS:
+        m = pattern.search(query)
+        if m:
+            found.append((m.start(), group, m))
+    per_name = [
+        [query[:m.start()] + alias + query[m.end():] for alias in group if alias.lower() != m.group(0).lower()]
+        for _, group, m in sorted(found, key=lambda f: f[0])
+    ]
+    return [v for round_ in zip_longest(*per_name) for v in round_ if v is not None]
+
+
+def parse_variants(variants: Union[str, Iterable[str], None]) -> List[str]:
+    """Variants as a tool receives them: a list, or one string split on "|", ";" or newlines."""
+    if not variants:
+        return []
+    if isinstance(variants, str):
+        variants = re.split(r"[|;\n]", variants)
+    return [v.strip() for v in variants if v and v.strip()]
+
+
+def expand_query(query: str, variants: Union[str, Iterable[str], None] = None,
+                 max_queries: Optional[int] = QUERY_EXPANSION_MAX, aliases: bool = True) -> List[str]:
+    """
+    The query followed by up to max_queries - 1 other phrasings: the given
+    `variants` first, then (with `aliases`) alias rewrites. Case/whitespace
+    duplicates are dropped.
+    """
+    rewrites = alias_variants(query) if aliases else []
+    out, seen = [], set()
+    for q in [query, *parse_variants(variants), *rewrites]:
+        key = " ".join(q.lower().split())
+        if key and key not in seen:
+            seen.add(key)
+            out.append(q)
+    return out[:max_queries] if max_queries else out
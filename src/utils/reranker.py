@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import time
+import asyncio
+import threading
+import contextvars
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+from src.config import (
+    RERANK_ENABLED,
+    RERANK_MODEL,
+    RERANK_CANDIDATES,
+    RERANK_BATCH_SIZE,
+    RERANK_BUDGET_MS,
+    RERANK_CACHE_SIZE,
+    SEARCH_MODE,
+)
+from src.utils.index_manifest import hash_text
+from src.utils.query_cache import normalize_query
+from src.utils.retriever import search_executor
+from src.utils.search_filters import SearchFilter
+from src.utils.tracing import current_span, span
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+
+class Reranker:
+    """
+    Cross-encoder rescoring of retrieval candidates on CPU.
+
+    Candidates are scored in retrieval order, `batch_size` pairs per model call.
+    A batch is skipped once the time spent plus its expected cost (running
+    average per pair) would exceed the budget; unscored candidates then keep
+    their retrieval order behind the scored ones. Scores are cached in memory
+    per (query, chunk text), so repeated queries cost nothing.
+    """
+
+    def __init__(self, model_name: str = RERANK_MODEL, batch_size: int = RERANK_BATCH_SIZE,
+                 budget_ms: Optional[float] = RERANK_BUDGET_MS, cache_size: int = RERANK_CACHE_SIZE):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.budget_ms = budget_ms
+        self.cache_size = cache_size
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._scores: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        # running average seconds per scored pair (0 until the first batch)
+        self._pair_s = 0.0
+        self.scored = 0
+        self.cache_hits = 0
+        self.cut_short = 0
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from src.config import load_env
+                    load_env()  # HF_* settings may live in .env
+                    from sentence_transformers import CrossEncoder
+                    self._model = CrossEncoder(self.model_name, device="cpu")
+        return self._model
+
+    def _cached(self, keys: Sequence[Tuple[str, str]]) -> Dict[int, float]:
+        found = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                score = self._scores.get(key)
+                if score is not None:
+                    self._scores.move_to_end(key)
+                    found[i] = score
+        self.cache_hits += len(found)
+        return found
+
+    def _store(self, items: Sequence[Tuple[Tuple[str, str], float]]):
+        with self._lock:
+            for key, score in items:
+                self._scores[key] = score
+                self._scores.move_to_end(key)
+            while len(self._scores) > self.cache_size:
+                self._scores.popitem(last=False)
+
+    def scores(self, query: str, docs: Sequence[Document],
+               budget_ms: Optional[float] = None) -> Dict[int, float]:
+        """Cross-encoder score per candidate position, for as many as the budget allows."""
+        budget_ms = self.budget_ms if budget_ms is None else budget_ms
+        q = normalize_query(query)
+        keys = [(q, hash_text(doc.page_content)) for doc in docs]
+        scores = self._cached(keys)
+        todo = [i for i in range(len(docs)) if i not in scores]
+        trace = current_span()
+        trace.set(cache_hits=len(scores), scored=0, cut_short=False)
+        if not todo:
+            return scores
+
+        model = self.model  # loading the model is not part of the query's budget
+        start = time.perf_counter()
+        for b in range(0, len(todo), self.batch_size):
+            batch = todo[b:b + self.batch_size]
+            elapsed = time.perf_counter() - start
+            if budget_ms and (elapsed + len(batch) * self._pair_s) * 1000 > budget_ms:
+                self.cut_short += 1
+                trace.set(cut_short=True)
+                break
+            t0 = time.perf_counter()
+            out = model.predict([(query, docs[i].page_content) for i in batch],
+                                batch_size=len(batch), show_progress_bar=False)
+            per_pair = (time.perf_counter() - t0) / len(batch)
+            self._pair_s = per_pair if not self._pair_s else 0.8 * self._pair_s + 0.2 * per_pair
+            fresh = [(i, float(s)) for i, s in zip(batch, out)]
+            scores.update(fresh)
+            self._store([(keys[i], s) for i, s in fresh])
+            self.scored += len(batch)
+            trace.add("scored", len(batch))
+        return scores
+
+    def rerank(self, query: str, docs: Sequence[Document], k: int = 5,
+               budget_ms: Optional[float] = None) -> List[Document]:
+        """Top-k of `docs` by cross-encoder score (unscored ones after, in retrieval order)."""
+        if not docs:
+            return []
+        with span("retrieval.rerank", candidates=len(docs)):
+            scores = self.scores(query, docs, budget_ms)
+        scored = sorted(scores, key=lambda i: -scores[i])
+        rest = [i for i in range(len(docs)) if i not in scores]
+        return [docs[i] for i in (scored + rest)[:k]]
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "scored": self.scored,
+            "cache_hits": self.cache_hits,
+            "cut_short": self.cut_short,
+            "ms_per_pair": round(self._pair_s * 1000, 3),
+        }
+
+
+_reranker: Optional[Reranker] = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker() -> Reranker:
+    """Shared Reranker, created on first use."""
+    global _reranker
+    with _reranker_lock:
+        if _reranker is None:
+            _reranker = Reranker()
+        return _reranker
+
+
+def search_reranked(retriever, query: str, k: int = 5, mode: str = SEARCH_MODE,
+                    filters: Optional[SearchFilter] = None,
+                    rerank: bool = RERANK_ENABLED,
+                    queries: Optional[Sequence[str]] = None) -> List[Document]:
+    """
+    retriever.search (or search_many with extra `queries`), optionally widened
+    to RERANK_CANDIDATES and reranked down to k against the original query.
+    """
+    depth = max(k, RERANK_CANDIDATES) if rerank else k
+    if queries:
+        candidates = retriever.search_many([query, *queries], k=depth, mode=mode, filters=filters)
+    else:
+        candidates = retriever.search(query, k=depth, mode=mode, filters=filters)
+    if not rerank:
+        return candidates
+    return get_reranker().rerank(query, candidates, k)
+
+
+async def asearch_reranked(retriever, query: str, k: int = 5, mode: str = SEARCH_MODE,
+                           filters: Optional[SearchFilter] = None,
+                           rerank: bool = RERANK_ENABLED,
+                           queries: Optional[Sequence[str]] = None) -> List[Document]:
+    """
+    Async counterpart: candidates via retriever.asearch (or asearch_many with extra
+    `queries`), reranking on the search pool against the original query.
+    """
+    depth = max(k, RERANK_CANDIDATES) if rerank else k
+    if queries:
+        candidates = await retriever.asearch_many([query, *queries], k=depth, mode=mode, filters=filters)
+    else:
+        candidates = await retriever.asearch(query, k=depth, mode=mode, filters=filters)
+    if not rerank:
+        return candidates
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(search_executor(), ctx.run, get_reranker().rerank, query, candidates, k)
@@ -0,0 +1,246 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from src.config import (
+    RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_PATH,
+    RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_STALE_TTL,
+    RESPONSE_CACHE_MAX_BYTES,
+)
+from src.utils.index_manifest import hash_text
+from src.utils.query_cache import normalize_query
+
+
+def context_hash(docs: Iterable[Any]) -> str:
+    """Order-sensitive hash of the retrieved chunks (by content, so it survives index rebuilds)."""
+    ids = [hash_text(getattr(d, "page_content", d)) for d in docs]
+    return hashlib.md5(",".join(ids).encode("utf-8")).hexdigest()
+
+
+def response_key(kind: str, settings: Dict[str, Any], **parts: Any) -> str:
+    """
+    Cache key for one LLM response: what produced it (`kind`, e.g. "direct" or
+    "crew"), the model settings and the request parts. Question and character
+    strings are normalized so casing/whitespace variants share an entry.
+    """
+    for name in ("question", "character"):
+        if isinstance(parts.get(name), str):
+            parts[name] = normalize_query(parts[name])
+    payload = json.dumps({"kind": kind, "settings": settings, **parts}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Persistent key -> response text cache in SQLite with a TTL, an optional
+    stale-while-revalidate window and least-recently-used eviction by total size.
+    """
+
+    def __init__(self, path: str = RESPONSE_CACHE_PATH, ttl: float = RESPONSE_CACHE_TTL,
+                 stale_ttl: float = RESPONSE_CACHE_STALE_TTL,
+                 max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        # background refresh tasks of aget_or_compute (referenced until done)
+        self._tasks = set()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, kind TEXT NOT NULL, response TEXT NOT NULL,"
+                " size INTEGER NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)"
+            )
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def _lookup(self, key: str):
+        """(response, age in seconds) or None; touches last_used on a hit."""
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            return row[0], now - row[1]
+
+    def get(self, key: str) -> Optional[str]:
+        """Fresh entry or None (stale entries count as missing here)."""
+        found = self._lookup(key)
+        if found is None or (self.ttl and found[1] > self.ttl):
+            return None
+        return found[0]
+
+    def put(self, key: str, response: str, kind: str = ""):
+        if not isinstance(response, str) or not response:
+            return
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, kind, response, size, created, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, kind, response, size, now, now),
+            )
+            self._evict()
+
+    def _evict(self):
+        (total,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if total <= self.max_bytes:
+            return
+        # trim to 90% so we do not evict on every insert
+        target = total - int(self.max_bytes * 0.9)
+        freed = 0
+        doomed = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_used"):
+            doomed.append((key,))
+            freed += size
+            if freed >= target:
+                break
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+
+    def _refresh(self, key: str, compute: Callable[[], str], kind: str):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                self.put(key, compute(), kind)
+            except Exception as e:
+                print(f"⚠️ Background refresh of a cached response failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, name="hp-response-refresh", daemon=True).start()
+
+    def _state(self, found) -> Optional[str]:
+        """"fresh", "stale" (serve, then refresh) or None (recompute) for a _lookup result."""
+        if found is None:
+            return None
+        age = found[1]
+        if not self.ttl or age <= self.ttl:
+            self.hits += 1
+            return "fresh"
+        if self.stale_ttl and age <= self.ttl + self.stale_ttl:
+            self.stale_hits += 1
+            return "stale"
+        return None
+
+    def get_or_compute(self, key: str, compute: Callable[[], str], kind: str = "") -> str:
+        """
+        Cached response for `key`, calling compute() on a miss. Within the stale
+        window an expired entry is returned at once and refreshed in the background.
+        """
+        found = self._lookup(key)
+        state = self._state(found)
+        if state == "stale":
+            self._refresh(key, compute, kind)
+        if state is not None:
+            return found[0]
+        self.misses += 1
+        response = compute()
+        self.put(key, response, kind)
+        return response
+
+    # async counterparts: the SQLite work runs on the default executor, never the event loop
+
+    async def aget(self, key: str) -> Optional[str]:
+        return await asyncio.get_running_loop().run_in_executor(None, self.get, key)
+
+    async def aput(self, key: str, response: str, kind: str = ""):
+        await asyncio.get_running_loop().run_in_executor(None, self.put, key, response, kind)
+
+    def _arefresh(self, key: str, compute: Callable[[], Awaitable[str]], kind: str):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        async def run():
+            try:
+                await self.aput(key, await compute(), kind)
+            except Exception as e:
+                print(f"⚠️ Background refresh of a cached response failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        task = asyncio.get_running_loop().create_task(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def aget_or_compute(self, key: str, compute: Callable[[], Awaitable[str]], kind: str = "") -> str:
+        """get_or_compute() for a coroutine function, with the same TTL and stale-while-revalidate policy."""
+        found = await asyncio.get_running_loop().run_in_executor(None, self._lookup, key)
+        state = self._state(found)
+        if state == "stale":
+            self._arefresh(key, compute, kind)
+        if state is not None:
+            return found[0]
+        self.misses += 1
+        response = await compute()
+        await self.aput(key, response, kind)
+        return response
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.stale_hits) / lookups, 3) if lookups else 0.0,
+            "entries": len(self),
+        }
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Shared ResponseCache, or None when RESPONSE_CACHE_ENABLED is off."""
+    global _cache
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
+
+
+def cached_response(kind: str, settings: Dict[str, Any], compute: Callable[[], str],
+                    **parts: Any) -> str:
+    """compute() through the shared cache (or directly when it is disabled)."""
+    cache = get_response_cache()
+    if cache is None:
+        return compute()
+    return cache.get_or_compute(response_key(kind, settings, **parts), compute, kind)
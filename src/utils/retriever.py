@@ -0,0 +1,618 @@
+from __future__ import annotations
+
+import os
+import json
+import asyncio
+import hashlib
+import pickle
+import functools
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from src.config import (
+    CHUNK_OVERLAP,
+    CHUNK_SIZE,
+    CORPUS_MANIFEST,
+    EMBEDDING_MODEL,
+    EXTRACT_WORKERS,
+    INDEX_FORMAT,
+    INDEX_TYPE,
+    SEARCH_MODE,
+    HYBRID_CANDIDATES,
+    RRF_K,
+    SEARCH_WORKERS,
+)
+from src.utils.pdf_processor import CHUNKER_VERSION, PDFProcessor
+from src.utils.index_manifest import IndexManifest, chunk_ids, hash_text
+from src.utils.query_cache import QueryCache
+from src.utils.mmap_store import MmapVectorStore
+from src.utils.ann_index import load_or_build_ann
+from src.utils.bm25_index import BM25Index, load_or_build_bm25, reciprocal_rank_fusion
+from src.utils.search_filters import FilterMasks, SearchFilter
+from src.utils.corpus import BookSpec
+from src.utils.tracing import current_span, span
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+    from src.utils.embedding_service import EmbeddingService
+
+INDEX_FOLDER = "./faiss_index"
+PDF_HASH_FILE = os.path.join(INDEX_FOLDER, "pdf_hash.pkl")
+
+
+# one embedding model per process, shared by every retriever
+_embeddings: Dict[str, Any] = {}
+_embeddings_lock = threading.Lock()
+
+
+def get_embeddings(model_name: str = EMBEDDING_MODEL) -> EmbeddingService:
+    """Load (once) and return the cached, batched embedding service."""
+    # langchain_core (EmbeddingService's base class) is only imported once a search needs it
+    from src.utils.embedding_service import EmbeddingCache, EmbeddingService, full_model_name
+    model_name = full_model_name(model_name)
+    with _embeddings_lock:
+        emb = _embeddings.get(model_name)
+        if emb is None:
+            emb = EmbeddingService(model_name, cache=EmbeddingCache())
+            _embeddings[model_name] = emb
+        return emb
+
+
+class AsyncSearchMixin:
+    """asyncio front end for anything with a thread-safe search()."""
+
+    async def asearch(self, query: str, k: int = 5, mode: str = SEARCH_MODE,
+                      filters: Optional[SearchFilter] = None) -> List[Document]:
+        """search() on the shared search pool, so the event loop is never blocked by it."""
+        loop = asyncio.get_running_loop()
+        # copy the context so spans opened in search() nest under the caller's
+        ctx = contextvars.copy_context()
+        return await loop.run_in_executor(
+            search_executor(), functools.partial(ctx.run, self.search, query, k, mode, filters)
+        )
+
+    def search_many(self, queries: Sequence[str], k: int = 5, mode: str = SEARCH_MODE,
+                    filters: Optional[SearchFilter] = None) -> List[Document]:
+        """
+        Several phrasings of one question (e.g. alias expansions) in one
+        search_batch call: one encoder batch, one batched index search. The
+        result lists are fused and deduplicated into one top-k.
+        """
+        if filters is not None and filters.empty:
+            filters = None
+        with span("retrieval.search_many", queries=len(queries), k=k, mode=mode,
+                  filtered=filters is not None) as s:
+            results = merge_results(self.search_batch(queries, k=k, mode=mode, filters=filters), k)
+            s.set(hits=len(results))
+            return results
+
+    async def asearch_many(self, queries: Sequence[str], k: int = 5, mode: str = SEARCH_MODE,
+                           filters: Optional[SearchFilter] = None) -> List[Document]:
+        """search_many() on the search pool."""
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        return await loop.run_in_executor(
+            search_executor(), functools.partial(ctx.run, self.search_many, queries, k, mode, filters)
+        )
+
+
+class Retriever(AsyncSearchMixin):
+    """Owns the FAISS store built from one PDF; safe to share across threads."""
+
+    def __init__(self, pdf_path: str = None, index_folder: str = INDEX_FOLDER,
+                 book: Optional[BookSpec] = None):
+        # a corpus book brings its own path and edition cleaning rules
+        self.book = book
+        rules: Dict[str, Any] = {"chunker": [CHUNKER_VERSION, CHUNK_SIZE, CHUNK_OVERLAP]}
+        if book is not None:
+            self._processor = PDFProcessor(book.path, **book.processor_options())
+            rules.update(book.processor_options())
+        else:
+            self._processor = PDFProcessor(pdf_path)
+        # cleaning + chunking settings: changing them makes the index stale
+        self._rules_hash = hash_text(json.dumps(rules, sort_keys=True))
+        self.pdf_path = self._processor.pdf_path
+        self.index_folder = index_folder
+        self.extract_workers = EXTRACT_WORKERS
+        self.hash_file = os.path.join(index_folder, "pdf_hash.pkl")
+        self._lock = threading.RLock()
+        self._emb = None
+        self._vs = None
+        # hash of the PDF the loaded index was built from
+        self.index_version: Optional[str] = None
+        self.query_cache = QueryCache()
+        # (size, mtime) of the PDF -> its hash, so a load hashes the file once
+        self._pdf_hash: Optional[Tuple[Tuple[int, int], str]] = None
+        self._bm25: Optional[BM25Index] = None
+        self._masks: Optional[FilterMasks] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._vs is not None
+
+    def __len__(self) -> int:
+        vs = self.load()._vs
+        return len(vs) if isinstance(vs, MmapVectorStore) else vs.index.ntotal
+
+    @property
+    def index_fingerprint(self) -> str:
+        """Changes whenever the indexed chunks may have: new source PDF or cleaning/chunking rules."""
+        return hash_text(f"{self.load().index_version}:{self._rules_hash}")
+
+    def stores(self) -> list:
+        """The loaded vector store(s) (one here; one per book for a ShardedRetriever)."""
+        return [self.load()._vs]
+
+    def load(self) -> "Retriever":
+        """Load the index from disk, or build it if missing/stale. Idempotent."""
+        if self._vs is not None:
+            return self
+        with self._lock:
+            if self._vs is None:
+                self._open_store()
+        return self
+
+    def reload(self) -> "Retriever":
+        """
+        Load (or rebuild) the index again, e.g. after the PDF changed. Searches
+        keep using the current store until the new one is ready.
+        """
+        with self._lock:
+            self._open_store()
+        return self
+
+    def _open_store(self):
+        """Load or build the store, then swap it in with a single assignment (caller holds the lock)."""
+        with span("index.load", folder=self.index_folder) as s:
+            self._emb = get_embeddings()
+            vs = self._load_existing() if self._index_is_valid() else None
+            if vs is not None:
+                print("✅ Loading existing FAISS index...")
+            else:
+                print("🔄 Building new FAISS index...")
+                s.set(built=True)
+                vs = self._build_index()
+            version = self._compute_pdf_hash()
+            self._attach_ann(vs, version)
+            # lexical index and filter masks belong to the old rows; rebuilt on first use
+            self._bm25 = None
+            self._masks = None
+            self.index_version = version
+            self._vs = vs
+            # cached results from an older index are no longer valid
+            self.query_cache.invalidate(version)
+
+    def _attach_ann(self, vs, version: str):
+        """Put the configured approximate index (if any) in front of the store."""
+        if INDEX_TYPE == "flat":
+            return
+        if not isinstance(vs, MmapVectorStore):
+            print(f"⚠️ INDEX_TYPE={INDEX_TYPE!r} needs INDEX_FORMAT='mmap'; using exact search.")
+            return
+        vs.attach_ann(load_or_build_ann(self.index_folder, np.asarray(vs.vectors), version))
+
+    def _index_is_valid(self) -> bool:
+        if not os.path.exists(self.index_folder):
+            return False
+        if INDEX_FORMAT == "mmap":
+            info = MmapVectorStore.read_info(self.index_folder)
+            return info is not None and info.get("pdf_hash") == self._compute_pdf_hash()
+        manifest = IndexManifest.load(self.index_folder)
+        if manifest is not None:
+            return manifest.pdf_hash == self._compute_pdf_hash()
+        if not os.path.exists(self.hash_file):
+            return False
+        current = self._compute_pdf_hash()
+        try:
+            with open(self.hash_file, "rb") as f:
+                saved = pickle.load(f)
+            return saved == current
+        except Exception:
+            return False
+
+    def _compute_pdf_hash(self) -> str:
+        st = os.stat(self.pdf_path)
+        stamp = (st.st_size, st.st_mtime_ns)
+        if self._pdf_hash is not None and self._pdf_hash[0] == stamp:
+            return self._pdf_hash[1]
+        h = hashlib.md5()
+        with open(self.pdf_path, "rb") as f:
+            h.update(f.read())
+        # new cleaning/chunking rules make the index stale just like a new file
+        h.update(self._rules_hash.encode("utf-8"))
+        self._pdf_hash = (stamp, h.hexdigest())
+        return self._pdf_hash[1]
+
+    def _load_existing(self):
+        """The index currently on disk, or None if there is no usable one."""
+        if INDEX_FORMAT == "mmap":
+            # never fall back to the pickled format here: rebuilding is the safe path
+            if not MmapVectorStore.exists(self.index_folder):
+                return None
+            try:
+                return MmapVectorStore(self.index_folder, self._emb)
+            except (OSError, ValueError, KeyError):
+                return None
+        if not os.path.exists(os.path.join(self.index_folder, "index.faiss")):
+            return None
+        from langchain_community.vectorstores import FAISS
+        try:
+            return FAISS.load_local(
+                self.index_folder, self._emb, allow_dangerous_deserialization=True
+            )
+        except Exception:
+            return None
+
+    def _extract_chunks(self) -> Tuple[List[str], List[Document]]:
+        """
+        (page hashes, chunks): chapters are cleaned and chunked as soon as their
+        pages are extracted, instead of after the whole PDF is.
+        """
+        page_hashes: List[str] = []
+
+        def hashed(pages):
+            for page in pages:
+                page_hashes.append(hash_text(page))
+                yield page
+
+        source = os.path.basename(self.pdf_path)
+        with span("pdf.process", source=source, workers=self.extract_workers or 0) as s:
+            pages = self._processor.iter_pages(workers=self.extract_workers)
+            chunks = list(self._processor.process_stream(pages=hashed(pages)))
+            s.set(pages=len(page_hashes), chunks=len(chunks),
+                  **{f"{stage}_ms": round(sec * 1000, 3) for stage, sec in self._processor.timings.items()})
+        return page_hashes, chunks
+
+    @staticmethod
+    def _reusable_vectors(vs, manifest: Optional[IndexManifest]) -> Dict[str, Any]:
+        """content hash -> stored vector for every chunk in an existing index."""
+        if vs is None:
+            return {}
+        vectors = {}
+        if isinstance(vs, MmapVectorStore):
+            # rows are stored in manifest order
+            if manifest is not None and len(manifest.chunks) == len(vs):
+                hashes = [h for _, h in manifest.chunks]
+            else:
+                hashes = [hash_text(vs.text(i)) for i in range(len(vs))]
+            for i, h in enumerate(hashes):
+                if h not in vectors:
+                    vectors[h] = np.array(vs.vectors[i])
+            return vectors
+
+        known = dict(manifest.chunks) if manifest is not None else {}
+        for pos, doc_id in vs.index_to_docstore_id.items():
+            h = known.get(doc_id)
+            if h is None:
+                doc = vs.docstore.search(doc_id)
+                if not hasattr(doc, "page_content"):
+                    continue
+                h = hash_text(doc.page_content)
+            if h not in vectors:
+                vectors[h] = vs.index.reconstruct(pos)
+        return vectors
+
+    def _save_hashes(self, manifest: IndexManifest):
+        manifest.save(self.index_folder)
+        if INDEX_FORMAT == "mmap":
+            MmapVectorStore.stamp(self.index_folder, manifest.pdf_hash)
+            return
+        # keep the legacy single-hash file in sync for older checkouts
+        with open(self.hash_file, "wb") as f:
+            pickle.dump(manifest.pdf_hash, f)
+
+    def _build_index(self):
+        """
+        (Re)build the index, re-embedding only chunks whose text is not already
+        in the existing store. Chunks are laid out in the same order with the
+        same ids a from-scratch build would produce, so the result is identical.
+        """
+        from langchain_community.vectorstores import FAISS
+
+        pdf_hash = self._compute_pdf_hash()
+        # chunking is cheap next to extraction, so it happens even if the text turns out unchanged
+        page_hashes, chunks = self._extract_chunks()
+
+        manifest = IndexManifest.load(self.index_folder)
+        old_vs = self._load_existing()
+
+        if (manifest is not None and old_vs is not None and manifest.rules == self._rules_hash
+                and not manifest.changed_pages(page_hashes)):
+            # file changed but its text did not (e.g. PDF metadata edit)
+            print("✅ PDF text unchanged; keeping existing FAISS index.")
+            manifest.pdf_hash = pdf_hash
+            self._save_hashes(manifest)
+            return old_vs
+
+        if manifest is not None:
+            print(f"🔎 {len(manifest.changed_pages(page_hashes))} page(s) changed since last build.")
+
+        texts = [c.page_content for c in chunks]
+        ids = chunk_ids(texts)
+
+        vectors = self._reusable_vectors(old_vs, manifest)
+        if isinstance(old_vs, MmapVectorStore):
+            # the reused vectors are copies; unmap this handle so only the live
+            # store keeps the old version (pruned once nothing maps it)
+            old_vs.close()
+            old_vs = None
+        missing = [i for i, (_, h) in enumerate(ids) if h not in vectors]
+        print(f"♻️ Reusing {len(chunks) - len(missing)} embeddings, embedding {len(missing)} chunk(s).")
+        current_span().set(pages=len(page_hashes), chunks=len(chunks), embedded=len(missing))
+        if missing:
+            with span("index.embed_chunks", chunks=len(missing)):
+                fresh = self._emb.embed_documents([texts[i] for i in missing])
+            for i, vec in zip(missing, fresh):
+                vectors[ids[i][1]] = vec
+
+        if INDEX_FORMAT == "mmap":
+            MmapVectorStore.write(
+                self.index_folder,
+                texts,
+                [c.metadata for c in chunks],
+                [vectors[h] for _, h in ids],
+                pdf_hash=pdf_hash,
+            )
+            vs = MmapVectorStore(self.index_folder, self._emb)
+            # lexical side of hybrid search, over the same rows
+            BM25Index.build(self.index_folder, texts, pdf_hash)
+        else:
+            # build FAISS
+            vs = FAISS.from_embeddings(
+                [(t, vectors[h]) for t, (_, h) in zip(texts, ids)],
+                embedding=self._emb,
+                metadatas=[c.metadata for c in chunks],
+                ids=[cid for cid, _ in ids],
+            )
+            os.makedirs(self.index_folder, exist_ok=True)
+            vs.save_local(self.index_folder)
+
+        self._save_hashes(IndexManifest(pdf_hash=pdf_hash, pages=page_hashes, chunks=ids,
+                                        rules=self._rules_hash))
+        return vs
+
+    def _require_mmap(self, what: str) -> MmapVectorStore:
+        """The loaded store, or a clear error if `what` is not possible with the FAISS format."""
+        vs = self.load()._vs
+        if not isinstance(vs, MmapVectorStore):
+            raise RuntimeError(f"{what} needs INDEX_FORMAT='mmap'.")
+        return vs
+
+    def bm25(self) -> BM25Index:
+        """The lexical index over the same rows as the vector store (built on first use)."""
+        self.load()
+        if self._bm25 is None:
+            with self._lock:
+                if self._bm25 is None:
+                    vs = self._require_mmap("Hybrid search")
+                    self._bm25 = load_or_build_bm25(
+                        self.index_folder,
+                        lambda: (vs.text(i) for i in range(len(vs))),
+                        self.index_version,
+                    )
+        return self._bm25
+
+    def filter_mask(self, filters: SearchFilter):
+        """Row bitmap for `filters` (cached per filter)."""
+        vs = self._require_mmap("Filtered search")
+        if self._masks is None or self._masks.store is not vs:
+            self._masks = FilterMasks(vs, self.bm25)
+        return self._masks.mask(filters)
+
+    # scored hits, used by ShardedRetriever to merge results across books:
+    # squared L2 distances are comparable between shards (same embedding model)
+
+    def vector_hits(self, query_emb: Sequence[float], k: int,
+                    filters: Optional[SearchFilter] = None) -> List[Tuple[Document, float]]:
+        """(document, squared L2 distance) pairs, nearest first."""
+        vs = self.load()._vs
+        if filters is not None:
+            mask = self.filter_mask(filters)
+            return [(vs.document(r), d) for r, d in vs.search_rows(query_emb, k, mask=mask)]
+        return vs.similarity_search_with_score_by_vector(query_emb, k=k)
+
+    def vector_hits_batch(self, query_embs: Sequence[Sequence[float]], k: int,
+                          filters: Optional[SearchFilter] = None) -> List[List[Tuple[Document, float]]]:
+        vs = self.load()._vs
+        mask = self.filter_mask(filters) if filters is not None else None
+        if isinstance(vs, MmapVectorStore):
+            return [[(vs.document(r), d) for r, d in hits]
+                    for hits in vs.search_rows_batch(query_embs, k, mask=mask)]
+        return [vs.similarity_search_with_score_by_vector(e, k=k) for e in query_embs]
+
+    def lexical_hits(self, query: str, k: int,
+                     filters: Optional[SearchFilter] = None) -> List[Tuple[Document, float]]:
+        """(document, BM25 score) pairs, best first."""
+        mask = self.filter_mask(filters) if filters is not None else None
+        vs = self.load()._vs
+        return [(vs.document(r), s) for r, s in self.bm25().search_rows(query, k, mask=mask)]
+
+    def search(self, query: str, k: int = 5, mode: str = SEARCH_MODE,
+               filters: Optional[SearchFilter] = None) -> List[Document]:
+        """
+        Top-k passages for `query`. mode="vector" is pure embedding search;
+        mode="hybrid" fuses BM25 and vector rankings with reciprocal-rank fusion.
+        `filters` restricts the search to matching rows before any scoring.
+        """
+        if mode not in ("vector", "hybrid"):
+            raise ValueError(f"Unknown search mode {mode!r}")
+        if filters is not None and filters.empty:
+            filters = None
+        self.load()
+        if mode == "hybrid":
+            # fail up front, not with an AttributeError from the FAISS store
+            self._require_mmap("Hybrid search")
+        with span("retrieval.search", k=k, mode=mode, filtered=filters is not None) as s:
+            results = self._search(query, k, mode, filters, s)
+            s.set(hits=len(results))
+            return results
+
+    def _search(self, query: str, k: int, mode: str, filters: Optional[SearchFilter],
+                trace) -> List[Document]:
+        cache_key = (k, mode, filters.key() if filters else None)
+        cached = self.query_cache.get(query, cache_key)
+        if cached is not None:
+            trace.set(cache_hit=True)
+            return cached
+
+        with span("retrieval.embed_query"):
+            query_emb = self._emb.embed_query(query)
+        cached = self.query_cache.get_similar(cache_key, query_emb)
+        if cached is not None:
+            trace.set(cache_hit=True, near_duplicate=True)
+            return cached
+
+        # FAISS searches are read-only; only reload() swaps the store out
+        vs = self._vs
+        with span("retrieval.index_search", k=k, mode=mode):
+            mask = self.filter_mask(filters) if filters else None
+            if mode == "hybrid":
+                depth = max(k, HYBRID_CANDIDATES)
+                vector_rows = [r for r, _ in vs.search_rows(query_emb, depth, mask=mask)]
+                lexical_rows = [r for r, _ in self.bm25().search_rows(query, depth, mask=mask)]
+                fused = reciprocal_rank_fusion([vector_rows, lexical_rows], k=RRF_K)
+                results = [vs.document(r) for r in fused[:k]]
+            elif mask is not None:
+                results = [vs.document(r) for r, _ in vs.search_rows(query_emb, k, mask=mask)]
+            else:
+                results = vs.similarity_search_by_vector(query_emb, k=k)
+        trace.set(cache_hit=False)
+        self.query_cache.put(query, cache_key, query_emb, results)
+        return results
+
+
+    def search_batch(self, queries: Sequence[str], k: int = 5, mode: str = SEARCH_MODE,
+                     filters: Optional[SearchFilter] = None) -> List[List[Document]]:
+        """
+        search() for many queries at once: cache misses are embedded in one
+        encoder call and scored with one batched vector search.
+        """
+        if mode not in ("vector", "hybrid"):
+            raise ValueError(f"Unknown search mode {mode!r}")
+        if filters is not None and filters.empty:
+            filters = None
+        self.load()
+        if mode == "hybrid":
+            # never fall back to vector-only results under the "hybrid" cache key
+            self._require_mmap("Hybrid search")
+        cache_key = (k, mode, filters.key() if filters else None)
+        out: List[Optional[List[Document]]] = [self.query_cache.get(q, cache_key) for q in queries]
+        todo = [i for i, r in enumerate(out) if r is None]
+        if not todo:
+            return out
+
+        embs = self._emb.embed_documents([queries[i] for i in todo])
+        pending = []
+        for i, emb in zip(todo, embs):
+            out[i] = self.query_cache.get_similar(cache_key, emb)
+            if out[i] is None:
+                pending.append((i, emb))
+        if not pending:
+            return out
+
+        vs = self._vs
+        if not isinstance(vs, MmapVectorStore) and filters is None:
+            for i, emb in pending:
+                out[i] = vs.similarity_search_by_vector(emb, k=k)
+                self.query_cache.put(queries[i], cache_key, emb, out[i])
+            return out
+
+        mask = self.filter_mask(filters) if filters else None
+        depth = max(k, HYBRID_CANDIDATES) if mode == "hybrid" else k
+        hits = vs.search_rows_batch([emb for _, emb in pending], depth, mask=mask)
+        for (i, emb), vector_hits in zip(pending, hits):
+            rows = [r for r, _ in vector_hits]
+            if mode == "hybrid":
+                lexical_rows = [r for r, _ in self.bm25().search_rows(queries[i], depth, mask=mask)]
+                rows = reciprocal_rank_fusion([rows, lexical_rows], k=RRF_K)
+            out[i] = [vs.document(r) for r in rows[:k]]
+            self.query_cache.put(queries[i], cache_key, emb, out[i])
+        return out
+
+
+def merge_results(result_lists: Sequence[Sequence[Document]], k: int = 5) -> List[Document]:
+    """Reciprocal-rank fusion of several result lists, deduplicated by passage text."""
+    by_text: Dict[str, Document] = {}
+    rankings = []
+    for docs in result_lists:
+        rankings.append([doc.page_content for doc in docs])
+        for doc in docs:
+            by_text.setdefault(doc.page_content, doc)
+    return [by_text[t] for t in reciprocal_rank_fusion(rankings, k=RRF_K)[:k]]
+
+
+# embedding + numpy/FAISS release the GIL, so a thread pool is enough to keep
+# async callers off the event loop; shared so concurrency stays bounded
+_search_pool: Optional[ThreadPoolExecutor] = None
+_search_pool_lock = threading.Lock()
+
+
+def search_executor() -> ThreadPoolExecutor:
+    global _search_pool
+    with _search_pool_lock:
+        if _search_pool is None:
+            _search_pool = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="hp-search")
+        return _search_pool
+
+
+async def run_in_search_pool(fn, *args, **kwargs):
+    """fn(*args, **kwargs) on the search pool (spans nest under the caller's), awaited from the loop."""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(search_executor(), functools.partial(ctx.run, fn, *args, **kwargs))
+
+
+# process-wide registry: one Retriever per (pdf, index folder), and one
+# ShardedRetriever per corpus manifest when no single PDF is asked for
+_registry: Dict[Tuple[str, str], Retriever] = {}
+_registry_lock = threading.Lock()
+
+
+def _key(pdf_path: Optional[str], index_folder: Optional[str]) -> Tuple[str, str]:
+    from src.config import PDF_PATH
+    return (
+        os.path.abspath(pdf_path or PDF_PATH),
+        os.path.abspath(index_folder or INDEX_FOLDER),
+    )
+
+
+def get_retriever(pdf_path: str = None, index_folder: str = None) -> Retriever:
+    """
+    Return the shared retriever, creating it on first use: for `pdf_path` a
+    single-book Retriever, otherwise the whole corpus from CORPUS_MANIFEST
+    (falling back to PDF_PATH alone when there is no manifest).
+    """
+    corpus = pdf_path is None and os.path.exists(CORPUS_MANIFEST)
+    if corpus:
+        key = ("corpus:" + os.path.abspath(CORPUS_MANIFEST), os.path.abspath(index_folder or INDEX_FOLDER))
+    else:
+        key = _key(pdf_path, index_folder)
+    with _registry_lock:
+        retriever = _registry.get(key)
+        if retriever is None:
+            if corpus:
+                from src.utils.sharded_retriever import ShardedRetriever
+                retriever = ShardedRetriever(index_folder=index_folder or INDEX_FOLDER)
+            else:
+                retriever = Retriever(pdf_path, index_folder or INDEX_FOLDER)
+            _registry[key] = retriever
+    return retriever
+
+
+def warm_up(pdf_path: str = None, index_folder: str = None) -> Retriever:
+    """Load the embedding model and FAISS store now instead of on the first query."""
+    return get_retriever(pdf_path, index_folder).load()
+
+
+def reload_retriever(pdf_path: str = None, index_folder: str = None) -> Retriever:
+    """Force the shared Retriever to re-read (or rebuild) its index."""
+    return get_retriever(pdf_path, index_folder).reload()
+
+
+def clear_registry():
+    """Forget every shared Retriever (mainly for tests and interactive use)."""
+    with _registry_lock:
+        _registry.clear()
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import time
+import queue
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, Dict, List, Tuple
+
+from src.config import SERVER_BATCH_MAX, SERVER_BATCH_WAIT_MS, SERVER_MAX_PENDING_SEARCHES
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+
+class BatcherFull(RuntimeError):
+    """Raised when too many searches are already waiting for a batch."""
+
+
+class SearchBatcher:
+    """
+    Collects searches submitted from many threads and runs them through
+    Retriever.search_batch together: the first request in a batch waits at
+    most `max_wait_ms` for company, a batch holds at most `max_batch` queries.
+    """
+
+    def __init__(self, retriever, max_batch: int = SERVER_BATCH_MAX,
+                 max_wait_ms: float = SERVER_BATCH_WAIT_MS,
+                 max_pending: int = SERVER_MAX_PENDING_SEARCHES):
+        self.retriever = retriever
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue[Tuple[str, int, str, Future]]" = queue.Queue(maxsize=max_pending)
+        self.batches = 0
+        self.queries = 0
+        self._thread = threading.Thread(target=self._loop, name="hp-search-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, query: str, k: int = 5, mode: str = "vector") -> "Future[List[Document]]":
+        fut: Future = Future()
+        try:
+            self._queue.put_nowait((query, k, mode, fut))
+        except queue.Full:
+            raise BatcherFull(f"{self._queue.qsize()} searches already waiting")
+        return fut
+
+    def search(self, query: str, k: int = 5, mode: str = "vector",
+               timeout: float = None) -> List[Document]:
+        return self.submit(query, k, mode).result(timeout)
+
+    async def asearch(self, query: str, k: int = 5, mode: str = "vector") -> List[Document]:
+        """search() from an event loop: the coroutine waits for the batch, no thread does."""
+        return await asyncio.wrap_future(self.submit(query, k, mode))
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _collect(self) -> List[Tuple[str, int, str, Future]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            # one search_batch call per (k, mode) present in the batch
+            groups: Dict[Tuple[int, str], List[Tuple[str, Future]]] = {}
+            for query, k, mode, fut in batch:
+                if fut.set_running_or_notify_cancel():
+                    groups.setdefault((k, mode), []).append((query, fut))
+            for (k, mode), items in groups.items():
+                try:
+                    results = self.retriever.search_batch([q for q, _ in items], k=k, mode=mode)
+                except Exception as e:
+                    for _, fut in items:
+                        fut.set_exception(e)
+                    continue
+                for (_, fut), docs in zip(items, results):
+                    fut.set_result(docs)
+            self.batches += 1
+            self.queries += len(batch)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "pending": self.pending,
+            "batches": self.batches,
+            "queries": self.queries,
+            "avg_batch": round(self.queries / self.batches, 2) if self.batches else 0.0,
+        }
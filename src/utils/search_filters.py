@@ -0,0 +1,163 @@
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+ROMAN = {"I": 1, "V": 5, "X": 10, "L": 50, "C": 100}
+# spelled-out chapter numbers, as some editions print them ("CHAPTER TWENTY-ONE")
+NUMBER_WORDS = {w: i for i, w in enumerate(
+    "zero one two three four five six seven eight nine ten eleven twelve thirteen "
+    "fourteen fifteen sixteen seventeen eighteen nineteen".split()) if i}
+TENS_WORDS = {"twenty": 20, "thirty": 30, "forty": 40, "fifty": 50}
+# regex (no groups, any case) for a spelled-out number from one to fifty-nine
+NUMBER_WORDS_PATTERN = r"(?i:(?:{tens})(?:[- ](?:{units}))?|{words})".format(
+    tens="|".join(TENS_WORDS),
+    units="|".join(w for w, i in NUMBER_WORDS.items() if i < 10),
+    # longest first, so "SEVENTEEN" is not read as "SEVEN"
+    words="|".join(sorted(NUMBER_WORDS, key=len, reverse=True)),
+)
+
+
+def _words_number(text: str) -> Optional[int]:
+    words = re.split(r"[-\s]+", text.lower())
+    if len(words) == 1:
+        return NUMBER_WORDS.get(words[0], TENS_WORDS.get(words[0]))
+    if len(words) == 2 and words[0] in TENS_WORDS and NUMBER_WORDS.get(words[1], 10) < 10:
+        return TENS_WORDS[words[0]] + NUMBER_WORDS[words[1]]
+    return None
+
+
+def chapter_number(value: Any) -> Optional[int]:
+    """'12' -> 12, 'XII' -> 12, 'TWELVE' -> 12; None if the chapter label is none of these."""
+    text = str(value).strip().upper()
+    if text.isdigit():
+        return int(text)
+    if not text:
+        return None
+    if any(c not in ROMAN for c in text):
+        return _words_number(text)
+    total = 0
+    for c, nxt in zip(text, text[1:] + " "):
+        v = ROMAN[c]
+        total += -v if nxt in ROMAN and ROMAN[nxt] > v else v
+    return total
+
+
+class SearchFilter:
+    """
+    Structured scope for a search: book (matched against source/book metadata),
+    an inclusive chapter range, and characters that must be mentioned.
+    """
+
+    def __init__(self, book: Union[str, Sequence[str], None] = None,
+                 chapter_from: Any = None, chapter_to: Any = None,
+                 characters: Union[str, Sequence[str], None] = None):
+        if isinstance(book, str):
+            book = [book]
+        if isinstance(characters, str):
+            characters = [c for c in re.split(r"[,;/]", characters)]
+        self.books = [b.strip().lower() for b in (book or []) if b and b.strip()]
+        self.chapter_from = chapter_number(chapter_from) if chapter_from not in (None, "") else None
+        self.chapter_to = chapter_number(chapter_to) if chapter_to not in (None, "") else None
+        self.characters = [c.strip() for c in (characters or []) if c and c.strip()]
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> Optional["SearchFilter"]:
+        """Pick filter keys out of a tool-call dict; None if there are none."""
+        chapter = data.get("chapter")
+        flt = cls(
+            book=data.get("book"),
+            chapter_from=data.get("chapter_from", chapter),
+            chapter_to=data.get("chapter_to", chapter),
+            characters=data.get("characters") or data.get("character_mentions"),
+        )
+        return None if flt.empty else flt
+
+    @property
+    def empty(self) -> bool:
+        return not (self.books or self.chapter_from is not None
+                    or self.chapter_to is not None or self.characters)
+
+    def key(self) -> tuple:
+        return (tuple(self.books), self.chapter_from, self.chapter_to,
+                tuple(c.lower() for c in self.characters))
+
+
+class FilterMasks:
+    """
+    Builds (and caches) row bitmaps for SearchFilters over an MmapVectorStore,
+    using its dictionary-encoded metadata columns and the BM25 postings for
+    character mentions, so filtering costs a few vectorised passes over int arrays.
+    """
+
+    def __init__(self, store, bm25_fn=None, max_cached: int = 256):
+        self.store = store
+        self._bm25_fn = bm25_fn
+        self._cache: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+        self._max_cached = max_cached
+        self._lock = threading.Lock()
+
+    def _column(self, key: str) -> Optional[int]:
+        try:
+            return self.store.meta_keys.index(key)
+        except ValueError:
+            return None
+
+    def _match_codes(self, col: int, predicate) -> np.ndarray:
+        """Rows whose value in metadata column `col` satisfies predicate(value)."""
+        good = [code for code, value in enumerate(self.store.meta_values[col]) if predicate(value)]
+        return np.isin(self.store.meta_codes[:, col], np.asarray(good, dtype=np.int32))
+
+    def mask(self, flt: SearchFilter) -> np.ndarray:
+        key = flt.key()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+
+        n = len(self.store)
+        mask = np.ones(n, dtype=bool)
+
+        if flt.books:
+            book_mask = np.zeros(n, dtype=bool)
+            for name in ("book", "source"):
+                col = self._column(name)
+                if col is not None:
+                    book_mask |= self._match_codes(
+                        col, lambda v: any(b in str(v).lower() for b in flt.books)
+                    )
+            mask &= book_mask
+
+        if flt.chapter_from is not None or flt.chapter_to is not None:
+            col = self._column("chapter")
+            lo = flt.chapter_from if flt.chapter_from is not None else -np.inf
+            hi = flt.chapter_to if flt.chapter_to is not None else np.inf
+
+            def in_range(v):
+                num = chapter_number(v)
+                return num is not None and lo <= num <= hi
+
+            mask &= self._match_codes(col, in_range) if col is not None else False
+
+        if flt.characters and self._bm25_fn is not None:
+            from src.utils.bm25_index import tokenize
+            bm25 = self._bm25_fn()
+            for name in flt.characters:
+                # every token of the name must occur ("Nicolas Flamel" -> nicolas AND flamel)
+                for term in tokenize(name):
+                    span = bm25.terms.get(term)
+                    term_mask = np.zeros(n, dtype=bool)
+                    if span is not None:
+                        start, df = span
+                        term_mask[np.asarray(bm25.docs[start:start + df])] = True
+                    mask &= term_mask
+
+        mask.setflags(write=False)
+        with self._lock:
+            self._cache[key] = mask
+            while len(self._cache) > self._max_cached:
+                self._cache.popitem(last=False)
+        return mask
@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import os
+import copy
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence, Tuple
+
+from src.config import CORPUS_MANIFEST, CORPUS_WORKERS, SEARCH_MODE, HYBRID_CANDIDATES, RRF_K
+from src.utils.corpus import BookSpec, load_corpus
+from src.utils.query_cache import QueryCache
+from src.utils.bm25_index import reciprocal_rank_fusion
+from src.utils.search_filters import SearchFilter
+from src.utils.tracing import span
+from src.utils.retriever import INDEX_FOLDER, AsyncSearchMixin, Retriever, get_embeddings
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+Hit = Tuple["Document", float]
+
+
+class ShardedRetriever(AsyncSearchMixin):
+    """
+    One Retriever (index shard) per corpus book under <index_folder>/shards/<id>.
+    Shards are loaded or built in parallel and each one only ever indexes its
+    own book, so adding a book builds one new shard. Searches fan out to every
+    shard (or just the books a filter names) and merge into a global top-k:
+    vector hits by distance, hybrid by reciprocal-rank fusion of the merged
+    vector and BM25 rankings. Same search API as Retriever.
+    """
+
+    def __init__(self, books: Optional[List[BookSpec]] = None, index_folder: str = INDEX_FOLDER,
+                 manifest: str = CORPUS_MANIFEST, workers: int = CORPUS_WORKERS):
+        self.books = books if books is not None else load_corpus(manifest)
+        self.index_folder = index_folder
+        self.shards: Dict[str, Retriever] = {
+            book.id: Retriever(index_folder=os.path.join(index_folder, "shards", book.id), book=book)
+            for book in self.books
+        }
+        # parallel builds share the CPUs instead of each taking all of them for extraction
+        parallel = max(1, min(workers, len(self.shards)))
+        for shard in self.shards.values():
+            shard.extract_workers = max(1, (os.cpu_count() or 1) // parallel)
+        self._pool = ThreadPoolExecutor(max_workers=parallel, thread_name_prefix="hp-shard")
+        self._lock = threading.RLock()
+        self._emb = None
+        self.index_version: Optional[str] = None
+        self.query_cache = QueryCache()
+
+    @property
+    def loaded(self) -> bool:
+        return self.index_version is not None
+
+    def _map(self, fn: Callable[[Retriever], object], shards: Sequence[Retriever]) -> list:
+        if len(shards) == 1:
+            return [fn(shards[0])]
+        return list(self._pool.map(fn, shards))
+
+    def load(self) -> "ShardedRetriever":
+        """Load every shard, building missing/stale ones in parallel. Idempotent."""
+        if self.index_version is not None:
+            return self
+        with self._lock:
+            if self.index_version is None:
+                self._open_shards(lambda s: s.load())
+        return self
+
+    def reload(self) -> "ShardedRetriever":
+        """Reload every shard; searches keep using the current stores until each new one is ready."""
+        with self._lock:
+            self._open_shards(lambda s: s.reload())
+        return self
+
+    def _open_shards(self, fn: Callable[[Retriever], object]):
+        self._emb = get_embeddings()
+        self._map(fn, list(self.shards.values()))
+        versions = ",".join(f"{bid}:{s.index_version}" for bid, s in sorted(self.shards.items()))
+        self.index_version = hashlib.md5(versions.encode("utf-8")).hexdigest()
+        self.query_cache.invalidate(self.index_version)
+        print(f"📚 {len(self.shards)} book shard(s) ready.")
+
+    def __len__(self) -> int:
+        return sum(len(s) for s in self.load().shards.values())
+
+    @property
+    def index_fingerprint(self) -> str:
+        prints = ",".join(f"{bid}:{s.index_fingerprint}" for bid, s in sorted(self.load().shards.items()))
+        return hashlib.md5(prints.encode("utf-8")).hexdigest()
+
+    def stores(self) -> list:
+        return [s.load()._vs for s in self.shards.values()]
+
+    def _shards_for(self, filters: Optional[SearchFilter]) -> List[Retriever]:
+        """Shards that can match `filters`: a book filter prunes whole books."""
+        shards = list(self.shards.values())
+        if filters is None or not filters.books:
+            return shards
+
+        def matches(shard: Retriever) -> bool:
+            names = (shard.book.id, shard.book.title, os.path.basename(shard.pdf_path))
+            return any(b in name.lower() for b in filters.books for name in names)
+
+        return [s for s in shards if matches(s)]
+
+    @staticmethod
+    def _shard_filter(filters: Optional[SearchFilter]) -> Optional[SearchFilter]:
+        """The part of `filters` left for each shard once books were pruned."""
+        if filters is None or not filters.books:
+            return filters
+        rest = copy.copy(filters)
+        rest.books = []
+        return None if rest.empty else rest
+
+    @staticmethod
+    def _merge(hit_lists: Sequence[Sequence[Hit]], k: int, reverse: bool) -> List[Tuple[tuple, Document]]:
+        """Global ranking of per-shard hits; keys are (shard position, passage text)."""
+        merged = [
+            (score, (pos, doc.page_content), doc)
+            for pos, hits in enumerate(hit_lists) for doc, score in hits
+        ]
+        merged.sort(key=lambda t: -t[0] if reverse else t[0])
+        return [(key, doc) for _, key, doc in merged[:k]]
+
+    def _rank(self, query: str, hit_lists: Sequence[Sequence[Hit]], shards: List[Retriever],
+              k: int, mode: str, filters: Optional[SearchFilter]) -> List[Document]:
+        depth = max(k, HYBRID_CANDIDATES) if mode == "hybrid" else k
+        vector = self._merge(hit_lists, depth, reverse=False)
+        if mode != "hybrid":
+            return [doc for _, doc in vector[:k]]
+        # BM25 idf is per shard, so only the rank order is trusted across books
+        lexical = self._merge(
+            self._map(lambda s: s.lexical_hits(query, depth, filters), shards), depth, reverse=True
+        )
+        docs = dict(vector)
+        docs.update(lexical)
+        fused = reciprocal_rank_fusion([[key for key, _ in vector], [key for key, _ in lexical]], k=RRF_K)
+        return [docs[key] for key in fused[:k]]
+
+    def search(self, query: str, k: int = 5, mode: str = SEARCH_MODE,
+               filters: Optional[SearchFilter] = None) -> List[Document]:
+        if mode not in ("vector", "hybrid"):
+            raise ValueError(f"Unknown search mode {mode!r}")
+        if filters is not None and filters.empty:
+            filters = None
+        self.load()
+        with span("retrieval.search", k=k, mode=mode, filtered=filters is not None) as trace:
+            cache_key = (k, mode, filters.key() if filters else None)
+            cached = self.query_cache.get(query, cache_key)
+            if cached is None:
+                with span("retrieval.embed_query"):
+                    query_emb = self._emb.embed_query(query)
+                cached = self.query_cache.get_similar(cache_key, query_emb)
+            if cached is not None:
+                trace.set(cache_hit=True, hits=len(cached))
+                return cached
+
+            shards = self._shards_for(filters)
+            shard_filters = self._shard_filter(filters)
+            depth = max(k, HYBRID_CANDIDATES) if mode == "hybrid" else k
+            with span("retrieval.index_search", k=k, mode=mode, shards=len(shards)):
+                hit_lists = self._map(lambda s: s.vector_hits(query_emb, depth, shard_filters), shards)
+                results = self._rank(query, hit_lists, shards, k, mode, shard_filters)
+            trace.set(cache_hit=False, hits=len(results))
+            self.query_cache.put(query, cache_key, query_emb, results)
+            return results
+
+    def search_batch(self, queries: Sequence[str], k: int = 5, mode: str = SEARCH_MODE,
+                     filters: Optional[SearchFilter] = None) -> List[List[Document]]:
+        """Searches in one encoder call and one batched search per (matching) shard."""
+        if mode not in ("vector", "hybrid"):
+            raise ValueError(f"Unknown search mode {mode!r}")
+        if filters is not None and filters.empty:
+            filters = None
+        self.load()
+        cache_key = (k, mode, filters.key() if filters else None)
+        out: List[Optional[List[Document]]] = [self.query_cache.get(q, cache_key) for q in queries]
+        todo = [i for i, r in enumerate(out) if r is None]
+        if not todo:
+            return out
+
+        pending = []
+        for i, emb in zip(todo, self._emb.embed_documents([queries[i] for i in todo])):
+            out[i] = self.query_cache.get_similar(cache_key, emb)
+            if out[i] is None:
+                pending.append((i, emb))
+        if not pending:
+            return out
+
+        shards = self._shards_for(filters)
+        shard_filters = self._shard_filter(filters)
+        depth = max(k, HYBRID_CANDIDATES) if mode == "hybrid" else k
+        embs = [emb for _, emb in pending]
+        per_shard = self._map(lambda s: s.vector_hits_batch(embs, depth, shard_filters), shards)
+        for j, (i, emb) in enumerate(pending):
+            out[i] = self._rank(queries[i], [hits[j] for hits in per_shard], shards, k, mode, shard_filters)
+            self.query_cache.put(queries[i], cache_key, emb, out[i])
+        return out
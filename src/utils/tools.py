@@ -1,108 +1,126 @@
 # src/tools/pdf_vector_search_tool.py
 
-from typing import Any, Union, List
+from typing import Any, Union, List, Optional
 from pydantic import PrivateAttr
 # ← use LangChain’s BaseTool instead of crewai_tools.BaseTool
 from crewai.tools import BaseTool
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from src.utils.pdf_processor import PDFProcessor
+from src.config import SEARCH_MODE, RERANK_ENABLED, QUERY_EXPANSION
+from src.utils.search_filters import SearchFilter
+from src.utils.reranker import search_reranked, asearch_reranked
+from src.utils.tracing import span
+from src.utils.context_compressor import format_passages
+from src.utils.query_expansion import expand_query
+from src.utils.retriever import Retriever, get_retriever, run_in_search_pool, INDEX_FOLDER, PDF_HASH_FILE
 import os
-import hashlib
-import pickle
-
-INDEX_FOLDER = "./faiss_index"
-PDF_HASH_FILE = os.path.join(INDEX_FOLDER, "pdf_hash.pkl")
 
 
 class PDFVectorSearchTool(BaseTool):
     name: str = "Harry Potter PDF Vector Search Tool"
     description: str = (
-        "Finds the most semantically relevant passages from the Harry Potter PDF."
+        "Finds the most semantically relevant passages from the Harry Potter PDF. "
+        "Optionally scope the search by book, chapter range (chapter_from/chapter_to) "
+        "or characters that must be mentioned. Pass other phrasings of the query as "
+        "`variants` (separated by |) to search them all in this one call."
     )
+    pdf_path: Optional[str] = None
+    # "vector" or "hybrid" (BM25 + vector fused with reciprocal-rank fusion)
+    search_mode: str = SEARCH_MODE
+    # rerank the top RERANK_CANDIDATES with the cross-encoder (within RERANK_BUDGET_MS)
+    rerank: bool = RERANK_ENABLED
+    # also search alias rewrites of the query (QUERY_ALIASES), batched with it
+    expand: bool = QUERY_EXPANSION
 
-    # these are NOT Pydantic fields—we store them privately
-    _emb: Any = PrivateAttr()
-    _vs: Any = PrivateAttr()
-    _processor: PDFProcessor = PrivateAttr()
+    # not a Pydantic field—the retriever is shared process-wide
+    _retriever: Retriever = PrivateAttr()
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        # initialize our PDFProcessor (make sure it points at the right file)
-        self._processor = PDFProcessor()  
-        
-        # verify PDF exists
-        if not os.path.exists(self._processor.pdf_path):
-            raise FileNotFoundError(
-                f"PDF not found at {self._processor.pdf_path}. "
-                "Please correct PDF_PATH in config."
-            )
-
-        # embedding model
-        self._emb = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-
-        # load or rebuild index
-        if self._index_is_valid():
-            print("✅ Loading existing FAISS index...")
-            self._vs = FAISS.load_local(INDEX_FOLDER, self._emb, allow_dangerous_deserialization=True)
-        else:
-            print("🔄 Building new FAISS index...")
-            self._vs = self._build_index()
-
-    def _index_is_valid(self) -> bool:
-        if not os.path.exists(INDEX_FOLDER) or not os.path.exists(PDF_HASH_FILE):
-            return False
-        current = self._compute_pdf_hash()
-        try:
-            with open(PDF_HASH_FILE, "rb") as f:
-                saved = pickle.load(f)
-            return saved == current
-        except Exception:
-            return False
-
-    def _compute_pdf_hash(self) -> str:
-        h = hashlib.md5()
-        with open(self._processor.pdf_path, "rb") as f:
-            h.update(f.read())
-        return h.hexdigest()
-
-    def _build_index(self) -> FAISS:
-        # extract -> clean -> chunk
-        docs = self._processor.process()
-        if not docs:
-            raise RuntimeError("No documents extracted from PDF—check text extraction!")
-        
-        splitter = RecursiveCharacterTextSplitter(chunk_size=512, chunk_overlap=100)
-        chunks = splitter.split_documents(docs)
-        if not chunks:
-            raise RuntimeError("No chunks created—your splitter settings may be too strict.")
-
-        # build FAISS
-        vs = FAISS.from_documents(chunks, embedding=self._emb)
-        os.makedirs(INDEX_FOLDER, exist_ok=True)
-        vs.save_local(INDEX_FOLDER)
-
-        # save hash
-        pdf_hash = self._compute_pdf_hash()
-        with open(PDF_HASH_FILE, "wb") as f:
-            pickle.dump(pdf_hash, f)
-
-        return vs
-
-    def _run(self, query: Union[str, dict]) -> str:
+        with span("tool.init", tool="pdf_vector_search"):
+            # the registry hands back the same (already loaded) retriever to every tool
+            self._retriever = get_retriever(self.pdf_path)
+
+            # verify PDF exists (a corpus retriever checks each of its books itself)
+            pdf_path = getattr(self._retriever, "pdf_path", None)
+            if pdf_path and not os.path.exists(pdf_path):
+                raise FileNotFoundError(
+                    f"PDF not found at {self._retriever.pdf_path}. "
+                    "Please correct PDF_PATH in config."
+                )
+
+            # load or rebuild index (no-op once warmed up)
+            self._retriever.load()
+
+    @staticmethod
+    def _parse(query, book, chapter_from, chapter_to, characters):
+        filters = SearchFilter(book, chapter_from, chapter_to, characters)
         if isinstance(query, dict):
             # unbox if CrewAI passed a dict
+            if filters.empty:
+                filters = SearchFilter.from_dict(query) or filters
             query = query.get("question") or query.get("query") or str(query)
+        return query, filters
+
+    def _variants(self, query: str, variants) -> list:
+        """Extra phrasings searched alongside `query` (the agent's, then alias rewrites)."""
+        return expand_query(query, variants, aliases=self.expand)[1:]
+
+    def search_settings(self) -> dict:
+        """What shapes this tool's results besides the query (part of the crew's cache key)."""
+        return {"mode": self.search_mode, "rerank": self.rerank, "expand": self.expand}
+
+    def search_docs(self, query: str, filters: Optional[SearchFilter] = None, variants=None) -> List:
+        """The passages _run formats for the agent, as Documents."""
+        queries = self._variants(query, variants)
+        with span("tool.search", mode=self.search_mode, rerank=self.rerank,
+                  filtered=filters is not None and not filters.empty, queries=1 + len(queries)) as s:
+            results = search_reranked(self._retriever, query, k=5, mode=self.search_mode,
+                                      filters=filters, rerank=self.rerank, queries=queries)
+            s.set(hits=len(results))
+        return results
+
+    @staticmethod
+    def _format(results, query: Optional[str] = None) -> str:
+        return format_passages(results, query)
+
+    def _run(
+        self,
+        query: Union[str, dict],
+        book: Optional[str] = None,
+        chapter_from: Optional[str] = None,
+        chapter_to: Optional[str] = None,
+        characters: Optional[str] = None,
+        variants: Optional[str] = None,
+    ) -> str:
+        """
+        Optional filters narrow the search before it runs: `book` (title or file
+        name fragment), an inclusive chapter range, and comma-separated
+        `characters` that must be mentioned in the passage. `variants` are other
+        phrasings of the query, separated by "|"; they are searched together with
+        it (one embedding batch, one index search) and the results fused.
+        """
+        query, filters = self._parse(query, book, chapter_from, chapter_to, characters)
+        return self._format(self.search_docs(query, filters, variants), query)
+
+    async def _arun(
+        self,
+        query: Union[str, dict],
+        book: Optional[str] = None,
+        chapter_from: Optional[str] = None,
+        chapter_to: Optional[str] = None,
+        characters: Optional[str] = None,
+        variants: Optional[str] = None,
+    ) -> str:
+        # embedding + search run on the retriever's pool; the event loop stays free
+        query, filters = self._parse(query, book, chapter_from, chapter_to, characters)
+        queries = self._variants(query, variants)
+        with span("tool.search", mode=self.search_mode, rerank=self.rerank,
+                  filtered=not filters.empty, queries=1 + len(queries), is_async=True) as s:
+            results = await asearch_reranked(self._retriever, query, k=5, mode=self.search_mode,
+                                             filters=filters, rerank=self.rerank, queries=queries)
+            s.set(hits=len(results))
+        # compression embeds sentences: keep that off the event loop too
+        return await run_in_search_pool(self._format, results, query)
 
-        results = self._vs.similarity_search(query, k=5)
-        if not results:
-            return "No relevant passages found."
-        return "\n---\n".join(doc.page_content for doc in results)
-
-    async def _arun(self, query: Union[str, dict]) -> str:
-        return self._run(query)
-   
 # tool = PDFVectorSearchTool()
 # answer = tool.run("How does Harry first meet Hagrid?")
-# print(answer)
\ No newline at end of file
+# print(answer)
@@ -0,0 +1,203 @@
+import os
+import json
+import time
+import threading
+import contextvars
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from src.config import TRACE_ENABLED, TRACE_PATH, TRACE_SAMPLES
+
+
+class Span:
+    """One timed operation; attributes are free-form numbers/strings/booleans."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attrs", "start", "ms", "error", "_t0", "_token")
+
+    def __init__(self, name: str, parent: Optional["Span"], attrs: Dict[str, Any]):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.trace_id = parent.trace_id if parent is not None else os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attrs = attrs
+        self.start = time.time()
+        self.ms: Optional[float] = None
+        self.error: Optional[str] = None
+        self._t0 = time.perf_counter()
+        self._token = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def add(self, key: str, n: float = 1):
+        self.attrs[key] = self.attrs.get(key, 0) + n
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace": self.trace_id, "span": self.span_id, "parent": self.parent_id,
+            "name": self.name, "start": round(self.start, 6), "ms": self.ms,
+            "error": self.error, "attrs": self.attrs,
+        }
+
+
+class _NoopSpan:
+    """What span() hands out while tracing is off: every call is a no-op."""
+
+    def set(self, **attrs):
+        pass
+
+    def add(self, key: str, n: float = 1):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+_current: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar("hp_span", default=None)
+
+
+class _ActiveSpan:
+    def __init__(self, tracer: "Tracer", name: str, attrs: Dict[str, Any]):
+        self.tracer = tracer
+        self.span = Span(name, _current.get(), attrs)
+
+    def __enter__(self) -> Span:
+        self.span._token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        span = self.span
+        span.ms = round((time.perf_counter() - span._t0) * 1000, 3)
+        if exc_type is not None and not issubclass(exc_type, GeneratorExit):
+            span.error = f"{exc_type.__name__}: {exc}"
+        try:
+            _current.reset(span._token)
+        except ValueError:
+            # a generator finished in another context than it started in
+            pass
+        self.tracer.finish(span)
+        return False
+
+
+class Tracer:
+    """
+    Span tracer: finished spans are appended to a JSONL file (one object per
+    line, linked by trace/parent ids) and folded into per-name metrics
+    (count, errors, latency percentiles over the last TRACE_SAMPLES spans,
+    sums of numeric attributes such as tokens, hits and cache hits).
+    Parents are tracked with contextvars, so asyncio tasks nest correctly.
+    """
+
+    def __init__(self, path: Optional[str] = TRACE_PATH, enabled: bool = TRACE_ENABLED,
+                 samples: int = TRACE_SAMPLES):
+        self.enabled = enabled
+        self.path = path
+        self.samples = samples
+        self._file = None
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Dict[str, Any]] = {}
+
+    def configure(self, enabled: bool = True, path: Optional[str] = TRACE_PATH):
+        with self._lock:
+            if path != self.path:
+                self._close()
+                self.path = path
+            self.enabled = enabled
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def span(self, name: str, **attrs):
+        if not self.enabled:
+            return NOOP_SPAN
+        return _ActiveSpan(self, name, attrs)
+
+    def record(self, name: str, ms: float, **attrs):
+        """A span that was timed elsewhere (e.g. from a framework callback)."""
+        if not self.enabled:
+            return
+        span = Span(name, _current.get(), attrs)
+        span.ms = round(ms, 3)
+        span.start -= ms / 1000
+        self.finish(span)
+
+    def finish(self, span: Span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            self._fold(span)
+            if not self.path:
+                return
+            if self._file is None:
+                if os.path.dirname(self.path):
+                    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def _fold(self, span: Span):
+        m = self._metrics.get(span.name)
+        if m is None:
+            m = self._metrics[span.name] = {
+                "count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0,
+                "recent": deque(maxlen=self.samples), "sums": {},
+            }
+        m["count"] += 1
+        m["errors"] += span.error is not None
+        m["total_ms"] += span.ms
+        m["max_ms"] = max(m["max_ms"], span.ms)
+        m["recent"].append(span.ms)
+        for key, value in span.attrs.items():
+            if isinstance(value, (int, float)):
+                m["sums"][key] = m["sums"].get(key, 0) + value
+
+    @staticmethod
+    def _percentile(values: Deque[float], q: float) -> float:
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Per span name: count, errors, mean/p50/p95/max ms and attribute sums."""
+        with self._lock:
+            return {
+                name: {
+                    "count": m["count"],
+                    "errors": m["errors"],
+                    "mean_ms": round(m["total_ms"] / m["count"], 3),
+                    "p50_ms": self._percentile(m["recent"], 0.5),
+                    "p95_ms": self._percentile(m["recent"], 0.95),
+                    "max_ms": m["max_ms"],
+                    **{k: round(v, 3) for k, v in m["sums"].items()},
+                }
+                for name, m in sorted(self._metrics.items())
+            }
+
+    def reset(self):
+        with self._lock:
+            self._metrics.clear()
+
+
+tracer = Tracer()
+
+
+def span(name: str, **attrs):
+    """`with span("stage", key=value) as s:` ... `s.set(hits=3)`; a shared no-op when tracing is off."""
+    if not tracer.enabled:
+        return NOOP_SPAN
+    return _ActiveSpan(tracer, name, attrs)
+
+
+def current_span():
+    """The innermost open span of this thread/task (the no-op span if none)."""
+    return (_current.get() if tracer.enabled else None) or NOOP_SPAN
+
+
+def enable_tracing(path: Optional[str] = TRACE_PATH):
+    """Turn tracing on at runtime, writing spans to `path` (None: metrics only)."""
+    tracer.configure(True, path)
+
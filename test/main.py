@@ -1,12 +1,15 @@
 # main.py
 
 from agents.harry_potter_crew import HarryPotterRAGCrew
+from src.utils.retriever import warm_up
 import traceback
 
 def interactive_mode():
     print("🪄 Welcome to the Harry Potter RAG Assistant!")
     print("Type 'exit' to leave the wizarding world.\n")
 
+    # load the embedding model + index before the first question
+    warm_up()
     crew_instance = HarryPotterRAGCrew()
 
     while True:
@@ -19,17 +22,10 @@ def interactive_mode():
 
             character = input("🧙‍♂️ Which character should answer? (e.g., Harry, Hermione, Dumbledore): ")
 
-            # Set inputs
-            inputs = {
-                "question": question,
-                "character": character,
-            }
-
-            # Build the crew
-            crew = crew_instance.crew()
+            mode = input("⚡ Mode? (auto / fast / crew) [auto]: ").strip().lower() or "auto"
 
             print("\n🚀 Kicking off the Harry Potter Crew...")
-            final_output = crew.kickoff(inputs=inputs)
+            final_output = crew_instance.answer(question, character, mode=mode)
 
             print("\n🎤 In-character Response:\n")
             print(final_output)
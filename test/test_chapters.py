@@ -0,0 +1,44 @@
+# python -m pytest test/test_chapters.py   (needs pdfplumber and data/harry_potter.pdf)
+
+from pathlib import Path
+
+import pytest
+
+from src.utils.search_filters import SearchFilter, chapter_number
+
+PDF = Path(__file__).parents[1] / "data" / "harry_potter.pdf"
+
+
+@pytest.mark.parametrize("label, number", [
+    ("12", 12), ("XII", 12), ("ONE", 1), ("Seventeen", 17), ("TWENTY-ONE", 21), ("Tale", None),
+])
+def test_chapter_number(label, number):
+    assert chapter_number(label) == number
+
+
+def test_chapter_filter_accepts_words():
+    flt = SearchFilter(chapter_from="two", chapter_to="FIVE")
+    assert (flt.chapter_from, flt.chapter_to) == (2, 5)
+
+
+@pytest.mark.skipif(not PDF.exists(), reason="data/harry_potter.pdf not present")
+def test_pdf_chapters_are_detected():
+    pytest.importorskip("pdfplumber")
+    from src.utils.pdf_processor import PDFProcessor
+
+    processor = PDFProcessor(str(PDF))
+    chapters = list(processor.iter_chapters(processor.extract_pages()))
+    assert len(chapters) > 1
+    assert chapters[0]["chapter_num"] == "ONE"
+    assert chapters[0]["title"] == "THE BOY WHO LIVED"
+    assert [chapter_number(c["chapter_num"]) for c in chapters] == list(range(1, len(chapters) + 1))
+
+
+@pytest.mark.skipif(not PDF.exists(), reason="data/harry_potter.pdf not present")
+def test_unnumbered_headings_count_in_order():
+    from src.utils.pdf_processor import PDFProcessor
+
+    processor = PDFProcessor(str(PDF), chapter_pattern=r"^()()(The (?:Hopping Pot|Three Brothers))$")
+    pages = ["Intro\nThe Hopping Pot\nonce", "upon a time\nThe Three Brothers\nthere were"]
+    chapters = list(processor.iter_chapters(pages))
+    assert [(c["chapter_num"], c["title"]) for c in chapters] == [("1", "The Hopping Pot"), ("2", "The Three Brothers")]
@@ -0,0 +1,15 @@
+# python -m pytest test/test_corpus.py   (needs pyyaml)
+
+from pathlib import Path
+
+import pytest
+
+CORPUS = Path(__file__).parents[1] / "data" / "corpus.yaml"
+
+
+def test_corpus_lists_only_shipped_books():
+    pytest.importorskip("yaml")
+    from src.utils.corpus import load_corpus
+
+    books = load_corpus(str(CORPUS), skip_missing=False)
+    assert [b.id for b in books] == ["philosophers-stone"]
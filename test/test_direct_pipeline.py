@@ -0,0 +1,37 @@
+# python -m pytest test/test_direct_pipeline.py   (no index, LLM or API key)
+
+import src.agents.direct_pipeline as direct
+import src.utils.persona_profiles as persona_profiles
+
+HAGRID = "Persona of Rubeus Hagrid: says yeh and ter."
+
+
+class Doc:
+    def __init__(self, text):
+        self.page_content = text
+        self.metadata = {}
+
+
+class FakePersonas:
+    def persona(self, character):
+        return HAGRID if character == "Rubeus Hagrid" else None
+
+
+def test_prompt_carries_the_persona(monkeypatch):
+    monkeypatch.setattr(direct, "PERSONA_PROFILES", True)
+    monkeypatch.setattr(persona_profiles, "get_persona_profiles", lambda pdf_path=None: FakePersonas())
+    docs = [Doc("Hagrid knocked on the door.")]
+
+    prompt, parts = direct.prepare("Who are you?", "Rubeus Hagrid", docs)
+    assert HAGRID in prompt
+    assert parts["persona"] == direct.hash_text(HAGRID)
+
+    prompt, parts = direct.prepare("Who are you?", "Luna Lovegood", docs)
+    assert "Persona of" not in prompt and "persona" not in parts
+
+
+def test_no_persona_when_profiles_are_off(monkeypatch):
+    monkeypatch.setattr(direct, "PERSONA_PROFILES", False)
+    monkeypatch.setattr(persona_profiles, "get_persona_profiles", lambda pdf_path=None: FakePersonas())
+    prompt, parts = direct.prepare("Who are you?", "Rubeus Hagrid", [])
+    assert HAGRID not in prompt and "persona" not in parts
@@ -0,0 +1,115 @@
+# python -m pytest test/test_http_client.py   (no network; fake callables only)
+
+import asyncio
+import threading
+
+import pytest
+
+import src.utils.http_client as http_client
+from src.utils.http_client import RetryPolicy, _aacquire_slot, acall_with_retries, call_with_retries
+
+
+class ServerError(Exception):
+    status = 503
+
+
+class BadRequest(Exception):
+    status = 400
+
+
+def flaky(fails, error=ServerError):
+    """A callable that raises `error` `fails` times, then returns "ok"; counts its calls."""
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) <= fails:
+            raise error("boom")
+        return "ok"
+
+    fn.calls = calls
+    return fn
+
+
+def no_wait(monkeypatch):
+    monkeypatch.setattr(http_client.time, "sleep", lambda s: None)
+    return RetryPolicy(max_retries=2, base_s=0, max_s=0)
+
+
+def test_retries_retryable_errors(monkeypatch):
+    fn = flaky(2)
+    assert call_with_retries(fn, no_wait(monkeypatch)) == "ok"
+    assert len(fn.calls) == 3
+
+
+def test_gives_up_after_max_retries(monkeypatch):
+    fn = flaky(5)
+    with pytest.raises(ServerError):
+        call_with_retries(fn, no_wait(monkeypatch))
+    assert len(fn.calls) == 3
+
+
+def test_non_retryable_error_is_raised_at_once(monkeypatch):
+    fn = flaky(1, BadRequest)
+    with pytest.raises(BadRequest):
+        call_with_retries(fn, no_wait(monkeypatch))
+    assert len(fn.calls) == 1
+
+
+def test_slot_is_released_after_failures(monkeypatch):
+    slots = threading.BoundedSemaphore(1)
+    with pytest.raises(BadRequest):
+        call_with_retries(flaky(1, BadRequest), no_wait(monkeypatch), slots=slots)
+    assert slots.acquire(blocking=False)
+
+
+def test_async_retries_and_non_retryable():
+    policy = RetryPolicy(max_retries=2, base_s=0, max_s=0)
+
+    async def run(fn):
+        async def call():
+            return fn()
+        return await acall_with_retries(call, policy)
+
+    fn = flaky(2)
+    assert asyncio.run(run(fn)) == "ok"
+    assert len(fn.calls) == 3
+
+    fn = flaky(1, BadRequest)
+    with pytest.raises(BadRequest):
+        asyncio.run(run(fn))
+    assert len(fn.calls) == 1
+
+
+def test_async_calls_share_thread_slots():
+    slots = threading.BoundedSemaphore(2)
+    running, peak = [0], [0]
+
+    async def call():
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        await asyncio.sleep(0.01)
+        running[0] -= 1
+        return "ok"
+
+    async def main():
+        return await asyncio.gather(*[acall_with_retries(call, slots=slots) for _ in range(6)])
+
+    assert asyncio.run(main()) == ["ok"] * 6
+    assert peak[0] == 2
+    # every slot came back
+    assert slots.acquire(blocking=False) and slots.acquire(blocking=False)
+
+
+def test_async_slot_waits_for_a_thread_holder():
+    slots = threading.BoundedSemaphore(1)
+    slots.acquire()
+    timer = threading.Timer(0.05, slots.release)
+
+    async def main():
+        timer.start()
+        await asyncio.wait_for(_aacquire_slot(slots), timeout=2)
+
+    asyncio.run(main())
+    assert not slots.acquire(blocking=False)
+    slots.release()
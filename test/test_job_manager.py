@@ -0,0 +1,67 @@
+# python -m pytest test/test_job_manager.py
+
+import threading
+import time
+
+import pytest
+
+from src.utils.job_manager import DONE, ERROR, RUNNING, Job, JobManager, JobQueueFull
+
+
+def test_wait_for_change_wakes_on_append():
+    job = Job()
+    version = job.snapshot()["version"]
+    threading.Timer(0.05, job.append, ("Hello",)).start()
+    start = time.monotonic()
+    assert job.wait_for_change(version, timeout=2) == version + 1
+    assert time.monotonic() - start < 1
+    assert job.snapshot()["text"] == "Hello"
+
+
+def test_wait_for_change_times_out_without_a_change():
+    job = Job()
+    version = job.snapshot()["version"]
+    assert job.wait_for_change(version, timeout=0.05) == version
+
+
+def test_wait_for_change_returns_at_once_if_already_moved():
+    job = Job()
+    job.set_status("Thinking...")
+    assert job.wait_for_change(0, timeout=0) == 1
+
+
+def test_jobs_finish_or_fail():
+    manager = JobManager(max_workers=1, max_queued=4)
+
+    def answer(job, text):
+        job.append(text)
+        return text.upper()
+
+    def broken(job):
+        raise ValueError("no owls")
+
+    ok, bad = manager.submit(answer, "yes"), manager.submit(broken)
+    for job in (ok, bad):
+        while not job.done:
+            job.wait_for_change(job.version, timeout=1)
+    assert (ok.status, ok.result, ok.text) == (DONE, "YES", "yes")
+    assert bad.status == ERROR and isinstance(bad.error, ValueError)
+    assert manager.get(ok.id) is ok
+    manager.shutdown(wait=True)
+
+
+def test_full_queue_is_rejected():
+    manager = JobManager(max_workers=1, max_queued=1)
+    release = threading.Event()
+
+    def blocked(job):
+        release.wait(2)
+
+    running = manager.submit(blocked)
+    while running.status != RUNNING:
+        running.wait_for_change(running.version, timeout=1)
+    manager.submit(blocked)  # waits for the only worker
+    with pytest.raises(JobQueueFull):
+        manager.submit(blocked)
+    release.set()
+    manager.shutdown(wait=True)
@@ -0,0 +1,53 @@
+# python -m pytest test/test_persona_crew.py   (needs crewai; no index or API key)
+
+import pytest
+
+pytest.importorskip("crewai")
+
+import src.agents.harry_potter_crew as hp_crew
+import src.utils.tools as tools
+
+
+class FakeRetriever:
+    pdf_path = None
+
+    def load(self):
+        return self
+
+
+class FakePersonas:
+    """Hagrid has a usable profile, Luna does not."""
+
+    def persona(self, character):
+        return "Persona of Rubeus Hagrid: says yeh and ter." if character == "Rubeus Hagrid" else None
+
+
+@pytest.fixture
+def crew_instance(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    monkeypatch.setattr(tools, "get_retriever", lambda pdf_path=None: FakeRetriever())
+    monkeypatch.setattr(hp_crew, "get_persona_profiles", lambda pdf_path=None: FakePersonas())
+    return hp_crew.HarryPotterRAGCrew()
+
+
+def shape(crew):
+    return [task.description.split()[0:4] for task in crew.tasks]
+
+
+@pytest.mark.parametrize("order", [
+    ("Rubeus Hagrid", "Luna Lovegood"),
+    ("Luna Lovegood", "Rubeus Hagrid"),
+])
+def test_crew_shape_follows_each_character(crew_instance, order):
+    # one long-lived instance, as the app and server keep: the first question must not fix the shape
+    for _ in range(2):
+        for character in order:
+            crew, inputs = crew_instance._crew_for("Who is Fluffy?", character)
+            if character == "Rubeus Hagrid":
+                assert len(crew.tasks) == 2, shape(crew)
+                assert "{persona}" in crew.tasks[-1].description
+                assert inputs["persona"].startswith("Persona of Rubeus Hagrid")
+            else:
+                assert len(crew.tasks) == 3, shape(crew)
+                assert crew.tasks[1].agent.role == "Character Analysis Agent"
+                assert inputs["persona"] == ""
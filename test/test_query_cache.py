@@ -0,0 +1,59 @@
+# python -m pytest test/test_query_cache.py   (no index or embedding model)
+
+import pytest
+
+import src.utils.retriever as retriever_module
+from src.utils.query_cache import QueryCache
+from src.utils.retriever import Retriever
+
+
+def test_same_index_version_keeps_entries():
+    cache = QueryCache()
+    cache.invalidate("v1")
+    cache.put("Who is Hagrid?", 5, [1.0, 0.0], ["doc"])
+    cache.invalidate("v1")
+    assert cache.get("who is  hagrid?", 5) == ["doc"]
+
+
+@pytest.mark.parametrize("version", ["v2", None])
+def test_new_index_version_drops_entries(version):
+    cache = QueryCache()
+    cache.invalidate("v1")
+    cache.put("Who is Hagrid?", 5, [1.0, 0.0], ["doc"])
+    cache.invalidate(version)
+    assert cache.get("Who is Hagrid?", 5) is None
+    assert cache.index_version == version
+
+
+class FakeStore:
+    def __len__(self):
+        return 1
+
+
+@pytest.fixture
+def retriever(tmp_path, monkeypatch):
+    pdf = tmp_path / "book.pdf"
+    pdf.write_bytes(b"%PDF")
+    versions = iter(["v1", "v1", "v2"])
+    monkeypatch.setattr(retriever_module, "get_embeddings", lambda *a, **k: None)
+    monkeypatch.setattr(retriever_module, "INDEX_TYPE", "flat")
+    r = Retriever(str(pdf), str(tmp_path / "index"))
+    monkeypatch.setattr(r, "_index_is_valid", lambda: True)
+    monkeypatch.setattr(r, "_load_existing", FakeStore)
+    monkeypatch.setattr(r, "_compute_pdf_hash", lambda: next(versions))
+    return r.load()
+
+
+def test_reload_of_the_same_index_keeps_cached_results(retriever):
+    retriever.query_cache.put("wand", 5, [1.0], ["doc"])
+    retriever.reload()
+    assert retriever.index_version == "v1"
+    assert retriever.query_cache.get("wand", 5) == ["doc"]
+
+
+def test_reload_of_a_new_index_drops_cached_results(retriever):
+    retriever.query_cache.put("wand", 5, [1.0], ["doc"])
+    retriever.reload()
+    retriever.reload()
+    assert retriever.index_version == "v2"
+    assert retriever.query_cache.get("wand", 5) is None
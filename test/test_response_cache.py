@@ -0,0 +1,86 @@
+# python -m pytest test/test_response_cache.py   (SQLite in a temp folder; no LLM)
+
+import asyncio
+import time
+
+import pytest
+
+from src.utils.response_cache import ResponseCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(str(tmp_path / "responses.sqlite"), ttl=60, stale_ttl=60)
+
+
+def age(cache, key, seconds):
+    """Pretend `key` was stored `seconds` ago."""
+    with cache._conn:
+        cache._conn.execute("UPDATE responses SET created = ? WHERE key = ?", (time.time() - seconds, key))
+
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_fresh_entry_is_served(cache):
+    cache.put("k", "v1")
+    assert cache.get_or_compute("k", lambda: "v2") == "v1"
+    assert (cache.hits, cache.misses) == (1, 0)
+
+
+def test_expired_entry_is_missing_for_get(cache):
+    cache.put("k", "v1")
+    age(cache, "k", 90)
+    assert cache.get("k") is None
+
+
+def test_stale_entry_is_served_then_refreshed(cache):
+    cache.put("k", "v1")
+    age(cache, "k", 90)
+    assert cache.get_or_compute("k", lambda: "v2") == "v1"
+    assert cache.stale_hits == 1
+    assert wait_for(lambda: cache.get("k") == "v2")
+
+
+def test_entry_past_the_stale_window_is_recomputed(cache):
+    cache.put("k", "v1")
+    age(cache, "k", 200)
+    assert cache.get_or_compute("k", lambda: "v2") == "v2"
+    assert cache.misses == 1
+    assert cache.get("k") == "v2"
+
+
+def test_async_stale_refresh(cache):
+    cache.put("k", "v1")
+    age(cache, "k", 90)
+    calls = []
+
+    async def main():
+        release = asyncio.Event()
+
+        async def compute():
+            calls.append(1)
+            await release.wait()
+            return "v2"
+
+        first = await cache.aget_or_compute("k", compute)
+        # a second stale hit while the refresh runs does not start another one
+        second = await cache.aget_or_compute("k", compute)
+        release.set()
+        await asyncio.gather(*cache._tasks)
+        return first, second, await cache.aget("k")
+
+    assert asyncio.run(main()) == ("v1", "v1", "v2")
+    assert len(calls) == 1
+
+
+def test_async_miss_computes_and_stores(cache):
+    async def compute():
+        return "v1"
+
+    assert asyncio.run(cache.aget_or_compute("k", compute)) == "v1"
+    assert cache.get("k") == "v1"